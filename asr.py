@@ -0,0 +1,177 @@
+import json
+import os
+import speech_recognition as sr
+
+"""
+File with the Automatic Speech Recognition (ASR) engines the listener can use
+"""
+
+
+class ASRBackend:
+    """
+    A class that represents an ASR engine, turning recorded audio into text.
+    Engines raise sr.UnknownValueError if the speech is unintelligible and
+    sr.RequestError if the engine is unreachable or misconfigured
+    """
+    streaming = False  # whether the engine recognizes speech while it is being recorded
+
+    def recognize(self, recognizer, audio, source=None):
+        """
+        Recognizes the speech in the given audio
+        :param recognizer: speech_recognition recognizer
+        :param audio: recorded audio (sr.AudioData)
+        :param source: path of the file the audio was read from (None if recorded live)
+        :return: transcribed text
+        """
+        raise NotImplementedError
+
+    def stream(self, recognizer, chunks, sample_rate, sample_width, source=None):
+        """
+        Recognizes the speech in the given audio chunks, as they are recorded.
+        Engines which cannot stream recognize the whole audio at once
+        :param recognizer: speech_recognition recognizer
+        :param chunks: iterable of raw audio chunks
+        :param sample_rate: sample rate of the audio
+        :param sample_width: sample width of the audio, in bytes
+        :param source: path of the file the audio is read from (None if recorded live)
+        :return: generator of tuples (text, final): partial transcriptions
+        of the phrase (final False), then its transcription (final True)
+        """
+        audio = sr.AudioData(b"".join(chunks), sample_rate, sample_width)
+        yield self.recognize(recognizer, audio, source), True
+
+
+class GoogleBackend(ASRBackend):
+    """
+    Google's online ASR API (needs network)
+    """
+    def recognize(self, recognizer, audio, source=None):
+        return recognizer.recognize_google(audio)
+
+
+class SphinxBackend(ASRBackend):
+    """
+    CMU PocketSphinx offline engine (needs the pocketsphinx package)
+    """
+    def recognize(self, recognizer, audio, source=None):
+        return recognizer.recognize_sphinx(audio)
+
+
+class VoskBackend(ASRBackend):
+    """
+    Vosk offline engine (needs the vosk package and a model)
+
+    Attributes
+    ----------
+    _model:
+        vosk model, loaded once
+    """
+    sample_rate = 16000  # sample rate the audio is converted to before recognition
+    streaming = True
+
+    def __init__(self, model_path="model"):
+        """
+        Constructor, loads the model
+        :param model_path: path of the vosk model directory
+        """
+        try:
+            import vosk
+        except ImportError as err:
+            raise sr.RequestError(f"missing vosk module: {err}")
+
+        if not os.path.isdir(model_path):
+            raise sr.RequestError(f"missing vosk model at {model_path}")
+
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self._model = vosk.Model(model_path)
+
+    def new_recognizer(self, sample_rate=None):
+        """
+        :param sample_rate: sample rate of the audio (VoskBackend.sample_rate if None)
+        :return: a new vosk recognizer
+        """
+        return self._vosk.KaldiRecognizer(self._model, sample_rate or self.sample_rate)
+
+    def recognize(self, recognizer, audio, source=None):
+        vosk_recognizer = self.new_recognizer()
+        vosk_recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=self.sample_rate, convert_width=2))
+        text = json.loads(vosk_recognizer.FinalResult()).get("text", "")
+        if len(text.strip()) == 0:
+            raise sr.UnknownValueError()
+        return text
+
+    def stream(self, recognizer, chunks, sample_rate, sample_width, source=None):
+        vosk_recognizer = self.new_recognizer(sample_rate)
+        partial = ""
+        for chunk in chunks:
+            if sample_width != 2:
+                chunk = sr.AudioData(chunk, sample_rate, sample_width).get_raw_data(convert_width=2)
+
+            if vosk_recognizer.AcceptWaveform(chunk):
+                # end of the phrase detected (ignoring silence before the user speaks)
+                text = json.loads(vosk_recognizer.Result()).get("text", "")
+                if len(text.strip()) > 0:
+                    yield text, True
+                    return
+            else:
+                new_partial = json.loads(vosk_recognizer.PartialResult()).get("partial", "")
+                if len(new_partial.strip()) > 0 and new_partial != partial:
+                    partial = new_partial
+                    yield partial, False
+
+        # audio over before the end of the phrase
+        text = json.loads(vosk_recognizer.FinalResult()).get("text", "")
+        if len(text.strip()) == 0:
+            raise sr.UnknownValueError()
+        yield text, True
+
+
+class TranscriptBackend(ASRBackend):
+    """
+    Stand-in engine for replayed recordings, reading the transcript stored
+    next to each recording (e.g. order.txt for order.wav)
+    """
+    def recognize(self, recognizer, audio, source=None):
+        if source is None:
+            raise sr.RequestError("transcripts are only available for replayed recordings")
+
+        path = f"{os.path.splitext(source)[0]}.txt"
+        if not os.path.exists(path):
+            raise sr.UnknownValueError()
+
+        with open(path) as file:
+            return file.read()
+
+    def stream(self, recognizer, chunks, sample_rate, sample_width, source=None):
+        # partial transcriptions grow by one word for each chunk of audio
+        words = self.recognize(recognizer, None, source).split()
+        chunks = iter(chunks)
+        for i in range(1, len(words)):
+            if next(chunks, None) is None:
+                break
+            yield " ".join(words[:i]), False
+
+        yield " ".join(words), True
+
+
+# ASR engines by name
+backends = {
+    "google": GoogleBackend,
+    "sphinx": SphinxBackend,
+    "vosk": VoskBackend,
+    "transcript": TranscriptBackend
+}
+
+
+def build_backend(name, model_path=None):
+    """
+    Builds the ASR engine with the given name
+    :param name: name of the engine (see backends)
+    :param model_path: path of the model, for engines that need one
+    :return: the ASR engine
+    """
+    if name == "vosk" and model_path is not None:
+        return VoskBackend(model_path)
+
+    return backends[name]()
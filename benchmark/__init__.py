@@ -0,0 +1,55 @@
+import statistics
+
+"""
+Package with the benchmarks of the bot, run as modules from the root of the repository
+(e.g. python -m benchmark.pipeline --help)
+"""
+
+
+# commands typical of the dialogues with the bot
+sample_commands = [
+    "i am ready to order",
+    "i would like a pizza",
+    "i would like a beer",
+    "i would like french fries",
+    "i would like fish and chips",
+    "what is on the menu",
+    "what do you have for dessert",
+    "add nachos to the menu",
+    "starter",
+    "yes",
+    "no",
+    "i want the bill"
+]
+
+
+def load_commands(path=None):
+    """
+    Loads the commands to benchmark, one per line
+    :param path: path of the file (the sample commands if None)
+    :return: list of commands
+    """
+    if path is None:
+        return list(sample_commands)
+
+    with open(path) as file:
+        return [line.strip() for line in file if len(line.strip()) > 0]
+
+
+def latency_summary(latencies):
+    """
+    :param latencies: list of latencies, in seconds
+    :return: a dictionary with mean, median, 95th and 99th percentiles and maximum, in milliseconds
+    """
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return 1000 * ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    return {
+        "mean_ms": 1000 * statistics.mean(ordered),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": 1000 * ordered[-1]
+    }
@@ -0,0 +1,302 @@
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+from concurrent.futures import Future
+from contextlib import redirect_stdout
+from texttable import Texttable
+
+from benchmark import latency_summary
+from bot import Bot
+from menu_store import MenuStore
+from nlp import load_pipeline, parse_cache
+from utils import build_dialogue_benchmark_argparser
+
+"""
+Benchmark of the whole bot, driven by scripted conversations without microphone
+nor text to speech: per-stage timings, throughput and peak memory
+"""
+
+
+# scripted conversations, each one a list of commands of the user
+conversations = {
+    "ordering": [
+        "i am ready to order",
+        "i would like a pizza",
+        "yes",
+        "i would like french fries",
+        "no",
+        "i want the bill"
+    ],
+    "menu questions": [
+        "what is on the menu",
+        "what do you have for dessert",
+        "i want the bill"
+    ],
+    "adding entries": [
+        "add nachos to the menu",
+        "starter",
+        "what is on the menu",
+        "i want the bill"
+    ],
+    "nested frames": [
+        "i would like a pizza",
+        "what do you have for dessert",
+        "i would like a beer",
+        "no",
+        "i want the bill"
+    ]
+}
+
+# stages of a turn {stage: methods of the bot timed for the stage}
+stages = {
+    "listen": ["listen"],
+    "parse": ["parse"],
+    "frame": ["_determine_frame"],
+    "slots": ["_fill_order_frame_slots", "_fill_add_info_frame_slots", "_fill_ask_info_frame_slots"],
+    "reply": ["_handle_order_frame", "_handle_add_info_frame", "_handle_ask_info_frame"],
+    "say": ["_say"]
+}
+
+
+class NullSpeaker:
+    """
+    A stand-in for the speaker, saying nothing
+    """
+    def speak(self, sentence):
+        pass
+
+    def speak_async(self, sentence):
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def warm_cache(self, sentences):
+        pass
+
+    def cancel(self):
+        pass
+
+    def wait(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ScriptedListener:
+    """
+    A stand-in for the listener, hearing the commands of a script
+
+    Attributes
+    ----------
+    _commands: iterator
+        commands still to be heard
+    """
+    def __init__(self, commands):
+        """
+        Constructor
+        :param commands: commands of the script
+        """
+        self._commands = iter(commands)
+
+    def listen(self, timeout=None, calibrate=True):
+        """
+        :return: a response object (see Listener docs) with the next command,
+        or a request error once the script is over (as ReplayListener)
+        """
+        command = next(self._commands, None)
+        if command is None:
+            from listener import sr
+            return {"success": False, "error": sr.RequestError("script over"), "sentence": None, "latency": 0.0}
+
+        return {"success": True, "error": None, "sentence": command, "latency": 0.0}
+
+    def listen_stream(self, calibrate=True):
+        response = self.listen()
+        response["partial"] = False
+        yield response
+
+    def close(self):
+        pass
+
+
+class StageTimer:
+    """
+    A class that times the stages of the turns of a bot, wrapping its methods.
+    Times are exclusive: a stage nested in another one (e.g. slot filling
+    in reply generation) is not counted in the outer one
+
+    Attributes
+    ----------
+    _times: dict
+        {stage: list of times, one per call, in seconds}
+    _stack: list
+        stages being timed, innermost last, with the time spent in their nested stages
+    """
+    def __init__(self):
+        self._times = {stage: [] for stage in stages}
+        self._stack = []
+
+    def instrument(self, bot):
+        """
+        Wraps the methods of the given bot, so that their calls are timed
+        :param bot: bot
+        :return: None
+        """
+        for stage, methods in stages.items():
+            for method in methods:
+                setattr(bot, method, self._wrap(stage, getattr(bot, method)))
+
+    def _wrap(self, stage, method):
+        def timed(*args, **kwargs):
+            frame = [stage, 0.0]
+            self._stack.append(frame)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._stack.pop()
+                self._times[stage].append(elapsed - frame[1])
+                if self._stack:
+                    self._stack[-1][1] += elapsed
+
+        return timed
+
+    def get_times(self):
+        return self._times
+
+
+def run_conversation(commands, menu_path, model, profile, timer=None):
+    """
+    Holds the given scripted conversation with a new bot, as main.py does
+    :param commands: commands of the user
+    :param menu_path: file name of the menu the bot loads (in ./menu)
+    :param model: name of the spacy model
+    :param profile: name of the pipeline profile (see nlp.pipeline_profiles)
+    :param timer: timer of the stages of the turns (None to not time them)
+    :return: a tuple (number of turns, seconds taken by the turns)
+    """
+    # the replies the bot prints are discarded
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        bot = Bot("Bot", color="cyan", verbose=False, menu_path=menu_path, model=model, profile=profile,
+                  speaker=NullSpeaker(), listener=ScriptedListener(commands))
+        if timer is not None:
+            timer.instrument(bot)
+
+        turns = 0
+        start = time.perf_counter()
+        while not bot.is_over():
+            command = bot.listen()
+            if command is None:
+                break
+            bot.process(command)
+            turns += 1
+        elapsed = time.perf_counter() - start
+
+        bot.shutdown()
+
+    return turns, elapsed
+
+
+def compare(results, baseline):
+    """
+    Prints the ratio of the given results to the baseline ones
+    :param results: results of this run
+    :param baseline: results of a previous run (as stored in the JSON file)
+    :return: None
+    """
+    print(f"Compared with {baseline.get('commit') or 'baseline'} (ratio, lower is better)")
+    t = Texttable(max_width=0)
+    t.add_rows([["metric", "baseline", "now", "ratio"]] +
+               [[f"{stage} {key}", baseline["stages"][stage][key], results["stages"][stage][key],
+                 results["stages"][stage][key] / baseline["stages"][stage][key]]
+                for stage in results["stages"] if stage in baseline["stages"]
+                for key in ("mean_ms", "p95_ms") if baseline["stages"][stage].get(key)] +
+               [["ms per turn", 1000 / baseline["turns_per_s"], 1000 / results["turns_per_s"],
+                 baseline["turns_per_s"] / results["turns_per_s"]],
+                ["peak memory (KB)", baseline["peak_memory_kb"], results["peak_memory_kb"],
+                 results["peak_memory_kb"] / baseline["peak_memory_kb"]]])
+    print(t.draw())
+
+
+def current_commit():
+    """
+    :return: the hash of the commit of the working tree, None if unknown
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    args = build_dialogue_benchmark_argparser().parse_args()
+    menu_path = args.menu if args.menu is not None else MenuStore().latest_snapshot()
+    selected = {name: conversations[name] for name in (args.conversations or conversations)}
+    parse_cache.set_capacity(args.parse_cache_size)
+
+    # load the pipeline before timing, and warm up
+    load_pipeline(args.model, profile=args.profile)
+    for commands in selected.values():
+        run_conversation(commands, menu_path, args.model, args.profile)
+    parse_cache.clear()
+
+    # time the stages (without tracing memory, which slows allocations down)
+    timer = StageTimer()
+    turns = 0
+    elapsed = 0.0
+    for _ in range(args.repeat):
+        for commands in selected.values():
+            conversation_turns, conversation_elapsed = run_conversation(commands, menu_path, args.model,
+                                                                        args.profile, timer)
+            turns += conversation_turns
+            elapsed += conversation_elapsed
+    cache_stats = parse_cache.stats()
+
+    # memory allocated at most while holding the conversations once
+    parse_cache.clear()
+    tracemalloc.start()
+    for commands in selected.values():
+        run_conversation(commands, menu_path, args.model, args.profile)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    results = {
+        "commit": current_commit(),
+        "model": args.model,
+        "profile": args.profile,
+        "conversations": list(selected),
+        "repeat": args.repeat,
+        "turns": turns,
+        "turns_per_s": turns / elapsed,
+        "peak_memory_kb": peak / 2 ** 10,
+        "parse_cache": cache_stats,
+        "stages": dict()
+    }
+    for stage, times in timer.get_times().items():
+        if len(times) > 0:
+            results["stages"][stage] = latency_summary(times)
+            results["stages"][stage]["total_s"] = sum(times)
+            results["stages"][stage]["calls"] = len(times)
+
+    t = Texttable(max_width=0)
+    t.set_cols_dtype(["t", "i", "f", "f", "f", "f", "f"])
+    t.add_rows([["stage", "calls", "total (s)", "mean (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)"]] +
+               [[stage, r["calls"], r["total_s"], r["mean_ms"], r["p50_ms"], r["p95_ms"], r["p99_ms"]]
+                for stage, r in results["stages"].items()])
+    print(f"{turns} turns in {elapsed:.3f} s: {results['turns_per_s']:.1f} turns/s, "
+          f"peak memory {results['peak_memory_kb']:.1f} KB, "
+          f"parse cache hit rate {cache_stats['hit_rate']:.2f}")
+    print(t.draw())
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            compare(results, json.load(file))
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
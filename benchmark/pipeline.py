@@ -0,0 +1,100 @@
+import json
+import time
+import tracemalloc
+import spacy
+from texttable import Texttable
+
+from benchmark import load_commands, latency_summary
+from nlp import ParsedUtterance, last_sentence, pipeline_profiles
+from utils import build_pipeline_benchmark_argparser
+
+"""
+Benchmark of the spacy pipeline used to parse commands: per-command latency and memory
+of the full pipeline splitting the whole document into sentences (as the bot used to do),
+against the dialogue profile taking only the last sentence
+"""
+
+
+# configurations compared {name: (pipeline profile, function obtaining the sentence analysed)}
+configurations = {
+    "full": ("full", lambda doc: list(doc.sents)[-1]),
+    "dialogue": ("dialogue", last_sentence)
+}
+
+
+def benchmark_configuration(model, profile, sentence_of, commands, repeat=20):
+    """
+    Benchmarks the parsing of the given commands with the given configuration
+    :param model: name of the spacy model
+    :param profile: name of the pipeline profile (see nlp.pipeline_profiles)
+    :param sentence_of: function obtaining the sentence analysed from the document
+    :param commands: list of commands
+    :param repeat: number of times each command is parsed
+    :return: a dictionary with the components of the pipeline, the time and memory
+    taken to load it, the latency of a command and the peak memory while parsing
+    """
+
+    # memory allocated by the pipeline itself
+    tracemalloc.start()
+    start = time.perf_counter()
+    nlp = spacy.load(model, exclude=list(pipeline_profiles[profile]))
+    load_time = time.perf_counter() - start
+    load_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    def parse(command):
+        return ParsedUtterance(sentence_of(nlp(command)))
+
+    # warm up, then measure latency (without tracing memory, which slows allocations down)
+    for command in commands:
+        parse(command)
+
+    latencies = []
+    for _ in range(repeat):
+        for command in commands:
+            start = time.perf_counter()
+            parse(command)
+            latencies.append(time.perf_counter() - start)
+
+    # memory allocated at most while parsing a command
+    tracemalloc.start()
+    peak = 0
+    for command in commands:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        parse(command)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    results = {
+        "components": list(nlp.pipe_names),
+        "load_s": load_time,
+        "load_mb": load_memory / 2 ** 20,
+        "parse_peak_kb": peak / 2 ** 10
+    }
+    results.update(latency_summary(latencies))
+    return results
+
+
+if __name__ == '__main__':
+    args = build_pipeline_benchmark_argparser().parse_args()
+    commands = load_commands(args.commands)
+
+    results = dict()
+    for name, (profile, sentence_of) in configurations.items():
+        results[name] = benchmark_configuration(args.model, profile, sentence_of, commands, args.repeat)
+
+    t = Texttable(max_width=0)
+    t.set_cols_dtype(["t", "t", "f", "f", "f", "f", "f", "f"])
+    t.add_rows([["configuration", "components", "load (s)", "load (MB)",
+                 "mean (ms)", "p50 (ms)", "p95 (ms)", "parse peak (KB)"]] +
+               [[name, ", ".join(r["components"]), r["load_s"], r["load_mb"],
+                 r["mean_ms"], r["p50_ms"], r["p95_ms"], r["parse_peak_kb"]]
+                for name, r in results.items()])
+    print(f"{len(commands)} commands, parsed {args.repeat} times each with {args.model}")
+    print(t.draw())
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump({"model": args.model, "commands": len(commands), "repeat": args.repeat,
+                       "results": results}, file, indent=2)
@@ -1,14 +1,38 @@
-import os, json
-from datetime import datetime
+import json, threading
+from contextlib import closing
 from termcolor import colored
 
-from speaker import Speaker
-from listener import Listener, sr
+from matcher import MenuMatcher
+from menus import Menu
+from menu_store import MenuStore
+from session import DialogueState
+from tracing import traced, tracer
 from utils import *
 from frames import *
 from exceptions import *
 from nlp import *
 
+
+TTS_CACHE_DIR = "./tts_cache"  # directory of the cache of synthesized replies
+
+# replies that do not depend on the dialogue, worth synthesizing in advance
+static_replies = [
+    "Hello, how may I help?",
+    "Here's your bill. Goodbye!",
+    "I am ready to take your order",
+    "Ok. Do you want anything else?",
+    "Would you like anything else?",
+    "Ok, please tell me",
+    "Ok. Your order is complete. It will come right away. Enjoy!",
+    "I am sorry, that is not on the menu",
+    "Ok. What course is it?",
+    "Ok",
+    "Ok now back to your order",
+    "Sorry, I did not understand that, can you say that again?",
+    "Sorry, I did not hear that, can you say that again?"
+]
+
+
 class Bot:
     """
     A class that represents the bot conducting the dialogue (SDS)
@@ -18,9 +42,10 @@ class Bot:
     _name: str
         the name of the bot
     _speaker: Speaker
-        speaker object used for text to speech
+        speaker object used for text to speech (None if silent)
     _listener: Listener
         listener object used for speech to perform Automatic Speech Recognition
+        (None if commands are input via keyboard)
     _prompt: str
         colored name of the bot to appear in the terminal
     _verbose: bool
@@ -34,8 +59,36 @@ class Bot:
         current frame the bot is processing
     _is_over: bool
         whether the interaction is over
+    _model: str
+        name of the spacy model used to parse commands
+    _disabled_components: tuple
+        names of the spacy pipeline components disabled when parsing commands
+    _profile: str
+        name of the spacy pipeline profile (see nlp.pipeline_profiles)
+    _pipeline_loader: threading.Thread
+        thread loading the nlp pipeline in the background
+    _collected_replies: list
+        replies of the command being processed, when they are collected
+        instead of being said (None otherwise)
+    _matcher: MenuMatcher
+        approximate matcher of the menu entries, rebuilt when the menu changes
+    _menu_store: MenuStore
+        store of the menu on disk (snapshot plus log of the modifications)
+    _streaming: bool
+        whether commands are analysed while they are being transcribed
+    _analysis: IncrementalAnalysis
+        analysis of the last command listened, if streaming (None otherwise)
+    _intent_classifier: IntentClassifier
+        statistical classifier of the user intention, falling back to the frame triggers
+        when not confident (None to use only the frame triggers)
+    _utterance_log: str
+        path of the JSON lines file where commands are logged with the intention
+        determined, to train the intent classifier (None if not logged)
     """
-    def __init__(self, name, color, verbose=True, silent=False, menu_path=None):
+    def __init__(self, name, color, verbose=True, silent=False, menu_path=None,
+                 model=model_en, disabled_components=(), keyboard=False, listener=None,
+                 streaming=False, intent_model=None, utterance_log=None, profile=default_profile,
+                 speaker=None):
         """
         Constructor
         :param name: the bot's name it will use in the dialogues
@@ -44,11 +97,41 @@ class Bot:
         the command it receives (dependency tree, lemmas info)
         :param silent: if true, then only use print (no text to speech)
         :param menu_path: the path of the stored menu
+        :param model: name of the spacy model used to parse commands
+        :param disabled_components: names of the spacy pipeline components to disable
+        :param keyboard: if true, commands are input via keyboard (no microphone)
+        :param listener: listener object to use (e.g. a ReplayListener),
+        if None one listening from the microphone is built (unless keyboard is set)
+        :param streaming: if true, commands are analysed while they are being transcribed
+        :param intent_model: path of the trained intent classifier (see intent.py),
+        if None the user intention is determined only by the frame triggers
+        :param utterance_log: path of the file where commands are logged
+        with the intention determined (None to not log them)
+        :param profile: name of the spacy pipeline profile (see nlp.pipeline_profiles)
+        :param speaker: speaker object to use (unless silent), if None one speaking
+        through the text to speech engine is built
         """
 
         self._name = name
-        self._speaker = Speaker(rate=150, volume=1)
-        self._listener = Listener(mic_index=0)
+
+        # load the nlp pipeline in the background, while the bot sets up and welcomes the user
+        # (the first command waits for it, if it is not loaded yet)
+        self._model = model
+        self._disabled_components = tuple(disabled_components)
+        self._profile = profile
+        self._pipeline_loader = threading.Thread(target=load_pipeline, daemon=True,
+                                                 args=(self._model, self._disabled_components, self._profile))
+        self._pipeline_loader.start()
+
+        # only import and build the text to speech and speech recognition backends in use
+        self._speaker = speaker if not silent else None
+        if speaker is None and not silent:
+            from speaker import Speaker
+            self._speaker = Speaker(rate=150, volume=1, cache_dir=TTS_CACHE_DIR)
+        self._listener = listener
+        if listener is None and not keyboard:
+            from listener import Listener
+            self._listener = Listener(mic_index=0)
         self._prompt = colored(f'{self._name}: ', color)
         self._verbose = verbose
         self._silent = silent
@@ -57,24 +140,53 @@ class Bot:
         self._current_frame = None
 
         self._is_over = False
-
+        self._collected_replies = None
+        self._streaming = streaming
+        self._analysis = None
+        self._matcher = None
+        self._intent_classifier = None
+        if intent_model is not None:
+            from intent import IntentClassifier
+            self._intent_classifier = IntentClassifier.load(intent_model)
+        self._utterance_log = utterance_log
+
+        self._menu_store = MenuStore("./menu")
+        self._menu = Menu()
         if menu_path is not None:
             self._load_menu(menu_path)
-        else:
-            self._menu = {"entries": []}
 
         # when finished setup, welcome user
         self._say(self._welcome())
 
+        # meanwhile, prepare the replies the bot says most often
+        self._warm_speaker()
+
+    def _warm_speaker(self):
+        """
+        Synthesizes in the background the replies that do not depend on the dialogue
+        (and the menu recitation), so that saying them skips synthesis
+        :return: None
+        """
+        if self._silent:
+            return
+
+        sentences = [self._recite_menu()] if len(self._menu) > 0 else []
+        self._speaker.warm_cache(static_replies + sentences)
+
     def _say(self, sentence):
         """
-        Says the given sentence through the bot speaker object
+        Says the given sentence through the bot speaker object, without waiting
+        for the speech to be over
         :param sentence: sentence
         :return: None
         """
+        if self._collected_replies is not None:
+            self._collected_replies.append(sentence)
+            return
+
         print(f"{self._prompt} {sentence}")
         if not self._silent:
-            self._speaker.speak(sentence)
+            self._speaker.speak_async(sentence)
 
     def listen(self):
         """
@@ -82,29 +194,61 @@ class Bot:
         Loops until the sentence in understood properly or there is a connection error
         :return: transcribed sentence from voice
         """
+        # do not listen to the bot itself
+        if not self._silent:
+            self._speaker.wait()
+
         if self._verbose:
             print(f'{self._prompt} * listening *')
         res = self._listen()
         while not res["success"]:
-            err = res["error"]
-            if isinstance(err, sr.UnknownValueError):
-                self._say("Sorry, I did not hear that, can you say that again?")
-            elif isinstance(err, sr.RequestError):
-                self._say("No connection with the server available")
+            if not self.handle_listening_error(res["error"]):
                 return None
 
             res = self._listen()
 
         return res["sentence"]
 
+    def handle_listening_error(self, err):
+        """
+        Tells the user about an error occurred while listening for their command
+        :param err: error of the response (see Listener docs)
+        :return: whether the bot can go on listening
+        """
+        from listener import sr
+
+        if isinstance(err, sr.UnknownValueError):
+            self._say("Sorry, I did not hear that, can you say that again?")
+        elif isinstance(err, sr.RequestError):
+            self._say("No connection with the server available")
+            return False
+
+        return True
+
     def _listen(self):
         """
         A simple proxy to access bot own listener object and obtain
         the transcription of the voice command issued by the user
         :return: a response object (see Listener docs)
         """
-        response = self._listener.listen()
-        return response
+        if not self._streaming:
+            response = self._listener.listen()
+            return response
+
+        # analyse the partial transcriptions while the user is still speaking
+        self._analysis = self.start_analysis()
+        with tracer.span("asr.listen_stream"), closing(self._listener.listen_stream()) as responses:
+            for response in responses:
+                if not response["partial"]:
+                    return response
+                self._analysis.feed(response["sentence"])
+
+    def start_analysis(self):
+        """
+        :return: a new analysis of a command while it is being transcribed,
+        with the bot nlp pipeline (IncrementalAnalysis)
+        """
+        return IncrementalAnalysis(self._model, self._disabled_components, self._profile)
 
     def process(self, command):
         """
@@ -113,8 +257,159 @@ class Bot:
         :return: a proper reply (None if interaction is over)
         """
 
-        # obtain spacy syntax dependency tree
-        parsed = syntax_analysis(command)
+        # the user is talking, so the bot stops talking over them
+        if not self._silent:
+            self._speaker.cancel()
+
+        # obtain spacy syntax dependency tree, indexed once for all the lookups below
+        # (possibly already obtained while the command was being transcribed)
+        if self._analysis is not None:
+            parsed = self._analysis.finish(command)
+            self._analysis = None
+        else:
+            parsed = self.parse(command)
+        self._process_parsed(parsed)
+
+    def process_parsed(self, parsed):
+        """
+        Processes the given command, already parsed (e.g. while the bot was speaking)
+        :param parsed: parsed command (ParsedUtterance)
+        :return: None
+        """
+
+        # the user is talking, so the bot stops talking over them
+        if not self._silent:
+            self._speaker.cancel()
+
+        self._process_parsed(parsed)
+
+    def parse(self, command):
+        """
+        Parses the given command with the bot nlp pipeline
+        :param command: command
+        :return: parsed command (ParsedUtterance)
+        """
+        return syntax_analysis(command, self._model, self._disabled_components, self._profile)
+
+    def process_batch(self, commands, batch_size=64, n_process=1):
+        """
+        Processes the given commands in order, parsing them in batches
+        (see process_stream)
+        :param commands: list of commands
+        :param batch_size: number of commands parsed together
+        :param n_process: number of processes used to parse the commands
+        :return: a list with the replies to each command
+        """
+        return list(self.process_stream(commands, batch_size, n_process))
+
+    def process_stream(self, commands, batch_size=64, n_process=1):
+        """
+        Processes a stream of commands. Commands are parsed in batches through
+        the nlp pipeline, while the dialogue goes through them one at a time, in order.
+        Replies are collected and returned instead of being said
+        :param commands: iterable of commands
+        :param batch_size: number of commands parsed together
+        :param n_process: number of processes used to parse the commands
+        :return: generator of the list of replies to each command
+        """
+        parsed_commands = syntax_analysis_pipe(commands, self._model, self._disabled_components, self._profile,
+                                               batch_size=batch_size, n_process=n_process)
+        if self._intent_classifier is None:
+            for parsed in parsed_commands:
+                yield self.collect_replies(parsed)
+            return
+
+        # classify the intention of each batch of commands at once
+        batch = []
+        for parsed in parsed_commands:
+            batch.append(parsed)
+            if len(batch) == batch_size:
+                yield from self._collect_batch_replies(batch)
+                batch = []
+        yield from self._collect_batch_replies(batch)
+
+    def _collect_batch_replies(self, batch):
+        """
+        Processes the given parsed commands in order, classifying their intention at once
+        :param batch: list of parsed commands (ParsedUtterance)
+        :return: generator of the list of replies to each command
+        """
+        intents = self._intent_classifier.predict_batch([parsed.get_text() for parsed in batch])
+        for parsed, intent in zip(batch, intents):
+            yield self._collect_replies(None, lambda: self._process_parsed(parsed, intent))
+
+    def start_dialogue(self, state):
+        """
+        Starts the dialogue held in the given state, welcoming the user
+        :param state: dialogue state (DialogueState)
+        :return: the list of replies opening the dialogue
+        """
+        return self._collect_replies(state, lambda: self._say(self._welcome()))
+
+    def collect_replies(self, parsed, state=None):
+        """
+        Processes the given parsed command, collecting the replies
+        instead of saying them
+        :param parsed: parsed command (ParsedUtterance)
+        :param state: dialogue state (DialogueState) the command belongs to,
+        the bot own dialogue if None
+        :return: the list of replies to the command
+        """
+        return self._collect_replies(state, lambda: self._process_parsed(parsed))
+
+    def _collect_replies(self, state, step):
+        """
+        Performs a step of the dialogue held in the given state, collecting the replies.
+        The state is swapped in the bot for the duration of the step, and updated afterwards
+        :param state: dialogue state (DialogueState), the bot own dialogue if None
+        :param step: function performing the step
+        :return: the list of replies said during the step
+        """
+        if state is not None:
+            own_state = self._export_state(DialogueState())
+            self._import_state(state)
+
+        self._collected_replies = []
+        try:
+            step()
+            replies = self._collected_replies
+        finally:
+            self._collected_replies = None
+            if state is not None:
+                self._export_state(state)
+                self._import_state(own_state)
+
+        return replies
+
+    def _export_state(self, state):
+        """
+        Copies the bot dialogue state into the given state
+        :param state: dialogue state (DialogueState)
+        :return: the given state
+        """
+        state.current_frame = self._current_frame
+        state.frame_stack = self._frame_stack
+        state.is_over = self._is_over
+        return state
+
+    def _import_state(self, state):
+        """
+        Sets the bot dialogue state from the given state
+        :param state: dialogue state (DialogueState)
+        :return: None
+        """
+        self._current_frame = state.current_frame
+        self._frame_stack = state.frame_stack
+        self._is_over = state.is_over
+
+    def _process_parsed(self, parsed, intent=None):
+        """
+        Processes the given parsed command, updating the dialogue state
+        :param parsed: parsed command (ParsedUtterance)
+        :param intent: intention of the command (intent, confidence) predicted in advance
+        by the intent classifier, if None it is predicted when needed
+        :return: None
+        """
 
         # if prompted to load last stored menu, or saved current one, do so
         if contains_text(parsed, "save"):
@@ -124,6 +419,7 @@ class Bot:
         if contains_text(parsed, "load"):
             self._load_menu()
             self._say("Menu loaded")
+            self._warm_speaker()
             return
 
         # print info if required
@@ -136,15 +432,18 @@ class Bot:
             print_tokens_info(parsed)
 
         # determine frame based on parsed command
-        frame = self._determine_frame(parsed)
+        frame_class = self._determine_frame(parsed, intent)
+        self._log_utterance(parsed, frame_class)
 
         # change current frame if necessary, storing old one
+        # (a frame is created only when switching to it)
         if self._current_frame is None:
-            self._current_frame = frame
-        elif frame is not None and type(frame) != type(self._current_frame):
+            if frame_class is not None:
+                self._current_frame = frame_class()
+        elif frame_class is not None and frame_class is not type(self._current_frame):
             self._frame_stack.insert(0, self._current_frame)
             # self._say("Ok we will come back to that later")
-            self._current_frame = frame
+            self._current_frame = frame_class()
 
         # obtain reply by handling parsed command based on the current frame
         if isinstance(self._current_frame, EndFrame):
@@ -183,17 +482,30 @@ class Bot:
             if self._current_frame.get_last_sentence() is not None:
                 self._say(self._current_frame.get_last_sentence())
 
-    def _determine_frame(self, parsed):
+    @traced("bot.frame")
+    def _determine_frame(self, parsed, intent=None):
         """
         Determines the user intention based upon the parsed command and returns
-        the appropriate frame to handle it
-        :param parsed: parsed command (spacy tree)
-        :return: appropriate frame
+        the type of the appropriate frame to handle it
+        :param parsed: parsed command (ParsedUtterance)
+        :param intent: intention of the command (intent, confidence) predicted in advance
+        by the intent classifier, if None it is predicted when needed
+        :return: appropriate frame class (None if not determined)
         """
 
+        # trust the intent classifier, if confident enough about a known intention
+        # (no intention, or an unconfident one, falls back to the question check and the triggers)
+        if self._intent_classifier is not None:
+            if intent is None:
+                intent = self._intent_classifier.predict(parsed.get_text())
+            label, _ = intent
+            frame_class = frame_triggers.get_frame(label) if label is not None else None
+            if frame_class is not None:
+                return frame_class
+
         # if command is a question, then user is asking info
         if is_question(parsed):
-            return AskInfoFrame()
+            return AskInfoFrame
 
         # otherwise, count the number of frame triggers for each frame
         triggers_counts = self._count_frame_triggers(parsed)
@@ -206,51 +518,34 @@ class Bot:
         # MIGHT NOT BE THE BEST METHOD
         frame_name = max(triggers_counts, key=triggers_counts.get)
 
-        if frame_name == "EndFrame":
-            return EndFrame()
-        elif frame_name == "OrderFrame":
-            return OrderFrame()
-        elif frame_name == "AddInfoFrame":
-            return AddInfoFrame()
-        elif frame_name == "AskInfoFrame":
-            return AskInfoFrame()
+        return frame_triggers.get_frame(frame_name)
 
     def _count_frame_triggers(self, parsed):
         """
         Counts the number of keywords for each frame triggered by the given
         parsed command
-        :param parsed: parsed command
+        :param parsed: parsed command (ParsedUtterance)
         :return: a dictionary {frame_name: triggers_count}
         """
 
-        # setup return object
-        res = {
-            "EndFrame": 0,
-            "OrderFrame": 0,
-            "AddInfoFrame": 0,
-            "AskInfoFrame": 0
-        }
-
-        # visit tree breadth-first, adding up the triggers along the way
-        nodes = [parsed.root]
-        visited = []
-        while nodes:
-            node = nodes.pop(0)
-            visited.append(node)
-            if EndFrame.is_trigger(node.lemma_, node.dep_):
-                res["EndFrame"] += 1
-            if OrderFrame.is_trigger(node.lemma_, node.dep_):
-                res["OrderFrame"] += 1
-            if AddInfoFrame.is_trigger(node.lemma_, node.dep_):
-                res["AddInfoFrame"] += 1
-            if AskInfoFrame.is_trigger(node.lemma_, node.dep_):
-                res["AskInfoFrame"] += 1
-
-            for child in node.children:
-                if not child in visited:
-                    nodes.append(child)
-
-        return res
+        # a single pass over the tokens, looking them up in the compiled trigger table
+        return frame_triggers.count(parsed.get_dep_lemma_pairs())
+
+    def _log_utterance(self, parsed, frame_class):
+        """
+        Logs the given command with the intention determined, if logging is enabled
+        :param parsed: parsed command (ParsedUtterance)
+        :param frame_class: frame class determined for the command (None if not understood)
+        :return: None
+        """
+        if self._utterance_log is None:
+            return
+
+        from intent import no_intent
+
+        record = {"text": parsed.get_text(), "intent": frame_class.__name__ if frame_class is not None else no_intent}
+        with open(self._utterance_log, "a") as file:
+            file.write(json.dumps(record) + "\n")
 
     def _add_menu_entry(self, name, course=None):
         """
@@ -267,8 +562,7 @@ class Bot:
         if course is not None and course not in courses_names:
             raise CourseNotValid()
 
-        self._menu["entries"].append({"name":name,
-                                    "course":course})
+        self._writable_menu().add(name, course)
 
     def _update_menu_entry(self, name, course=None):
         """
@@ -292,10 +586,26 @@ class Bot:
             raise EntryAttributeAlreadySet()
 
         # update entry
-        for i, entry in enumerate(self._menu["entries"]):
-            if entry["name"] == name:
-                self._menu["entries"][i].update({"name":name,
-                                    "course":course})
+        self._writable_menu().set_course(name, course)
+
+    def _writable_menu(self):
+        """
+        :return: the bot menu, copied first if it is read-only (e.g. memory-mapped
+        from a binary snapshot shared with other processes), so that it can be modified
+        """
+        if self._menu.is_read_only():
+            self._set_menu(self._menu.to_menu())
+        return self._menu
+
+    def _set_menu(self, menu):
+        """
+        Replaces the bot menu, releasing the previous one (e.g. unmapping a binary snapshot)
+        :param menu: the new menu
+        :return: None
+        """
+        previous, self._menu = self._menu, menu
+        if previous is not menu:
+            previous.close()
 
     def _get_menu_entry(self, name):
         """
@@ -303,16 +613,52 @@ class Bot:
         :param name: entry name
         :return: entry, None if absent
         """
-        for i, entry in enumerate(self._menu["entries"]):
-            if entry["name"] == name:
-                return self._menu["entries"][i]
+        return self._menu.get(name)
+
+    def _find_menu_entry(self, text):
+        """
+        Searches the entry the given text refers to in the bot menu, tolerating
+        plurals, filler words, aliases and small recognition errors
+        :param text: text said by the user (e.g. "a coke please")
+        :return: entry, None if no entry is similar enough
+        """
+        entry = self._menu.get(text)
+        if entry is not None:
+            return entry
+
+        name = self._get_menu_matcher().best(text)
+        return self._menu.get(name) if name is not None else None
+
+    def _scan_menu_entry(self, parsed):
+        """
+        Scans the words of the given parsed command for the name of a menu entry, preferring
+        the longest one, building the approximate matcher only if no entry is named exactly
+        :param parsed: the parsed command (ParsedUtterance)
+        :return: entry name (but for plurals and filler words), None if no entry is named
+        """
+        words = [token.text for token in parsed]
+        for size in range(len(words), 0, -1):
+            for start in range(len(words) - size + 1):
+                text = " ".join(words[start:start + size])
+                if self._menu.get(text) is not None:
+                    return text
 
-        return None
+        return self._get_menu_matcher().scan(words)
+
+    def _get_menu_matcher(self):
+        """
+        :return: the approximate matcher of the current menu, updated with
+        the entries added since last time (built again only for another menu)
+        """
+        if self._matcher is None or not self._matcher.update(self._menu):
+            self._matcher = MenuMatcher(self._menu)
+        return self._matcher
 
+    @traced("bot.handle_add_info")
     def _handle_add_info_frame(self, parsed):
         """
         Handles the current AddInfoFrame
-        :param parsed: the parsed command
+        :param parsed: the parsed command (ParsedUtterance)
         :return: consistent reply
         """
 
@@ -366,7 +712,7 @@ class Bot:
         """
         Fills slots of the current AddInfoFrame based on the information
         contained in the given parsed command
-        :param parsed: parsed command
+        :param parsed: parsed command (ParsedUtterance)
         :return: None
         """
         root_lemma = parsed.root.lemma_
@@ -398,17 +744,18 @@ class Bot:
             self._current_frame.fill_slot("subj", "course")
             self._current_frame.fill_slot("info", course)
 
+    @traced("bot.handle_ask_info")
     def _handle_ask_info_frame(self, parsed):
         """
         Handles the current AskInfoFrame
-        :param parsed: the parsed command
+        :param parsed: the parsed command (ParsedUtterance)
         :return: consistent reply
         """
         # consistency check
         assert isinstance(self._current_frame, AskInfoFrame)
 
         # if nothing to ask about...
-        if len(self._menu["entries"]) == 0:
+        if len(self._menu) == 0:
             reply = "I am sorry, there is nothing on menu today. " \
                     "Try and add something or load the stored menu first."
             self._current_frame = None
@@ -420,34 +767,17 @@ class Bot:
         subj = self._current_frame.get_slot("subj")
         if subj == "menu":
             # if asked to see the menu
-            # tell menu (entry, course) for each entry in menu
-            reply = "We have:"
-            for course in courses_names:
-                if len([entry for entry in self._menu["entries"] if entry["course"] == course]) == 0:
-                    continue
-
-                for entry in self._menu["entries"]:
-                    if entry["course"] == course:
-                        reply = f"{reply} {entry['name']},"
-
-                reply = reply[:-1]
-                reply = f"{reply} for {course};"
-
-            reply = reply[:-1]
+            reply = self._recite_menu()
         else:
             # if asked about a particular course
             # tell menu (entry, course) for each entry in menu if course == obj
             obj = self._current_frame.get_slot("obj")
             if obj in courses_names:
-                reply = ""
-                for entry in self._menu["entries"]:
-                    if entry["course"] == obj:
-                        reply = f"{reply} {entry['name']},"
-
-                if len(reply) == "":
+                names = self._menu.names_for(obj)
+                if len(names) == 0:
                     reply = f"I'm sorry, we don't have anything for {obj}"
                 else:
-                    reply = f"We have{reply[:-1]}"
+                    reply = f"We have {', '.join(names)}"
 
             else:
                 # the slot filling went wrong
@@ -456,11 +786,27 @@ class Bot:
         self._current_frame = None
         return reply
 
+    def _recite_menu(self):
+        """
+        Recites the menu, telling (entry, course) for each entry in menu
+        :return: reply with the menu
+        """
+        reply = "We have:"
+        for course in courses_names:
+            names = self._menu.names_for(course)
+            if len(names) == 0:
+                continue
+
+            reply = f"{reply} {', '.join(names)} for {course};"
+
+        reply = reply[:-1]
+        return reply
+
     def _fill_ask_info_frame_slots(self, parsed):
         """
         Fills slots of the current AskInfoFrame based on the information
         contained in the given parsed command
-        :param parsed: parsed command
+        :param parsed: parsed command (ParsedUtterance)
         :return: None
         """
 
@@ -481,10 +827,11 @@ class Bot:
             elif pobj_lemma is not None and pobj_lemma in courses_names:
                 self._current_frame.fill_slot("obj", pobj_lemma)
 
+    @traced("bot.handle_order")
     def _handle_order_frame(self, parsed):
         """
         Handles the current OrderFrame
-        :param parsed: the parsed command
+        :param parsed: the parsed command (ParsedUtterance)
         :return: consistent reply
         """
 
@@ -492,7 +839,7 @@ class Bot:
         assert isinstance(self._current_frame, OrderFrame)
 
         # if nothing to order...
-        if len(self._menu["entries"]) == 0:
+        if len(self._menu) == 0:
             reply = "I am sorry, there is nothing on menu today. " \
                     "Try and add something or load the stored menu first."
             self._current_frame = None
@@ -544,7 +891,7 @@ class Bot:
         """
         Fills slots of the current OrderInfoFrame based on the information
         contained in the given parsed command
-        :param parsed: parsed command
+        :param parsed: parsed command (ParsedUtterance)
         :return: None
         """
 
@@ -575,7 +922,12 @@ class Bot:
                 # user did not give a straight answer
                 self._current_frame.set_user_answer(None)
 
-        elif xcomp_lemma is None and dobj_lemma is None:
+        if dobj_text is None:
+            # an entry may be named without being the direct object (e.g. "french fries please")
+            dobj_text = self._scan_menu_entry(parsed)
+
+        if not self._current_frame.is_waiting_confirmation() and \
+                xcomp_lemma is None and dobj_lemma is None and dobj_text is None:
             # user said gibberish (as far as the bot knows...)
             # best thing is to just say 'that is not on the menu'
             raise EntryNotOnMenu
@@ -592,13 +944,49 @@ class Bot:
             return
 
         if dobj_text is not None:
-            # user has made an order for a menu entry,
-            # add that to the current order if entry is on menu
-            entry = self._get_menu_entry(dobj_text)
-            if entry is None:
-                raise EntryNotOnMenu()
+            # user has made an order for one or more menu entries (e.g. "a pizza, french fries and a beer"),
+            # add them all to the current order if they are all on menu
+            lines = []
+            for text, quantity in self._order_items(parsed) or [(dobj_text, 1)]:
+                entry = self._find_menu_entry(text)
+                if entry is None:
+                    raise EntryNotOnMenu()
+                lines.append((entry, quantity))
+
+            for entry, quantity in lines:
+                self._current_frame.add_entry(entry["course"], entry["name"], quantity)
+
+    def _order_items(self, parsed):
+        """
+        Obtains the items ordered in the given parsed command, with their quantities,
+        keeping together the conjuncts that name a single menu entry (e.g. "fish and chips")
+        :param parsed: the parsed command (ParsedUtterance)
+        :return: list of tuples (text of the item, quantity), in sentence order
+        """
+        items = []
+        for token, text in find_items(parsed, "dobj"):
+            if len(items) > 0 and self._names_entry(f"{items[-1][0]} and {text}", items[-1][0], text):
+                items[-1] = (f"{items[-1][0]} and {text}", items[-1][1])
+            else:
+                items.append((text, item_quantity(token)))
 
-            self._current_frame.fill_slot(entry["course"], entry["name"])
+        return items
+
+    def _names_entry(self, text, *parts):
+        """
+        Checks whether the given text names a menu entry (but for plurals and filler words),
+        building the approximate matcher only if the text or one of its parts
+        is not the exact name of an entry
+        :param text: text said by the user (e.g. "fish and chips")
+        :param parts: parts of the text that may name entries on their own (e.g. "fish", "chips")
+        :return: bool
+        """
+        if self._menu.get(text) is not None:
+            return True
+        if all(self._menu.get(part) is not None for part in parts):
+            # (e.g. "pizza and beer")
+            return False
+        return self._get_menu_matcher().exact(text) is not None
 
     def _recap_order(self):
         """
@@ -611,9 +999,11 @@ class Bot:
         reply = "You ordered:"
 
         for course in courses_names:
-            order_entry = self._current_frame.get_slot(course)
-            if order_entry is not None:
-                reply = f"{reply} {order_entry} for {course},"
+            lines = self._current_frame.get_slot(course)
+            if lines is not None:
+                entries = " and ".join(name if quantity == 1 else f"{quantity} {name}"
+                                       for name, quantity in lines.items())
+                reply = f"{reply} {entries} for {course},"
 
         reply = f"{reply[:-1]}"
 
@@ -652,23 +1042,40 @@ class Bot:
     def is_over(self):
         return self._is_over
 
+    def is_streaming(self):
+        return self._streaming
+
+    def get_speaker(self):
+        return self._speaker
+
+    def get_listener(self):
+        return self._listener
+
+    def shutdown(self):
+        """
+        Lets the bot finish saying its last sentences, then releases its speaker
+        and its listener
+        :return: None
+        """
+        # do not leave the pipeline half loaded when the interpreter exits
+        self._pipeline_loader.join()
+        if not self._silent:
+            self._speaker.close()
+        if self._listener is not None:
+            self._listener.close()
+
     def _load_menu(self, path=None):
         """
         Loads a menu
-        :param path: menu path
+        :param path: menu path (None to load the latest menu stored)
         :return: None
         """
-        if path is None:
-            menus = os.listdir("./menu")
-            menus.sort()
-            path = menus[-1]
-        with open(f"./menu/{path}") as file:
-            self._menu = json.load(file)
+        self._set_menu(self._menu_store.load(path))
 
     def _save_menu(self):
         """
-        Saves the current menu on disk as a json file, at path timestamp_menu.json
+        Saves the modifications of the current menu on disk (see MenuStore),
+        going on with the menu as saved (rebased if others saved theirs meanwhile)
         :return: None
         """
-        with open(f"./menu/{datetime.now().strftime('%Y%m%d-%H%M%S')}_menu.json", 'x') as f:
-            json.dump(self._menu, f)
+        self._set_menu(self._menu_store.save(self._menu))
@@ -0,0 +1,258 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from matcher import normalize
+from tracing import tracer
+
+"""
+File with the pipelined driver of the dialogue, overlapping speaking, listening and parsing
+"""
+
+
+class DialogueEngine:
+    """
+    A class that drives the dialogue of a bot as a pipeline: the next command is captured
+    while the bot is still speaking (ignoring what is just the bot's own voice), and parsed
+    on a worker while the following one is captured. The dialogue state is updated only
+    by the thread running the engine, one command at a time, in the order they were captured
+
+    Attributes
+    ----------
+    _bot: Bot
+        bot conducting the dialogue
+    _keyboard: bool
+        whether commands are input via keyboard (no microphone)
+    _prompt: str
+        colored prompt of the user to appear in the terminal
+    _listen_timeout: float
+        seconds waited at most for the user to start speaking, before checking
+        whether the dialogue is over
+    _echo_window: float
+        seconds after a reply ended during which it may still be heard
+    _echo_similarity: float
+        fraction of the words of a command also in a reply being heard above which
+        the command may be the bot's own voice
+    _echo_coverage: float
+        fraction of the words of a reply being heard also in a command above which
+        the command may be the bot's own voice (so that a short command repeating
+        a few words of a long reply, e.g. an entry of the menu, is not taken as echo)
+    _echo_min_words: int
+        minimum number of words of a command for it to be taken as the bot's own voice
+    _commands: queue.Queue
+        captured commands, as tuples (command, future of its parse, turn (see tracing.Turn))
+        or (None, listening error, None), then None once nothing more can be captured
+    _parser: ThreadPoolExecutor
+        worker parsing the captured commands
+    _turn_over: threading.Event
+        set when the bot has replied to the last command (typing waits for it)
+    _stopped: threading.Event
+        set when the dialogue is over
+    _capture: threading.Thread
+        thread capturing the commands
+    """
+    def __init__(self, bot, keyboard=False, prompt="User: ", listen_timeout=1.0,
+                 echo_window=1.0, echo_similarity=0.8, echo_coverage=0.5, echo_min_words=2):
+        """
+        Constructor
+        :param bot: bot conducting the dialogue
+        :param keyboard: if true, commands are input via keyboard (no microphone)
+        :param prompt: prompt of the user to appear in the terminal
+        :param listen_timeout: seconds waited at most for the user to start speaking,
+        before checking whether the dialogue is over
+        :param echo_window: seconds after a reply ended during which it may still be heard
+        :param echo_similarity: fraction of the words of a command also in a reply being heard
+        above which the command may be the bot's own voice
+        :param echo_coverage: fraction of the words of a reply being heard also in a command
+        above which the command may be the bot's own voice
+        :param echo_min_words: minimum number of words of a command for it to be taken
+        as the bot's own voice
+        """
+        self._bot = bot
+        self._keyboard = keyboard
+        self._prompt = prompt
+        self._listen_timeout = listen_timeout
+        self._echo_window = echo_window
+        self._echo_similarity = echo_similarity
+        self._echo_coverage = echo_coverage
+        self._echo_min_words = echo_min_words
+
+        self._commands = queue.Queue()
+        self._parser = ThreadPoolExecutor(max_workers=1)
+        self._turn_over = threading.Event()
+        self._turn_over.set()
+        self._stopped = threading.Event()
+        self._capture = threading.Thread(target=self._capture_commands, daemon=True)
+
+    def run(self):
+        """
+        Holds the dialogue, until it is over or nothing more can be captured
+        :return: None
+        """
+        self._capture.start()
+        try:
+            while not self._bot.is_over():
+                item = self._commands.get()
+                if item is None:
+                    # nothing can be captured anymore
+                    break
+
+                command, parsed, turn = item
+                if command is None:
+                    # tell the user what went wrong while listening
+                    if not self._bot.handle_listening_error(parsed):
+                        break
+                    continue
+
+                if not self._keyboard:
+                    print(f"{self._prompt} {command}")
+
+                # process command (bot will reply accordingly), in the turn it was captured in
+                turn.run(self._bot.process_parsed, parsed.result())
+                turn.end()
+
+                if self._bot.is_over():
+                    self._stopped.set()
+                self._turn_over.set()
+        finally:
+            self._stopped.set()
+            self._turn_over.set()
+            self._parser.shutdown(wait=False)
+
+    def _capture_commands(self):
+        """
+        Captures the commands of the user (ASR or keyboard), sending them to be parsed.
+        Each turn is timed from when the bot starts listening (or the command is typed)
+        until the bot has replied, across the threads capturing, parsing and processing it
+        :return: None
+        """
+        try:
+            turn = None
+            while not self._stopped.is_set():
+                if self._keyboard:
+                    command = self._type()
+                    if command is None:
+                        return
+                    turn = tracer.start_turn()
+                    self._commands.put((command, self._parser.submit(turn.run, self._bot.parse, command), turn))
+                    continue
+
+                # (the turn goes on until a command is heard)
+                if turn is None:
+                    turn = tracer.start_turn()
+                response, analysis = turn.run(self._listen)
+                if not response["success"]:
+                    if not self._handle_error(response["error"]):
+                        return
+                    continue
+
+                command = response["sentence"]
+                if self._is_echo(command):
+                    continue
+
+                # the user is talking, so the bot stops talking over them right away
+                speaker = self._bot.get_speaker()
+                if speaker is not None:
+                    speaker.cancel()
+
+                # (possibly already parsed while the command was being transcribed)
+                if analysis is not None:
+                    parsed = self._parser.submit(turn.run, analysis.finish, command)
+                else:
+                    parsed = self._parser.submit(turn.run, self._bot.parse, command)
+                self._commands.put((command, parsed, turn))
+                turn = None
+        finally:
+            self._commands.put(None)
+
+    def _type(self):
+        """
+        Reads the next command from the keyboard, once the bot has replied to the last one
+        :return: command, None if the dialogue is over or the input ended
+        """
+        self._turn_over.wait()
+        self._turn_over.clear()
+        if self._stopped.is_set():
+            return None
+
+        command = ""
+        # sanity check
+        while len(command.strip()) == 0:
+            print(f"{self._prompt} ", end="")
+            try:
+                command = input()
+            except EOFError:
+                return None
+
+        return command
+
+    def _listen(self):
+        """
+        Listens for the next command, analysing it while it is transcribed if streaming
+        :return: a tuple (response dictionary (see Listener docs), IncrementalAnalysis or None)
+        """
+        listener = self._bot.get_listener()
+        # the microphone is not calibrated again while it hears the bot
+        calibrate = not self._is_speaking()
+        if not self._bot.is_streaming():
+            return listener.listen(timeout=self._listen_timeout, calibrate=calibrate), None
+
+        analysis = self._bot.start_analysis()
+        with closing(listener.listen_stream(calibrate=calibrate)) as responses:
+            for response in responses:
+                if not response["partial"]:
+                    return response, analysis
+                analysis.feed(response["sentence"])
+
+    def _handle_error(self, err):
+        """
+        Handles an error while listening, passing it on to the dialogue if the user should know
+        :param err: error of the response (see Listener docs)
+        :return: whether listening can go on
+        """
+        from listener import sr
+
+        if isinstance(err, sr.WaitTimeoutError):
+            # the user did not speak
+            return True
+        if isinstance(err, sr.UnknownValueError) and self._is_speaking():
+            # most likely the bot's own voice
+            return True
+
+        self._commands.put((None, err, None))
+        return not isinstance(err, sr.RequestError)
+
+    def _is_speaking(self):
+        """
+        :return: whether the bot is speaking, or has just spoken
+        """
+        speaker = self._bot.get_speaker()
+        return speaker is not None and len(speaker.recently_spoken(self._echo_window)) > 0
+
+    def _is_echo(self, command):
+        """
+        Checks whether the given command is just the bot's own voice, comparing
+        its words with the replies being spoken or just spoken: most of the words
+        of the command must be in a reply, and they must cover a good part of it
+        :param command: transcribed command
+        :return: bool
+        """
+        speaker = self._bot.get_speaker()
+        if speaker is None:
+            return False
+
+        words = set(normalize(command))
+        if len(words) < max(self._echo_min_words, 1):
+            return False
+
+        for sentence in speaker.recently_spoken(self._echo_window):
+            reply_words = set(normalize(sentence))
+            if len(reply_words) == 0:
+                continue
+            common = len(words & reply_words)
+            if common / len(words) >= self._echo_similarity and \
+                    common / len(reply_words) >= self._echo_coverage:
+                return True
+
+        return False
@@ -0,0 +1,107 @@
+import random
+import time
+from collections import Counter
+
+from intent import IntentClassifier, load_examples
+from utils import build_intent_evaluation_argparser
+
+"""
+Script evaluating the intent classifier on labelled commands: accuracy
+(overall, and of the predictions confident enough to be trusted) and inference latency
+(one command at a time, and in batches)
+"""
+
+
+def evaluate_accuracy(classifier, examples):
+    """
+    :param classifier: intent classifier
+    :param examples: list of tuples (text, intent)
+    :return: a dictionary with the accuracy, the coverage (fraction of trusted predictions),
+    the accuracy of the trusted predictions and the accuracy for each intent
+    """
+    threshold = classifier.get_threshold()
+    classifier.set_threshold(0)
+    predictions = classifier.predict_batch([text for text, _ in examples])
+    classifier.set_threshold(threshold)
+
+    correct = 0
+    trusted = 0
+    trusted_correct = 0
+    totals = Counter()
+    corrects = Counter()
+    for (_, expected), (predicted, confidence) in zip(examples, predictions):
+        totals[expected] += 1
+        if predicted == expected:
+            correct += 1
+            corrects[expected] += 1
+        if confidence >= threshold:
+            trusted += 1
+            trusted_correct += predicted == expected
+
+    return {
+        "accuracy": correct / len(examples),
+        "coverage": trusted / len(examples),
+        "trusted_accuracy": trusted_correct / trusted if trusted > 0 else None,
+        "per_intent": {intent: corrects[intent] / totals[intent] for intent in sorted(totals)}
+    }
+
+
+def evaluate_latency(classifier, texts, batch_size=64, repeat=5):
+    """
+    :param classifier: intent classifier
+    :param texts: list of commands
+    :param batch_size: number of commands classified together
+    :param repeat: number of measurements (the best one is kept)
+    :return: a dictionary with the milliseconds per command, classified one at a time
+    and in batches
+    """
+    single = []
+    batched = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            classifier.predict(text)
+        single.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            classifier.predict_batch(texts[i:i + batch_size])
+        batched.append(time.perf_counter() - start)
+
+    return {
+        "single_ms": 1000 * min(single) / len(texts),
+        "batched_ms": 1000 * min(batched) / len(texts)
+    }
+
+
+if __name__ == '__main__':
+    args = build_intent_evaluation_argparser().parse_args()
+
+    examples = []
+    for path in args.data:
+        examples += load_examples(path)
+
+    if args.model is not None:
+        classifier = IntentClassifier.load(args.model)
+        test = examples
+    else:
+        random.Random(0).shuffle(examples)
+        n_train = int(len(examples) * args.train_fraction)
+        classifier = IntentClassifier.train(examples[:n_train])
+        test = examples[n_train:]
+
+    if len(test) == 0:
+        raise SystemExit("No commands to evaluate on")
+
+    accuracy = evaluate_accuracy(classifier, test)
+    latency = evaluate_latency(classifier, [text for text, _ in test], args.batch_size, args.repeat)
+
+    print(f"Commands evaluated: {len(test)}")
+    print(f"Accuracy: {accuracy['accuracy']:.3f}")
+    print(f"Coverage (confidence >= {classifier.get_threshold():.3f}): {accuracy['coverage']:.3f}")
+    if accuracy["trusted_accuracy"] is not None:
+        print(f"Accuracy of trusted predictions: {accuracy['trusted_accuracy']:.3f}")
+    for intent, intent_accuracy in accuracy["per_intent"].items():
+        print(f"    {intent}: {intent_accuracy:.3f}")
+    print(f"Latency, one command at a time: {latency['single_ms']:.3f} ms/command")
+    print(f"Latency, batches of {args.batch_size}: {latency['batched_ms']:.3f} ms/command")
@@ -8,4 +8,7 @@ class EntryAttributeAlreadySet(Exception):
     pass
 
 class CourseNotValid(Exception):
+    pass
+
+class SpeechDispatcherError(Exception):
     pass
\ No newline at end of file
@@ -1,12 +1,100 @@
+from collections import Counter
+
+
+class SlotLayout:
+    """
+    A class that represents the fixed layout of the slots of a frame type, shared by all
+    the frames of the type: the position of each slot, and the slots filled (and unfilled)
+    for each bitmask of filled slots, computed the first time the mask is seen,
+    so that frames list them in constant time afterwards
+
+    Attributes
+    ----------
+    _names: tuple
+        names of the slots, in order
+    _index: dict
+        {slot: position of the slot (bit of the mask)}
+    _filled: dict
+        {mask: slots filled}, for the masks seen so far
+    _unfilled: dict
+        {mask: slots left to fill}, for the masks seen so far
+    """
+    __slots__ = ("_names", "_index", "_filled", "_unfilled")
+
+    def __init__(self, names):
+        """
+        Constructor
+        :param names: names of the slots, in order
+        """
+        self._names = tuple(names)
+        self._index = {name: i for i, name in enumerate(self._names)}
+        self._filled = dict()
+        self._unfilled = dict()
+
+    def get_names(self):
+        return self._names
+
+    def index(self, slot):
+        """
+        :param slot: the slot
+        :return: position of the slot (None if not in the layout)
+        """
+        return self._index.get(slot)
+
+    def filled(self, mask):
+        """
+        :param mask: bitmask of the filled slots
+        :return: the slots filled
+        """
+        slots = self._filled.get(mask)
+        if slots is None:
+            slots = self._filled[mask] = tuple(name for i, name in enumerate(self._names) if mask >> i & 1)
+        return slots
+
+    def unfilled(self, mask):
+        """
+        :param mask: bitmask of the filled slots
+        :return: the slots left to fill
+        """
+        slots = self._unfilled.get(mask)
+        if slots is None:
+            slots = self._unfilled[mask] = tuple(name for i, name in enumerate(self._names)
+                                                 if not mask >> i & 1)
+        return slots
+
+    def __len__(self):
+        return len(self._names)
+
+
+# slot layouts created so far {slot names: SlotLayout}
+_layouts = dict()
+
+
+def intern_layout(names):
+    """
+    :param names: names of the slots, in order
+    :return: the slot layout with the given slots, created only once (SlotLayout)
+    """
+    names = tuple(names)
+    layout = _layouts.get(names)
+    if layout is None:
+        layout = _layouts[names] = SlotLayout(names)
+    return layout
+
+
 class Frame:
     """
     A class that represents a generic frame, extended by specific frames
-    with slots suited for the specific interaction
+    with slots suited for the specific interaction.
+    Frames declare their slots as a tuple of names, laid out once per frame type,
+    and their triggers as {dependency relation: [lemma, ...]}
 
     Attributes
     ----------
-    _slots: dict
-        a dictionary with the slots {slot: slot value}
+    _values: list
+        values of the slots, in the order of the layout (None if not filled)
+    _filled: int
+        bitmask of the filled slots
     _last_sentence: str
         last sentence pronounced by the bot in the frame
     _waiting_confirmation: bool
@@ -16,8 +104,34 @@ class Frame:
     _user_answer: str
         the answer of the user to the previous question from the bot
     """
+    __slots__ = ("_values", "_filled", "_last_sentence", "_waiting_confirmation",
+                 "_waiting_answer", "_user_answer")
+
+    # slots of the frame, and their layout (shared by all the frames of the type)
+    slot_names = ()
+    layout = intern_layout(slot_names)
+
+    # trigger lemmas of the frame, by dependency relation
+    triggers = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.layout = intern_layout(cls.slot_names)
+
+    @classmethod
+    def is_trigger(cls, token, dep):
+        """
+        Checks if the given token with the given dependency relation
+        is a trigger for the frame
+        :param token: token (word or lemma)
+        :param dep: dependency relation
+        :return: bool
+        """
+        return dep in cls.triggers and token in cls.triggers[dep]
+
     def __init__(self):
-        self._slots = dict()
+        self._values = [None] * len(self.layout)
+        self._filled = 0
         self._last_sentence = None
         self._waiting_confirmation = False
         self._waiting_answer = False
@@ -27,35 +141,40 @@ class Frame:
         """
         :return: the slots filled so far
         """
-        return [slot for slot, value in self._slots.items() if value is not None]
+        return self.layout.filled(self._filled)
 
     def unfilled_slots(self):
         """
         :return: the slots left to fill
         """
-        return [slot for slot, value in self._slots.items() if value is None]
+        return self.layout.unfilled(self._filled)
 
     def get_slot(self, slot):
         """
         :param slot: the slot
-        :raises: AssertionError if slot is not in self.slots.keys()
+        :raises: AssertionError if slot is not in self.slot_names
         :return: value of the slot (None if not filled)
         """
-        assert slot in self._slots
+        index = self.layout.index(slot)
+        assert index is not None
 
-        return self._slots.get(slot)
+        return self._values[index]
 
     def fill_slot(self, slot, value):
         """
         :param slot: the slot
-        :param value: the value for the slot
-        :raises: AssertionError if slot is not in self.slots.keys() or
-                                if slot is already filled
+        :param value: the value for the slot (None to empty it)
+        :raises: AssertionError if slot is not in self.slot_names
         :return: None
         """
-        assert slot in self._slots
+        index = self.layout.index(slot)
+        assert index is not None
 
-        self._slots[slot] = value
+        self._values[index] = value
+        if value is None:
+            self._filled &= ~(1 << index)
+        else:
+            self._filled |= 1 << index
 
     def set_last_sentence(self, sentence):
         self._last_sentence = sentence
@@ -82,7 +201,7 @@ class Frame:
         self._user_answer = v
 
     def __str__(self):
-        out = f"{self.__class__.__name__}: {self._slots}"
+        out = f"{self.__class__.__name__}: {dict(zip(self.layout.get_names(), self._values))}"
         return out
 
 
@@ -103,27 +222,18 @@ class AskInfoFrame(Frame):
         subj: the subject of the information required (menu entries, course entries)
         obj: the object to ask information about
     """
-    @staticmethod
-    def is_trigger(token, dep):
-        """
-        Checks if the given token with the given dependency relation
-        is a trigger for the frame
-        :param token: token (word or lemma)
-        :param dep: dependency relation
-        :return: bool
-        """
-        askinfo_triggers = {
-            "ROOT": ["like", "tell"],
-            "xcomp": ["know"]
-        }
-        return dep in askinfo_triggers and token in askinfo_triggers[dep]
+    __slots__ = ()
 
-    def __init__(self):
-        super().__init__()
-        self._slots.update({
-            "subj": None,        # menu, courses
-            "obj": None,         # None, specific course
-        })
+    slot_names = (
+        "subj",     # menu, courses
+        "obj"       # None, specific course
+    )
+
+    # trigger lemmas of the frame, by dependency relation
+    triggers = {
+        "ROOT": ["like", "tell"],
+        "xcomp": ["know"]
+    }
 
 
 class AddInfoFrame(Frame):
@@ -134,61 +244,60 @@ class AddInfoFrame(Frame):
         obj: entry name
         info: course of the entry
     """
-    @staticmethod
-    def is_trigger(token, dep):
-        """
-        Checks if the given token with the given dependency relation
-        is a trigger for the frame
-        :param token: token (word or lemma)
-        :param dep: dependency relation
-        :return: bool
-        """
-        addinfo_triggers = {
-            "ROOT": ["add", "is", "like", "want"],
-            "xcomp": ["add"]
-        }
-        return dep in addinfo_triggers and token in addinfo_triggers[dep]
+    __slots__ = ()
 
-    def __init__(self):
-        super().__init__()
-        self._slots.update({
-            "subj": None,       # menu, course
-            "obj": None,        # menu entry, menu entry
-            "info": None        # None, course of the menu entry
-        })
+    slot_names = (
+        "subj",     # menu, course
+        "obj",      # menu entry, menu entry
+        "info"      # None, course of the menu entry
+    )
+
+    # trigger lemmas of the frame, by dependency relation
+    triggers = {
+        "ROOT": ["add", "is", "like", "want"],
+        "xcomp": ["add"]
+    }
 
 
 class OrderFrame(Frame):
     """
     Frame that represents the intention of ordering food.
     Slots to be filled are:
-        course: the entry for the course
+        course: the entries ordered for the course, with their quantities (Counter)
     for each course (starter, main course, side dish, dessert, drink)
     """
-    @staticmethod
-    def is_trigger(token, dep):
-        """
-        Checks if the given token with the given dependency relation
-        is a trigger for the frame
-        :param token: token (word or lemma)
-        :param dep: dependency relation
-        :return: bool
-        """
-        order_triggers = {
-            "ROOT": ["like", "have", "want", "take"],
-            "xcomp": ["order"],
-            "dobj": ["order"],
-            "advmod": ["so", "far"]
-        }
-        return dep in order_triggers and token in order_triggers[dep]
+    __slots__ = ("_asked_recap",)
+
+    # course: entries ordered for course
+    slot_names = tuple(courses_names)
+
+    # trigger lemmas of the frame, by dependency relation
+    triggers = {
+        "ROOT": ["like", "have", "want", "take"],
+        "xcomp": ["order"],
+        "dobj": ["order"],
+        "advmod": ["so", "far"]
+    }
 
     def __init__(self):
         super().__init__()
-        self._slots.update({
-            course: None for course in courses_names  # course: entry for course
-        })
         self._asked_recap = False
 
+    def add_entry(self, course, name, quantity=1):
+        """
+        Adds the given quantity of an entry to the order
+        :param course: course of the entry (the slot)
+        :param name: name of the entry
+        :param quantity: how many of the entry are ordered
+        :return: None
+        """
+        lines = self.get_slot(course)
+        if lines is None:
+            lines = Counter()
+            self.fill_slot(course, lines)
+
+        lines[name] += quantity
+
     def get_asked_recap(self):
         return self._asked_recap
 
@@ -200,21 +309,76 @@ class EndFrame(Frame):
     """
     Frame that represents the intention of ending the interaction.
     """
-    @staticmethod
-    def is_trigger(token, dep):
+    __slots__ = ()
+
+    # trigger lemmas of the frame, by dependency relation
+    triggers = {
+        "dobj": ["bill"],
+        "ROOT": ["shut", "goodbye"],
+        "prt": ["down"]
+    }
+
+
+class TriggerTable:
+    """
+    A class that compiles the triggers of all the frames into a single table,
+    so that counting the triggers of a command takes one lookup per token
+    however many frames there are
+
+    Attributes
+    ----------
+    _frames: list
+        frame classes registered, in order of priority (the first wins ties)
+    _table: dict
+        {(dependency relation, lemma): ((frame index, weight), ...)}
+    """
+    def __init__(self):
+        self._frames = []
+        self._table = dict()
+
+    def register(self, frame_class, weight=1):
         """
-        Checks if the given token with the given dependency relation
-        is a trigger for the frame
-        :param token: token (word or lemma)
-        :param dep: dependency relation
-        :return: bool
+        Registers the triggers declared by the given frame class
+        :param frame_class: frame class
+        :param weight: weight of each trigger of the frame
+        :return: the frame class
         """
-        end_triggers = {
-            "dobj": ["bill"],
-            "ROOT": ["shut", "goodbye"],
-            "prt": ["down"]
-        }
-        return dep in end_triggers and token in end_triggers[dep]
+        index = len(self._frames)
+        self._frames.append(frame_class)
+        for dep, lemmas in frame_class.triggers.items():
+            for lemma in lemmas:
+                key = (dep, lemma)
+                self._table[key] = self._table.get(key, ()) + ((index, weight),)
 
-    def __init__(self):
-        super().__init__()
\ No newline at end of file
+        return frame_class
+
+    def get_frame(self, name):
+        """
+        :param name: name of a registered frame class
+        :return: the frame class
+        """
+        for frame_class in self._frames:
+            if frame_class.__name__ == name:
+                return frame_class
+
+    def count(self, pairs):
+        """
+        Counts the triggers of each frame among the given tokens
+        :param pairs: (dependency relation, lemma) of each token
+        :return: a dictionary {frame_name: triggers_count}, in order of priority
+        """
+        counts = [0] * len(self._frames)
+        table = self._table
+        for pair in pairs:
+            for index, weight in table.get(pair, ()):
+                counts[index] += weight
+
+        return {frame_class.__name__: count for frame_class, count in zip(self._frames, counts)}
+
+
+# triggers of the frames, in order of priority
+frame_triggers = TriggerTable()
+frame_triggers.register(EndFrame)
+frame_triggers.register(OrderFrame)
+frame_triggers.register(AddInfoFrame)
+frame_triggers.register(AskInfoFrame)
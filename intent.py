@@ -0,0 +1,295 @@
+import json
+import random
+import re
+import zlib
+import numpy as np
+
+"""
+File with the statistical intent classifier, an optional alternative
+to the frame triggers for determining the user intention
+"""
+
+
+no_intent = "None"  # label of the utterances that do not express any known intention
+
+
+def tokenize(text):
+    """
+    :param text: text
+    :return: list of the lower case words of the text
+    """
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def extract_features(text):
+    """
+    Extracts the features of the given text: words, pairs of consecutive words,
+    and first word (which tells questions and commands apart)
+    :param text: text
+    :return: list of features (strings)
+    """
+    words = tokenize(text)
+    features = [f"w={word}" for word in words]
+    features += [f"b={first} {second}" for first, second in zip(words, words[1:])]
+    if len(words) > 0:
+        features.append(f"f={words[0]}")
+    return features
+
+
+def load_examples(path):
+    """
+    Loads the labelled utterances stored in the given JSON lines file,
+    one object {"text": utterance, "intent": frame name or "None"} per line
+    (as logged by the bot, see Bot._log_utterance)
+    :param path: path of the file
+    :return: list of tuples (text, intent)
+    """
+    examples = []
+    with open(path) as file:
+        for line in file:
+            if len(line.strip()) == 0:
+                continue
+            record = json.loads(line)
+            examples.append((record["text"], record.get("intent") or no_intent))
+    return examples
+
+
+class IntentClassifier:
+    """
+    A class that represents a linear (softmax) classifier of the user intention,
+    over hashed bag-of-words features. Its confidence is calibrated on held-out
+    utterances (temperature), and predictions below the threshold are not trusted
+
+    Attributes
+    ----------
+    _labels: list
+        intentions (frame names, or "None"), in the order of the model outputs
+    _n_features: int
+        number of buckets the features are hashed into
+    _weights: np.ndarray
+        weights of the model, (n_features, n_labels)
+    _bias: np.ndarray
+        bias of the model, (n_labels,)
+    _temperature: float
+        temperature scaling the scores before the softmax (calibration)
+    _threshold: float
+        minimum confidence for a prediction to be trusted
+    """
+    def __init__(self, labels, n_features=2 ** 14, weights=None, bias=None, temperature=1.0, threshold=0.5):
+        """
+        Constructor
+        :param labels: intentions (frame names, or "None")
+        :param n_features: number of buckets the features are hashed into
+        :param weights: weights of the model (zeros if None)
+        :param bias: bias of the model (zeros if None)
+        :param temperature: temperature scaling the scores before the softmax
+        :param threshold: minimum confidence for a prediction to be trusted
+        """
+        self._labels = list(labels)
+        self._n_features = n_features
+        self._weights = weights if weights is not None else np.zeros((n_features, len(self._labels)), np.float32)
+        self._bias = bias if bias is not None else np.zeros(len(self._labels), np.float32)
+        self._temperature = temperature
+        self._threshold = threshold
+
+    def get_labels(self):
+        return list(self._labels)
+
+    def get_threshold(self):
+        return self._threshold
+
+    def set_threshold(self, threshold):
+        self._threshold = threshold
+
+    @classmethod
+    def train(cls, examples, n_features=2 ** 14, epochs=30, learning_rate=0.5, l2=1e-5,
+              validation_fraction=0.2, target_accuracy=0.9, batch_size=32, seed=0):
+        """
+        Trains a classifier on the given labelled utterances with mini-batch
+        gradient descent, then calibrates it on a held-out part of them
+        :param examples: list of tuples (text, intent)
+        :param n_features: number of buckets the features are hashed into
+        :param epochs: number of passes over the training utterances
+        :param learning_rate: learning rate
+        :param l2: strength of the L2 regularization
+        :param validation_fraction: fraction of the utterances held out for calibration
+        :param target_accuracy: accuracy the trusted predictions should have
+        on the held-out utterances, determining the threshold
+        :param batch_size: number of utterances in each update
+        :param seed: seed of the shuffling
+        :return: the trained classifier
+        """
+        examples = list(examples)
+        rng = random.Random(seed)
+        rng.shuffle(examples)
+
+        # hold out some utterances for calibration, if there are enough
+        n_validation = int(len(examples) * validation_fraction) if len(examples) >= 10 else 0
+        validation, training = examples[:n_validation], examples[n_validation:]
+
+        labels = sorted({intent for _, intent in examples})
+        classifier = cls(labels, n_features)
+        index = {label: i for i, label in enumerate(labels)}
+
+        for _ in range(epochs):
+            rng.shuffle(training)
+            for start in range(0, len(training), batch_size):
+                batch = training[start:start + batch_size]
+                x = classifier._vectorize([text for text, _ in batch])
+                y = np.zeros((len(batch), len(labels)), np.float32)
+                y[np.arange(len(batch)), [index[intent] for _, intent in batch]] = 1
+
+                # gradient of the cross entropy of the softmax
+                gradient = (_softmax(x @ classifier._weights + classifier._bias) - y) / len(batch)
+                classifier._weights -= learning_rate * (x.T @ gradient + l2 * classifier._weights)
+                classifier._bias -= learning_rate * gradient.sum(axis=0)
+
+        if len(validation) > 0:
+            classifier._calibrate(validation, target_accuracy)
+
+        return classifier
+
+    def _calibrate(self, examples, target_accuracy):
+        """
+        Fits the temperature minimizing the negative log likelihood of the given
+        utterances, then sets the threshold to the lowest confidence for which
+        the trusted predictions reach the target accuracy
+        :param examples: list of tuples (text, intent), not used for training
+        :param target_accuracy: accuracy the trusted predictions should have
+        :return: None (the temperature and threshold are left as they are
+        if no utterance has an intention the classifier knows)
+        """
+        scores = self._scores([text for text, _ in examples])
+        expected = np.array([self._labels.index(intent) if intent in self._labels else -1
+                             for _, intent in examples])
+        known = expected >= 0
+        if not known.any():
+            return
+
+        best_nll = None
+        for temperature in np.linspace(0.25, 5, 20):
+            probabilities = _softmax(scores[known] / temperature)
+            nll = -np.mean(np.log(probabilities[np.arange(known.sum()), expected[known]] + 1e-12))
+            if best_nll is None or nll < best_nll:
+                best_nll, self._temperature = nll, float(temperature)
+
+        probabilities = _softmax(scores / self._temperature)
+        confidences = probabilities.max(axis=1)
+        correct = probabilities.argmax(axis=1) == expected
+
+        # from the most to the least confident, the lowest confidence keeping the accuracy
+        self._threshold = 1.0
+        order = np.argsort(-confidences)
+        cumulative_accuracy = np.cumsum(correct[order]) / np.arange(1, len(order) + 1)
+        for i in range(len(order) - 1, -1, -1):
+            if cumulative_accuracy[i] >= target_accuracy:
+                self._threshold = float(confidences[order[i]])
+                break
+
+    def predict(self, text):
+        """
+        Predicts the intention of the given utterance
+        :param text: utterance
+        :return: a tuple (intent, confidence), intent is None if the confidence
+        is below the threshold
+        """
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts):
+        """
+        Predicts the intention of the given utterances, all at once
+        :param texts: list of utterances
+        :return: list of tuples (intent, confidence), intent is None if the confidence
+        is below the threshold
+        """
+        if len(texts) == 0:
+            return []
+
+        probabilities = _softmax(self._scores(texts) / self._temperature)
+        predictions = []
+        for i, label in enumerate(probabilities.argmax(axis=1)):
+            confidence = float(probabilities[i, label])
+            intent = self._labels[label] if confidence >= self._threshold else None
+            predictions.append((intent, confidence))
+        return predictions
+
+    def _scores(self, texts):
+        """
+        :param texts: list of utterances
+        :return: scores of each intention for each utterance, (len(texts), n_labels)
+        """
+        return self._vectorize(texts) @ self._weights + self._bias
+
+    def _vectorize(self, texts):
+        """
+        Hashes the features of the given utterances
+        :param texts: list of utterances
+        :return: feature matrix, (len(texts), n_features), rows of unit norm
+        """
+        x = np.zeros((len(texts), self._n_features), np.float32)
+        for i, text in enumerate(texts):
+            for feature in extract_features(text):
+                # crc32 is stable across runs, unlike the builtin hash of strings
+                x[i, zlib.crc32(feature.encode("utf-8")) % self._n_features] += 1
+
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        return x / np.maximum(norms, 1)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a classifier stored with save
+        :param path: path of the file
+        :return: the classifier
+        """
+        with open(path) as file:
+            data = json.load(file)
+
+        n_features = data["n_features"]
+        weights = np.zeros((n_features, len(data["labels"])), np.float32)
+        for bucket, row in data["weights"].items():
+            weights[int(bucket)] = row
+        return cls(data["labels"], n_features, weights, np.array(data["bias"], np.float32),
+                   data["temperature"], data["threshold"])
+
+    def save(self, path):
+        """
+        Stores the classifier (only the buckets with non-zero weights)
+        :param path: path of the file
+        :return: None
+        """
+        rows = np.flatnonzero(np.abs(self._weights).sum(axis=1))
+        data = {
+            "labels": self._labels,
+            "n_features": self._n_features,
+            "weights": {str(bucket): self._weights[bucket].tolist() for bucket in rows},
+            "bias": self._bias.tolist(),
+            "temperature": self._temperature,
+            "threshold": self._threshold
+        }
+        with open(path, "w") as file:
+            json.dump(data, file)
+
+
+def _softmax(scores):
+    """
+    :param scores: matrix of scores, one row per utterance
+    :return: matrix of probabilities
+    """
+    exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+if __name__ == '__main__':
+    from utils import build_intent_argparser
+
+    args = build_intent_argparser().parse_args()
+
+    examples = []
+    for path in args.logs:
+        examples += load_examples(path)
+
+    classifier = IntentClassifier.train(examples, epochs=args.epochs, target_accuracy=args.target_accuracy)
+    classifier.save(args.output)
+    print(f"Trained on {len(examples)} utterances, labels {classifier.get_labels()}, "
+          f"threshold {classifier.get_threshold():.3f}")
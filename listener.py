@@ -1,5 +1,112 @@
+import os
+import threading
+import time
+from collections import deque
 import speech_recognition as sr
 
+from asr import GoogleBackend, TranscriptBackend
+from tracing import traced
+
+
+@traced("asr.recognize")
+def recognize(recognizer, backend, audio, source=None):
+    """
+    Tries to recognize text from the given audio fragment with the given ASR engine
+    :param recognizer: speech_recognition recognizer
+    :param backend: ASR engine (ASRBackend)
+    :param audio: recorded audio
+    :param source: path of the file the audio was read from (None if recorded live)
+    :return: a dictionary with four keys:
+        "success": a boolean indicating whether or not the recognition was
+                   successful
+        "error":   `None` if no error occured, otherwise the exception caught
+        "sentence": `None` if speech could not be transcribed,
+                   otherwise a string containing the transcribed text
+        "latency": seconds spent recognizing the speech
+    """
+
+    # set up the response object
+    response = {
+        "success": True,
+        "error": None,
+        "sentence": None,
+        "latency": None
+    }
+
+    # try recognizing the speech in the recording
+    start = time.perf_counter()
+    try:
+        response["sentence"] = backend.recognize(recognizer, audio, source).lower().strip()
+    except sr.RequestError as err:
+        # engine was unreachable or unresponsive
+        response["success"] = False
+        response["error"] = err
+    except sr.UnknownValueError as err:
+        # speech was unintelligible
+        response["success"] = False
+        response["error"] = err
+    response["latency"] = time.perf_counter() - start
+
+    return response
+
+def recognize_stream(recognizer, backend, chunks, sample_rate, sample_width, source=None):
+    """
+    Tries to recognize text from the given audio chunks with the given ASR engine,
+    as they are recorded
+    :param recognizer: speech_recognition recognizer
+    :param backend: ASR engine (ASRBackend)
+    :param chunks: iterable of raw audio chunks
+    :param sample_rate: sample rate of the audio
+    :param sample_width: sample width of the audio, in bytes
+    :param source: path of the file the audio is read from (None if recorded live)
+    :return: generator of response dictionaries (see listener.recognize), with the
+    additional key "partial": True for the partial transcriptions of the phrase,
+    False for the final response
+    """
+    response = {
+        "success": True,
+        "error": None,
+        "sentence": None,
+        "latency": None,
+        "partial": False
+    }
+
+    # latency is measured from the last chunk of audio to the final transcription
+    end_of_audio = None
+
+    def timed_chunks():
+        nonlocal end_of_audio
+        for chunk in chunks:
+            end_of_audio = time.perf_counter()
+            yield chunk
+
+    try:
+        for text, final in backend.stream(recognizer, timed_chunks(), sample_rate, sample_width, source):
+            if final:
+                response["sentence"] = text.lower().strip()
+                break
+            yield {
+                "success": True,
+                "error": None,
+                "sentence": text.lower().strip(),
+                "latency": None,
+                "partial": True
+            }
+    except sr.RequestError as err:
+        # engine was unreachable or unresponsive
+        response["success"] = False
+        response["error"] = err
+    except sr.UnknownValueError as err:
+        # speech was unintelligible
+        response["success"] = False
+        response["error"] = err
+
+    if end_of_audio is not None:
+        response["latency"] = time.perf_counter() - end_of_audio
+
+    yield response
+
+
 class Listener:
     """
     A class which serves as an interface between the speaking user and the ASR service
@@ -10,51 +117,222 @@ class Listener:
         object to record audio from the microphone
     _recognizer:
         object to recognize speech from audio (ASR)
+    _backend: ASRBackend
+        ASR engine used to recognize speech
+    _source:
+        audio stream of the microphone, kept open across turns
+    _calibration_duration: float
+        seconds of ambient noise recorded to calibrate the recognizer
+    _recalibration_interval: float
+        seconds after which the recognizer is calibrated again (None to never recalibrate)
+    _drift_ratio: float
+        relative change of the energy threshold (adjusted dynamically while listening)
+        after which the recognizer is calibrated again (None to ignore drift)
+    _calibrated_threshold: float
+        energy threshold resulting from the last calibration
+    _calibrated_at: float
+        monotonic time of the last calibration
+    _closing: threading.Event
+        set when the listener is being closed, to stop listening
     """
-    def __init__(self, mic_index=0):
+    def __init__(self, mic_index=0, backend=None, calibration_duration=1,
+                 recalibration_interval=None, drift_ratio=None):
         """
-        Constructor
+        Constructor, opens the microphone and calibrates the recognizer on the ambient noise
         :param mic_index: the index of the microphone device to listen from
+        :param backend: ASR engine used to recognize speech (Google's ASR API if None)
+        :param calibration_duration: seconds of ambient noise recorded to calibrate the recognizer
+        :param recalibration_interval: seconds after which the recognizer is calibrated again,
+        before the next listen (None to never recalibrate)
+        :param drift_ratio: relative change of the energy threshold after which the recognizer
+        is calibrated again, before the next listen (None to ignore drift)
         """
         self._microphone = sr.Microphone(device_index=mic_index)
         self._recognizer = sr.Recognizer()
+        self._backend = backend if backend is not None else GoogleBackend()
+        self._calibration_duration = calibration_duration
+        self._recalibration_interval = recalibration_interval
+        self._drift_ratio = drift_ratio
+        self._lock = threading.Lock()
+        self._closing = threading.Event()
+
+        # keep the microphone stream open, instead of reopening it on every turn
+        self._source = self._microphone.__enter__()
+
+        self.calibrate()
+
+    def calibrate(self):
+        """
+        Adjusts the recognizer sensitivity to the ambient noise
+        :return: None
+        """
+        with self._lock:
+            self._recognizer.adjust_for_ambient_noise(self._source, duration=self._calibration_duration)
+            self._calibrated_threshold = self._recognizer.energy_threshold
+            self._calibrated_at = time.monotonic()
+
+    def _needs_calibration(self):
+        """
+        :return: whether the recognizer should be calibrated again, because the
+        recalibration interval is over or the energy threshold has drifted
+        """
+        if self._recalibration_interval is not None and \
+                time.monotonic() - self._calibrated_at >= self._recalibration_interval:
+            return True
+
+        if self._drift_ratio is not None and self._calibrated_threshold > 0:
+            drift = abs(self._recognizer.energy_threshold - self._calibrated_threshold)
+            return drift / self._calibrated_threshold >= self._drift_ratio
+
+        return False
 
-    def listen(self):
+    @traced("asr.listen")
+    def listen(self, timeout=None, calibrate=True):
         """
         Listens from the microphone then tries to recognize text from the recorded audio fragment
-        via the Google's ASR API
-        :return: a dictionary with three keys:
-            "success": a boolean indicating whether or not the API request was
-                       successful
-            "error":   `None` if no error occured, otherwise the exception caught
-            "transcription": `None` if speech could not be transcribed,
-                       otherwise a string containing the transcribed text
-        """
-
-        # adjust the recognizer sensitivity to ambient noise and record audio from the microphone
-        with self._microphone as source:
-            self._recognizer.adjust_for_ambient_noise(source)
+        via the ASR engine
+        :param timeout: seconds to wait at most for the user to start speaking
+        (None to wait indefinitely)
+        :param calibrate: whether the recognizer may be calibrated again first, if needed
+        (not while the bot is speaking, or its voice would be taken for the noise of the room:
+        the calibration is then postponed to the next listening allowing it)
+        :return: a response dictionary (see listener.recognize), failing with
+        sr.WaitTimeoutError if the user did not start speaking in time
+        and with sr.RequestError if the listener is closed
+        """
+        if self._closing.is_set():
+            return {"success": False, "error": sr.RequestError("listener closed"), "sentence": None, "latency": None}
+
+        # recalibrate between turns only when needed (e.g. the noise of the room changed),
+        # then record audio from the microphone
+        if calibrate and self._needs_calibration():
+            self.calibrate()
+
+        with self._lock:
             # print("* listening *")
-            audio = self._recognizer.listen(source)
-
-        # set up the response object
-        response = {
-            "success": True,
-            "error": None,
-            "sentence": None
-        }
-
-        # try recognizing the speech in the recording
-        try:
-            response["sentence"] = self._recognizer.recognize_google(audio).lower().strip()
-        except sr.RequestError as err:
-            # API was unreachable or unresponsive
-            response["success"] = False
-            response["error"] = err
-        except sr.UnknownValueError as err:
-            # speech was unintelligible
-            response["success"] = False
-            response["error"] = err
-
-        return response
+            try:
+                audio = self._recognizer.listen(self._source, timeout=timeout)
+            except sr.WaitTimeoutError as err:
+                return {"success": False, "error": err, "sentence": None, "latency": None}
+
+        return recognize(self._recognizer, self._backend, audio)
+
+    def listen_stream(self, calibrate=True):
+        """
+        Listens from the microphone, recognizing text while the user is speaking
+        (if the ASR engine can stream, otherwise as listen does)
+        :param calibrate: whether the recognizer may be calibrated again first (see listen)
+        :return: generator of response dictionaries (see listener.recognize_stream),
+        to be closed once the final response is read
+        """
+        if not self._backend.streaming:
+            response = self.listen(calibrate=calibrate)
+            response["partial"] = False
+            yield response
+            return
+
+        if calibrate and self._needs_calibration():
+            self.calibrate()
+
+        source = self._source
+
+        def read():
+            # the lock is held for each read only, never while the caller handles a response
+            # (it may abandon the generator)
+            with self._lock:
+                if self._closing.is_set():
+                    return None
+                return source.stream.read(source.CHUNK)
+
+        # the engine detects the end of the phrase, so read until it does (or the listener is closed)
+        yield from recognize_stream(self._recognizer, self._backend, iter(read, None),
+                                    source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
+    def close(self):
+        """
+        Closes the microphone stream, once the current listening is over
+        :return: None
+        """
+        self._closing.set()
+        with self._lock:
+            self._microphone.__exit__(None, None, None)
+
+
+class ReplayListener:
+    """
+    A class which replays pre-recorded audio files in place of the speaking user,
+    to run the bot without a microphone (and, with an offline ASR engine, without network)
+
+    Attributes
+    ----------
+    _recordings: deque
+        paths of the audio files still to replay, in order
+    _recognizer:
+        object to read and recognize speech from audio (ASR)
+    _backend: ASRBackend
+        ASR engine used to recognize speech
+    """
+    def __init__(self, paths, backend=None):
+        """
+        Constructor
+        :param paths: audio files (WAV, AIFF or FLAC) to replay, in order;
+        directories are expanded to the audio files they contain, sorted by name
+        :param backend: ASR engine used to recognize speech
+        (the transcripts stored next to the recordings if None)
+        """
+        self._recordings = deque()
+        for path in paths:
+            if os.path.isdir(path):
+                self._recordings.extend(
+                    os.path.join(path, f) for f in sorted(os.listdir(path))
+                    if os.path.splitext(f)[1].lower() in (".wav", ".aiff", ".aif", ".flac")
+                )
+            else:
+                self._recordings.append(path)
+
+        self._recognizer = sr.Recognizer()
+        self._backend = backend if backend is not None else TranscriptBackend()
+
+    @traced("asr.listen")
+    def listen(self, timeout=None, calibrate=True):
+        """
+        Reads the next recording then tries to recognize text from it via the ASR engine
+        :param timeout: ignored, recordings are read right away (see Listener.listen)
+        :param calibrate: ignored, recordings need no calibration
+        :return: a response dictionary (see listener.recognize), failing with
+        sr.RequestError when there is nothing left to replay
+        """
+        if not self._recordings:
+            return {
+                "success": False,
+                "error": sr.RequestError("no recordings left to replay"),
+                "sentence": None,
+                "latency": None
+            }
+
+        path = self._recordings.popleft()
+        with sr.AudioFile(path) as source:
+            audio = self._recognizer.record(source)
+
+        return recognize(self._recognizer, self._backend, audio, source=path)
+
+    def listen_stream(self, calibrate=True):
+        """
+        Reads the next recording chunk by chunk, recognizing text while reading it
+        :param calibrate: ignored, recordings need no calibration
+        :return: generator of response dictionaries (see listener.recognize_stream)
+        """
+        if not self._recordings:
+            response = self.listen()
+            response["partial"] = False
+            yield response
+            return
+
+        path = self._recordings.popleft()
+        with sr.AudioFile(path) as source:
+            chunks = iter(lambda: source.stream.read(source.CHUNK), b"")
+            yield from recognize_stream(self._recognizer, self._backend, chunks,
+                                        source.SAMPLE_RATE, source.SAMPLE_WIDTH, source=path)
 
+    def close(self):
+        self._recordings.clear()
@@ -3,6 +3,8 @@ from colorama import init
 from termcolor import colored
 
 from bot import Bot
+from engine import DialogueEngine
+from tracing import print_summary, tracer
 from utils import *
 
 
@@ -22,24 +24,42 @@ if __name__ == '__main__':
     argparser = build_argparser()
     args = argparser.parse_args()
 
+    # time the turns, if required
+    if args.trace or args.trace_file is not None or args.metrics_port is not None:
+        tracer.enable(export_path=args.trace_file)
+        if args.metrics_port is not None:
+            tracer.serve_metrics(port=args.metrics_port)
+
+    # initialize listener, if commands are not input via keyboard
+    listener = None
+    if args.replay is not None or not args.keyboard:
+        from asr import build_backend
+        from listener import Listener, ReplayListener
+
+    if args.replay is not None:
+        backend = build_backend(args.asr, args.asr_model) if args.asr is not None else None
+        listener = ReplayListener(args.replay, backend=backend)
+    elif not args.keyboard:
+        listener = Listener(mic_index=0, backend=build_backend(args.asr or "google", args.asr_model),
+                            recalibration_interval=args.recalibration_interval or None,
+                            drift_ratio=args.drift_ratio or None)
+
     # initialize bot
-    bot = Bot("Bot", color=BOT_COLOR, verbose=args.verbose, silent=args.silent)
+    bot = Bot("Bot", color=BOT_COLOR, verbose=args.verbose, silent=args.silent,
+              model=args.model, disabled_components=args.disable, keyboard=args.keyboard,
+              listener=listener, streaming=args.streaming, intent_model=args.intent_model,
+              utterance_log=args.log_utterances, profile=args.profile)
 
     # setup colored prompt for user
     user_prompt = colored('User: ', USER_COLOR)
 
-    # while interaction is not over
-    while not bot.is_over():
-        # obtain command (ASR or keyboard)
-        if args.keyboard:
-            command = ""
-            # sanity check
-            while len(command.strip()) == 0:
-                print(f"{user_prompt} ", end="")
-                command = input()
-        else:
-            command = bot.listen()
-            print(f"{user_prompt} {command}")
-
-        # process command (bot will reply accordingly)
-        bot.process(command)
+    # hold the dialogue, listening for the next command while the bot is still replying
+    engine = DialogueEngine(bot, keyboard=args.keyboard, prompt=user_prompt)
+    engine.run()
+
+    # let the bot say goodbye
+    bot.shutdown()
+
+    if tracer.is_enabled():
+        print_summary(tracer.summary())
+        tracer.disable()
@@ -0,0 +1,218 @@
+import re
+from collections import defaultdict
+from itertools import islice
+
+"""
+File with the approximate matching of what the user says against the menu entries
+"""
+
+
+# words that do not tell entries apart (e.g. "a coke please")
+filler_words = {"a", "an", "the", "some", "please", "of", "my"}
+
+
+def singularize(word):
+    """
+    Crude singular form of an english word, enough to match "fries" with "fry"
+    or "onion rings" with "onion ring" (applied to both menu and user words)
+    :param word: word
+    :return: singular form of the word
+    """
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def normalize(text):
+    """
+    Normalizes the given text for matching: lower case, no punctuation,
+    no filler words, singular words
+    :param text: text
+    :return: tuple of the normalized words
+    """
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    return tuple(singularize(w) for w in words if w not in filler_words)
+
+
+def ngrams(words, n=3):
+    """
+    :param words: normalized words
+    :param n: length of the n-grams
+    :return: set of the character n-grams of the words (padded at the word boundaries)
+    """
+    grams = set()
+    for word in words:
+        padded = f" {word} "
+        grams.update(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+    return grams
+
+
+class MenuMatcher:
+    """
+    A class that matches what the user says against the menu entries, tolerating
+    plurals, filler words, aliases and small recognition errors.
+    It is built once per menu, indexing the entries by their normalized
+    names and aliases and by their character n-grams, then only the entries added
+    to the menu since are indexed (see update)
+
+    Attributes
+    ----------
+    _menu: Menu
+        the menu the matcher was built from
+    _version: int
+        version of the menu the matcher is up to date with
+    _indexed: int
+        number of entries of the menu indexed
+    _exact: dict
+        {normalized name or alias: entry name}
+    _keys: list
+        (entry name, set of normalized words, number of n-grams) for each name and alias
+    _postings: dict
+        {n-gram: indexes in _keys of the names and aliases containing it}
+    _max_words: int
+        greatest number of words of a normalized name or alias
+    _min_score: float
+        minimum score for a match to be trusted
+    _max_candidates: int
+        maximum number of names and aliases scored per match
+    """
+    def __init__(self, menu, min_score=0.6, max_candidates=256):
+        """
+        Constructor, indexes the menu entries
+        :param menu: the menu (Menu)
+        :param min_score: minimum score for a match to be trusted
+        :param max_candidates: maximum number of names and aliases scored per match
+        (the ones sharing the rarest n-grams with what the user said)
+        """
+        self._menu = menu
+        self._version = menu.get_version()
+        self._min_score = min_score
+        self._max_candidates = max_candidates
+        self._exact = dict()
+        self._keys = []
+        self._postings = defaultdict(list)
+        self._max_words = 0
+        self._indexed = 0
+
+        for entry in menu:
+            self._index(entry)
+
+    def is_current(self, menu):
+        """
+        :param menu: the menu (Menu)
+        :return: whether the matcher was built from the given menu, as it is now
+        """
+        return menu is self._menu and menu.get_version() == self._version
+
+    def update(self, menu):
+        """
+        Indexes the entries added to the given menu since the matcher was built
+        or last updated (entries are never removed or renamed, so the others stay valid)
+        :param menu: the menu (Menu)
+        :return: whether the matcher is now up to date, False if it was built
+        from another menu (a new one must be built)
+        """
+        if menu is not self._menu:
+            return False
+
+        if menu.get_version() != self._version:
+            for entry in menu.entries_from(self._indexed):
+                self._index(entry)
+            self._version = menu.get_version()
+        return True
+
+    def match(self, text, limit=5):
+        """
+        Ranks the menu entries by their similarity with the given text
+        :param text: text said by the user
+        :param limit: maximum number of candidates returned
+        :return: list of tuples (entry name, score in [0, 1]), best first
+        """
+        words = normalize(text)
+        if len(words) == 0:
+            return []
+
+        name = self._exact.get(" ".join(words))
+        if name is not None:
+            return [(name, 1.0)]
+
+        # candidates: the names and aliases sharing the rarest n-grams, as the common ones
+        # (e.g. " ch") are shared by too many entries to tell them apart
+        grams = ngrams(words)
+        candidates = set()
+        for gram in sorted(grams, key=lambda g: len(self._postings.get(g, ()))):
+            room = self._max_candidates - len(candidates)
+            if room <= 0:
+                break
+            candidates.update(islice(self._postings.get(gram, ()), room))
+
+        # score: half n-gram similarity (dice), half fraction of the user words in the name
+        scores = dict()
+        query_words = set(words)
+        for i in candidates:
+            name, key_words, key_grams = self._keys[i]
+            dice = 2 * len(grams & ngrams(key_words)) / (len(grams) + key_grams)
+            coverage = len(query_words & key_words) / len(query_words)
+            score = 0.5 * dice + 0.5 * coverage
+            if score > scores.get(name, 0):
+                scores[name] = score
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+    def _index(self, entry):
+        """
+        Indexes the given entry by its normalized name and aliases and by their n-grams
+        :param entry: entry
+        :return: None
+        """
+        for key in [entry["name"]] + list(entry.get("aliases", [])):
+            words = normalize(key)
+            if len(words) == 0:
+                continue
+
+            self._exact.setdefault(" ".join(words), entry["name"])
+            grams = ngrams(words)
+            for gram in grams:
+                self._postings[gram].append(len(self._keys))
+            self._keys.append((entry["name"], frozenset(words), len(grams)))
+            self._max_words = max(self._max_words, len(words))
+        self._indexed += 1
+
+    def exact(self, text):
+        """
+        :param text: text said by the user
+        :return: name of the entry the text names exactly (but for plurals and filler words),
+        None if no entry is named
+        """
+        return self._exact.get(" ".join(normalize(text)))
+
+    def best(self, text):
+        """
+        Finds the menu entry the given text most likely refers to
+        :param text: text said by the user
+        :return: entry name, None if no entry is similar enough
+        """
+        candidates = self.match(text, limit=1)
+        if len(candidates) == 0 or candidates[0][1] < self._min_score:
+            return None
+        return candidates[0][0]
+
+    def scan(self, words):
+        """
+        Scans the given words for the name (or alias) of a menu entry,
+        preferring the longest one
+        :param words: words said by the user (e.g. the tokens of the parsed command)
+        :return: entry name, None if no entry is named
+        """
+        normalized = normalize(" ".join(words))
+        for size in range(min(self._max_words, len(normalized)), 0, -1):
+            for start in range(len(normalized) - size + 1):
+                name = self._exact.get(" ".join(normalized[start:start + size]))
+                if name is not None:
+                    return name
+        return None
@@ -0,0 +1,380 @@
+import json
+import mmap
+import struct
+
+from menus import Menu
+
+"""
+File with the binary snapshot format of the menu, memory-mapped on load so that many
+processes share a single read-only copy of a large menu without parsing it.
+A snapshot is laid out as (all integers little endian):
+    header      magic, format version, number of entries, courses and aliases,
+                size of the string table, sequence number (see MenuStore)
+    records     per entry: name (offset, length in the string table),
+                first alias and number of aliases, course (index in the courses)
+    aliases     per alias: offset, length in the string table
+    courses     per course: name (offset, length in the string table, a sentinel length
+                for the entries of unknown course), first position in the course
+                index and number of entries
+    course index    positions of the entries, grouped by course, in menu order
+    name index      positions of the entries, sorted by name (UTF-8 bytes)
+    strings     UTF-8 string table
+"""
+
+
+magic = b"SHRIMENU"
+format_version = 1
+
+# suffix of the binary snapshot files (e.g. 20200208-162202_menu.bin)
+binary_suffix = "_menu.bin"
+
+# entry fields stored in the binary format
+stored_fields = ("name", "course", "aliases")
+
+_header = struct.Struct("<8sHxxIIIIQ")
+_record = struct.Struct("<IIIIHxx")
+_alias = struct.Struct("<II")
+_course = struct.Struct("<IIII")
+_position = struct.Struct("<I")
+
+# course of the entries of unknown course, in the records
+_no_course = 0xFFFF
+# name length of the course of the entries of unknown course, in the courses
+_none_length = 0xFFFFFFFF
+
+
+def _sections(n_entries, n_courses, n_aliases):
+    """
+    :return: offsets of the sections of a snapshot with the given counts
+    (records, aliases, courses, course index, name index, strings)
+    """
+    records = _header.size
+    aliases = records + n_entries * _record.size
+    courses = aliases + n_aliases * _alias.size
+    course_index = courses + n_courses * _course.size
+    name_index = course_index + n_entries * _position.size
+    strings = name_index + n_entries * _position.size
+    return records, aliases, courses, course_index, name_index, strings
+
+
+def write_snapshot(menu, path, seq=0):
+    """
+    Writes the given menu as a binary snapshot
+    :param menu: the menu (Menu, MappedMenu or any iterable of entries)
+    :param path: path of the snapshot
+    :param seq: sequence number of the last modification the snapshot includes (see MenuStore)
+    :raises: ValueError if an entry has fields the binary format does not store
+    :return: None
+    """
+    entries = list(menu)
+
+    strings = bytearray()
+    string_offsets = dict()
+
+    def intern(text):
+        data = text.encode("utf-8")
+        offset = string_offsets.get(data)
+        if offset is None:
+            offset = string_offsets[data] = len(strings)
+            strings.extend(data)
+        return offset, len(data)
+
+    courses = []
+    course_ids = dict()
+    records = []
+    aliases = []
+    for entry in entries:
+        unknown = set(entry) - set(stored_fields)
+        if len(unknown) > 0:
+            raise ValueError(f"entry '{entry['name']}' has fields not stored in binary snapshots: {sorted(unknown)}")
+
+        course = entry.get("course")
+        if course not in course_ids:
+            course_ids[course] = len(courses)
+            courses.append(course)
+
+        name = intern(entry["name"])
+        first_alias = len(aliases)
+        aliases.extend(intern(alias) for alias in entry.get("aliases", ()))
+        records.append((name, first_alias, len(aliases) - first_alias, course_ids[course]))
+
+    if len(courses) >= _no_course:
+        raise ValueError(f"too many courses for binary snapshots: {len(courses)}")
+
+    # entries grouped by course (stable, so in menu order within each course)
+    course_index = sorted(range(len(entries)), key=lambda i: records[i][3])
+    name_index = sorted(range(len(entries)), key=lambda i: entries[i]["name"].encode("utf-8"))
+
+    out = bytearray(_header.pack(magic, format_version, len(entries), len(courses), len(aliases),
+                                 0, seq))
+    for (name_offset, name_length), first_alias, n_aliases, course_id in records:
+        out += _record.pack(name_offset, name_length, first_alias, n_aliases, course_id)
+    for offset, length in aliases:
+        out += _alias.pack(offset, length)
+
+    first = 0
+    counts = [0] * len(courses)
+    for _, _, _, course_id in records:
+        counts[course_id] += 1
+    course_rows = []
+    for course, count in zip(courses, counts):
+        offset, length = intern(course) if course is not None else (0, _none_length)
+        course_rows.append(_course.pack(offset, length, first, count))
+        first += count
+    for row in course_rows:
+        out += row
+
+    for position in course_index:
+        out += _position.pack(position)
+    for position in name_index:
+        out += _position.pack(position)
+
+    # the size of the string table is known only now that all the strings are interned
+    _header.pack_into(out, 0, magic, format_version, len(entries), len(courses), len(aliases),
+                      len(strings), seq)
+    out += strings
+
+    with open(path, "wb") as file:
+        file.write(out)
+
+
+class MappedMenu:
+    """
+    A class that represents a read-only menu memory-mapped from a binary snapshot,
+    with the same lookups as Menu. Nothing is parsed upon loading but the header
+    and the courses: entries are decoded only when looked up, so processes mapping
+    the same snapshot share its pages. It is copied into a Menu to be modified (see to_menu)
+
+    Attributes
+    ----------
+    _file: file
+        the snapshot file
+    _map: mmap.mmap
+        the snapshot, mapped read-only
+    _size: int
+        number of entries
+    _seq: int
+        sequence number of the last stored modification the menu includes (see MenuStore),
+        as of the snapshot unless set
+    _offsets: tuple
+        offsets of the sections of the snapshot (see _sections)
+    _courses: dict
+        {course: (first position in the course index, number of entries)}
+    _listings: dict
+        {course: tuple of the names of the entries of the course}, cached upon request
+    """
+    def __init__(self, path):
+        """
+        Constructor, maps the snapshot
+        :param path: path of the snapshot
+        :raises: ValueError if the file is not a binary snapshot of a supported version,
+        or is truncated
+        """
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            self._file.close()
+            raise ValueError(f"{path} is not a binary menu snapshot")
+
+        if self._map.size() < _header.size:
+            self.close()
+            raise ValueError(f"{path} is not a binary menu snapshot")
+        file_magic, version, self._size, n_courses, n_aliases, n_strings, self._seq = \
+            _header.unpack_from(self._map, 0)
+        if file_magic != magic or version != format_version:
+            self.close()
+            raise ValueError(f"{path} is not a binary menu snapshot of version {format_version}")
+
+        self._offsets = _sections(self._size, n_courses, n_aliases)
+        if self._map.size() != self._offsets[5] + n_strings:
+            self.close()
+            raise ValueError(f"{path} is a truncated or corrupted binary menu snapshot")
+        self._courses = dict()
+        for i in range(n_courses):
+            offset, length, first, count = _course.unpack_from(self._map, self._offsets[2] + i * _course.size)
+            course = self._string(offset, length) if length != _none_length else None
+            self._courses[course] = (first, count)
+        self._listings = dict()
+
+    def close(self):
+        """
+        Unmaps the snapshot (entries must not be looked up anymore), once the menu
+        is not needed or has been copied (see to_menu)
+        :return: None
+        """
+        self._map.close()
+        self._file.close()
+
+    def is_read_only(self):
+        return True
+
+    def to_menu(self):
+        """
+        :return: a modifiable copy of the menu (Menu)
+        """
+        menu = Menu(self)
+        menu.set_seq(self._seq)
+        return menu
+
+    def to_dict(self):
+        """
+        :return: the dictionary representation of the menu (as stored on disk)
+        """
+        return {"entries": list(self)}
+
+    def get_seq(self):
+        return self._seq
+
+    def set_seq(self, seq):
+        self._seq = seq
+
+    def get_version(self):
+        return 0
+
+    def get_unsaved_changes(self):
+        return []
+
+    def mark_saved(self, count=None):
+        pass
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return (self._entry(i) for i in range(self._size))
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def get(self, name):
+        """
+        Searches the given entry in the menu
+        :param name: entry name
+        :return: entry (a new dictionary), None if absent
+        """
+        i = self._find(name)
+        return self._entry(i) if i is not None else None
+
+    def entries_from(self, position):
+        """
+        :param position: position in the menu
+        :return: the entries from the given position on, in the order they were added
+        """
+        return tuple(self._entry(i) for i in range(position, self._size))
+
+    def entries_for(self, course):
+        """
+        :param course: course (None for the entries with unknown course)
+        :return: the entries of the given course, in the order they were added
+        """
+        return tuple(self._entry(i) for i in self._positions_for(course))
+
+    def names_for(self, course):
+        """
+        :param course: course (None for the entries with unknown course)
+        :return: the names of the entries of the given course, in the order they were added
+        """
+        listing = self._listings.get(course)
+        if listing is None:
+            listing = tuple(self._name(i) for i in self._positions_for(course))
+            self._listings[course] = listing
+        return listing
+
+    def _positions_for(self, course):
+        """
+        :param course: course
+        :return: positions of the entries of the given course, in menu order
+        """
+        first, count = self._courses.get(course, (0, 0))
+        start = self._offsets[3] + first * _position.size
+        return [position for position, in _position.iter_unpack(self._map[start:start + count * _position.size])]
+
+    def _find(self, name):
+        """
+        Binary search of the given entry name in the name index
+        :param name: entry name
+        :return: position of the entry, None if absent
+        """
+        key = name.encode("utf-8")
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            position, = _position.unpack_from(self._map, self._offsets[4] + middle * _position.size)
+            offset, length = _record.unpack_from(self._map, self._offsets[0] + position * _record.size)[:2]
+            start = self._offsets[5] + offset
+            candidate = self._map[start:start + length]
+            if candidate < key:
+                low = middle + 1
+            elif candidate > key:
+                high = middle
+            else:
+                return position
+
+        return None
+
+    def _string(self, offset, length):
+        start = self._offsets[5] + offset
+        return self._map[start:start + length].decode("utf-8")
+
+    def _name(self, i):
+        offset, length = _record.unpack_from(self._map, self._offsets[0] + i * _record.size)[:2]
+        return self._string(offset, length)
+
+    def _entry(self, i):
+        """
+        Decodes the entry at the given position
+        :param i: position of the entry in the menu
+        :return: entry, as a dictionary {"name", "course"[, "aliases"]}
+        """
+        name_offset, name_length, first_alias, n_aliases, course_id = \
+            _record.unpack_from(self._map, self._offsets[0] + i * _record.size)
+        entry = {"name": self._string(name_offset, name_length), "course": self._course(course_id)}
+        if n_aliases > 0:
+            entry["aliases"] = [self._string(*_alias.unpack_from(self._map, self._offsets[1] + j * _alias.size))
+                                for j in range(first_alias, first_alias + n_aliases)]
+        return entry
+
+    def _course(self, course_id):
+        """
+        :param course_id: index of a course in the courses
+        :return: the course
+        """
+        offset, length = _course.unpack_from(self._map, self._offsets[2] + course_id * _course.size)[:2]
+        return self._string(offset, length) if length != _none_length else None
+
+
+def load_snapshot(path):
+    """
+    Loads a menu snapshot, memory-mapped if binary
+    :param path: path of the snapshot (*_menu.bin for binary, JSON otherwise)
+    :return: a tuple (menu (Menu or MappedMenu), sequence number of the last modification it includes)
+    """
+    if path.endswith(binary_suffix):
+        menu = MappedMenu(path)
+        return menu, menu.get_seq()
+
+    with open(path) as file:
+        data = json.load(file)
+    return Menu.from_dict(data), data.get("seq", 0)
+
+
+if __name__ == '__main__':
+    from menu_store import snapshot_suffix
+    from utils import build_menu_snapshot_argparser
+
+    args = build_menu_snapshot_argparser().parse_args()
+    menu, seq = load_snapshot(args.source)
+
+    if isinstance(menu, MappedMenu):
+        destination = args.destination or args.source[:-len(binary_suffix)] + snapshot_suffix
+        with open(destination, "w") as file:
+            json.dump(dict(menu.to_dict(), seq=seq) if seq > 0 else menu.to_dict(), file)
+    else:
+        base = args.source[:-len(snapshot_suffix)] if args.source.endswith(snapshot_suffix) \
+            else args.source.rsplit(".", 1)[0]
+        destination = args.destination or base + binary_suffix
+        write_snapshot(menu, destination, seq)
+
+    print(f"{len(menu)} entries written to {destination}")
@@ -0,0 +1,336 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from exceptions import EntryAlreadyOnMenu, EntryNotOnMenu
+from menu_snapshot import load_snapshot
+from menus import Menu
+
+try:
+    import fcntl
+except ImportError:
+    # not on POSIX: the lock only guards the threads of this process
+    fcntl = None
+
+"""
+File with the persistence of the menu: a snapshot of the menu plus an append-only log
+of the modifications made since, periodically compacted into a new snapshot
+"""
+
+
+# name of the pointer to the latest snapshot, in the menu directory
+pointer_name = "LATEST"
+
+# name of the log of the modifications, in the menu directory
+log_name = "changes.jsonl"
+
+# name of the lock file, in the menu directory
+lock_name = ".lock"
+
+# suffix of the snapshot files (e.g. 20200208-162202_menu.json)
+snapshot_suffix = "_menu.json"
+
+
+class MenuStore:
+    """
+    A class that stores the menu in a directory as the latest snapshot (pointed to by
+    the LATEST file, so that it is found without listing the directory) plus a log
+    of the modifications made since, one JSON object per line, each with a sequence number.
+    Saving appends only the modifications not saved yet, and every so often the log is
+    compacted into a new snapshot. Writes are atomic and guarded by a file lock,
+    so that many bots (or processes) can save to the same directory: a menu saved after
+    others saved theirs is rebased onto the latest stored menu first (see save)
+
+    Attributes
+    ----------
+    _directory: str
+        directory of the menu
+    _compact_every: int
+        number of modifications in the log after which it is compacted
+    _lock: threading.Lock
+        lock guarding the store among the threads of this process
+    """
+    def __init__(self, directory="./menu", compact_every=64):
+        """
+        Constructor
+        :param directory: directory of the menu (created if needed)
+        :param compact_every: number of modifications in the log after which it is compacted
+        """
+        self._directory = directory
+        self._compact_every = compact_every
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def latest_snapshot(self):
+        """
+        :return: file name of the latest snapshot of the menu (None if there is none)
+        """
+        return self._read_pointer()["snapshot"]
+
+    def load(self, path=None):
+        """
+        Loads the menu, as of the latest snapshot and the modifications logged since
+        :param path: file name of a snapshot to load instead, without the modifications
+        logged since (None to load the latest menu). Its entries are marked as not saved yet,
+        so that they are added to the latest menu when saved (but for the ones in conflict with it).
+        Binary snapshots (*_menu.bin) are memory-mapped, read-only (see menu_snapshot)
+        :return: the menu, with all its modifications marked as saved (Menu or MappedMenu),
+        or the given snapshot with all its entries marked as not saved (Menu)
+        """
+        if path is not None:
+            snapshot, _ = self._read_snapshot(path)
+            menu = Menu(snapshot)
+            snapshot.close()
+            menu.mark_unsaved()
+            return menu
+
+        with self._locked():
+            menu, _ = self._load_latest()
+        return menu
+
+    def save(self, menu):
+        """
+        Saves the modifications of the given menu not saved yet, appending them to the log,
+        and compacts the log if it grew too long. If the menu is not the latest stored one
+        (e.g. others saved since it was loaded, it was loaded from a given snapshot
+        or it was built from scratch),
+        its modifications are rebased onto the latest stored menu, dropping the ones
+        in conflict with it (the first one saved wins)
+        :param menu: the menu (Menu)
+        :return: the menu saved, to be used from then on: the given one, or the latest stored
+        menu with its modifications if rebased
+        """
+        with self._locked():
+            if not os.path.exists(self._path(pointer_name)):
+                # point to the latest snapshot, so that it is not searched for anymore
+                self._write_atomic(pointer_name, json.dumps(self._read_pointer()))
+
+            seq, clean = self._log_tail()
+            if menu.get_seq() != seq:
+                menu = self._rebase(menu)
+
+            changes = menu.get_unsaved_changes()
+            if len(changes) > 0:
+                # a line left partially written (e.g. by a crash) is ended, not continued
+                lines = [] if clean else ["\n"]
+                for change in changes:
+                    seq += 1
+                    lines.append(json.dumps(dict(change, seq=seq)) + "\n")
+
+                with open(self._path(log_name), "a") as file:
+                    file.writelines(lines)
+                    file.flush()
+                    os.fsync(file.fileno())
+                menu.mark_saved(len(changes))
+            menu.set_seq(seq)
+
+            if seq - self._read_pointer()["seq"] >= self._compact_every:
+                self._compact()
+
+        return menu
+
+    def compact(self):
+        """
+        Compacts the log into a new snapshot of the menu
+        :return: file name of the new snapshot
+        """
+        with self._locked():
+            return self._compact()
+
+    def _compact(self):
+        """
+        Compacts the log into a new snapshot of the menu (the store must be locked)
+        :return: file name of the new snapshot
+        """
+        pointer = self._read_pointer()
+        menu, seq = self._load_latest()
+        if seq == pointer["seq"] and pointer["snapshot"] is not None:
+            # nothing logged since the latest snapshot
+            menu.close()
+            return pointer["snapshot"]
+
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}{snapshot_suffix}"
+        if name == pointer["snapshot"] or os.path.exists(self._path(name)):
+            name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{seq}{snapshot_suffix}"
+
+        # snapshot first, then the pointer to it: a crash in between leaves the old pointer valid,
+        # and the modifications logged before the new snapshot are skipped when loading
+        self._write_atomic(name, json.dumps(dict(menu.to_dict(), seq=seq)))
+        menu.close()
+        self._write_atomic(pointer_name, json.dumps({"snapshot": name, "seq": seq}))
+        self._write_atomic(log_name, "")
+
+        # the previous snapshot, if written by a compaction, is not needed anymore
+        if pointer["seq"] > 0 and pointer["snapshot"] is not None:
+            try:
+                os.remove(self._path(pointer["snapshot"]))
+            except OSError:
+                pass
+
+        return name
+
+    def _rebase(self, menu):
+        """
+        Applies the modifications of the given menu not saved yet onto the latest stored menu
+        (the store must be locked)
+        :param menu: the menu (Menu)
+        :return: the latest stored menu, with the modifications not in conflict with it not saved yet
+        """
+        latest, _ = self._load_latest()
+        for change in menu.get_unsaved_changes():
+            if latest.is_read_only():
+                latest = self._copy(latest)
+            try:
+                latest.apply(change)
+            except (EntryAlreadyOnMenu, EntryNotOnMenu):
+                # in conflict with a modification saved by another bot: the first one wins
+                pass
+
+        return latest
+
+    def _load_latest(self):
+        """
+        Loads the menu, as of the latest snapshot and the modifications logged since
+        (the store must be locked)
+        :return: a tuple (menu, sequence number of its last modification)
+        """
+        pointer = self._read_pointer()
+        if pointer["snapshot"] is not None:
+            menu, seq = self._read_snapshot(pointer["snapshot"])
+            seq = max(seq, pointer["seq"])
+        else:
+            menu, seq = Menu(), 0
+
+        for change in self._read_log():
+            if change["seq"] <= seq:
+                continue
+            if menu.is_read_only():
+                menu = self._copy(menu)
+            try:
+                menu.apply(change)
+            except (EntryAlreadyOnMenu, EntryNotOnMenu):
+                # conflicting modifications saved by different bots: the first one wins
+                pass
+            seq = change["seq"]
+
+        menu.mark_saved()
+        menu.set_seq(seq)
+        return menu, seq
+
+    def _copy(self, menu):
+        """
+        :param menu: a read-only menu (MappedMenu)
+        :return: a modifiable copy of the given menu (Menu), which is released
+        """
+        copy = menu.to_menu()
+        menu.close()
+        return copy
+
+    def _read_snapshot(self, name):
+        """
+        :param name: file name of the snapshot (JSON, or binary memory-mapped, see menu_snapshot)
+        :return: a tuple (menu, sequence number of the last modification it includes)
+        """
+        return load_snapshot(self._path(name))
+
+    def _read_pointer(self):
+        """
+        :return: the pointer to the latest snapshot {"snapshot": file name (None if there is none),
+        "seq": sequence number of the last modification the snapshot includes}.
+        Without a pointer (e.g. menus stored before the log), the latest snapshot
+        is found by listing the directory
+        """
+        try:
+            with open(self._path(pointer_name)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            pass
+
+        snapshots = sorted(f for f in os.listdir(self._directory) if f.endswith(snapshot_suffix))
+        return {"snapshot": snapshots[-1] if len(snapshots) > 0 else None, "seq": 0}
+
+    def _read_log(self):
+        """
+        :return: the modifications logged, in order (a partially written last line is skipped)
+        """
+        changes = []
+        try:
+            with open(self._path(log_name)) as file:
+                for line in file:
+                    try:
+                        changes.append(json.loads(line))
+                    except ValueError:
+                        # partially written line
+                        continue
+        except FileNotFoundError:
+            pass
+
+        return changes
+
+    def _log_tail(self):
+        """
+        Reads only the end of the log
+        :return: a tuple (sequence number of the last modification saved,
+        whether the log ends with a complete line)
+        """
+        try:
+            with open(self._path(log_name), "rb") as file:
+                file.seek(0, os.SEEK_END)
+                size = file.tell()
+                block = 4096
+                while True:
+                    file.seek(max(0, size - block))
+                    tail = file.read()
+                    if size <= block or tail.count(b"\n") > 1:
+                        break
+                    block *= 2
+        except FileNotFoundError:
+            tail = b""
+
+        clean = len(tail) == 0 or tail.endswith(b"\n")
+        for line in reversed(tail.splitlines()):
+            try:
+                return json.loads(line)["seq"], clean
+            except ValueError:
+                # partially written line
+                continue
+
+        return self._read_pointer()["seq"], clean
+
+    def _write_atomic(self, name, content):
+        """
+        Writes the given content to the given file atomically (aside, then renamed)
+        :param name: file name, in the menu directory
+        :param content: content of the file
+        :return: None
+        """
+        tmp_path = self._path(f"{name}.tmp")
+        with open(tmp_path, "w") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self._path(name))
+
+    @contextmanager
+    def _locked(self):
+        """
+        Locks the store, among the threads of this process and among processes
+        :return: None
+        """
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+
+            with open(self._path(lock_name), "a") as lock:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _path(self, name):
+        return os.path.join(self._directory, name)
@@ -0,0 +1,249 @@
+from bisect import bisect_left, bisect_right
+
+from exceptions import EntryAlreadyOnMenu, EntryNotOnMenu
+
+"""
+File with the menu data structure
+"""
+
+
+class Menu:
+    """
+    A class that represents the menu of the bot, indexed by entry name and by course.
+    Entries are dictionaries {"name": entry name, "course": course (None if unknown)},
+    and must be modified only through the menu, to keep the indexes consistent
+
+    Attributes
+    ----------
+    _entries: list
+        entries of the menu, in the order they were added
+    _by_name: dict
+        {entry name: entry}
+    _by_course: dict
+        {course: entries of the course, in the order they were added}
+    _course_positions: dict
+        {course: positions in the menu of the entries of the course, sorted}
+    _positions: dict
+        {entry name: position of the entry in the menu}
+    _listings: dict
+        {course: tuple of the names of the entries of the course}, cached upon request
+        and invalidated when the course changes
+    _version: int
+        incremented upon each modification of the menu
+    _changes: list
+        modifications of the menu not saved yet, in order, as dictionaries
+        {"op": "add" or "set_course", "name": entry name, "course": course}
+    _seq: int
+        sequence number of the last stored modification the menu includes (see MenuStore),
+        None if the menu does not come from the latest stored one
+    """
+    def __init__(self, entries=()):
+        """
+        Constructor
+        :param entries: initial entries of the menu (only the first entry with a given name is kept)
+        """
+        self._entries = []
+        self._by_name = dict()
+        self._by_course = dict()
+        self._course_positions = dict()
+        self._positions = dict()
+        self._listings = dict()
+        self._version = 0
+        self._changes = []
+        self._seq = None
+
+        for entry in entries:
+            if entry["name"] not in self._by_name:
+                self._insert(dict(entry))
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Builds a menu from its dictionary representation (as stored on disk)
+        :param data: dictionary {"entries": [entry, ...]}
+        :return: the menu
+        """
+        return cls(data.get("entries", []))
+
+    def to_dict(self):
+        """
+        :return: the dictionary representation of the menu (as stored on disk)
+        """
+        return {"entries": [dict(entry) for entry in self._entries]}
+
+    def close(self):
+        """
+        Releases the resources of the menu (nothing to release, see MappedMenu)
+        :return: None
+        """
+        pass
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def get_version(self):
+        return self._version
+
+    def get_seq(self):
+        return self._seq
+
+    def set_seq(self, seq):
+        self._seq = seq
+
+    def is_read_only(self):
+        return False
+
+    def get(self, name):
+        """
+        Searches the given entry in the menu
+        :param name: entry name
+        :return: entry, None if absent
+        """
+        return self._by_name.get(name)
+
+    def entries_from(self, position):
+        """
+        :param position: position in the menu
+        :return: the entries from the given position on, in the order they were added
+        """
+        return tuple(self._entries[position:])
+
+    def entries_for(self, course):
+        """
+        :param course: course (None for the entries with unknown course)
+        :return: the entries of the given course, in the order they were added
+        """
+        return tuple(self._by_course.get(course, ()))
+
+    def names_for(self, course):
+        """
+        :param course: course (None for the entries with unknown course)
+        :return: the names of the entries of the given course, in the order they were added
+        """
+        listing = self._listings.get(course)
+        if listing is None:
+            listing = tuple(entry["name"] for entry in self._by_course.get(course, ()))
+            self._listings[course] = listing
+        return listing
+
+    def add(self, name, course=None):
+        """
+        Adds an entry to the menu
+        :param name: entry name
+        :param course: course of the entry (None if unknown)
+        :raises: EntryAlreadyOnMenu if an entry with the same name is on the menu
+        :return: the added entry
+        """
+        if name in self._by_name:
+            raise EntryAlreadyOnMenu()
+
+        entry = {"name": name, "course": course}
+        self._insert(entry)
+        self._changes.append({"op": "add", "name": name, "course": course})
+        return entry
+
+    def set_course(self, name, course):
+        """
+        Sets the course of the given entry
+        :param name: entry name
+        :param course: course of the entry
+        :raises: EntryNotOnMenu if the entry is not on the menu
+        :return: None
+        """
+        entry = self._by_name.get(name)
+        if entry is None:
+            raise EntryNotOnMenu()
+
+        if entry["course"] == course:
+            return
+
+        self._unindex_course(entry)
+        entry["course"] = course
+        self._index_course(entry)
+        self._version += 1
+        self._changes.append({"op": "set_course", "name": name, "course": course})
+
+    def apply(self, change):
+        """
+        Applies the given modification to the menu
+        :param change: modification, as a dictionary {"op": "add" or "set_course", "name", "course"}
+        :raises: EntryAlreadyOnMenu, EntryNotOnMenu as add and set_course
+        :return: None
+        """
+        if change["op"] == "add":
+            self.add(change["name"], change.get("course"))
+        elif change["op"] == "set_course":
+            self.set_course(change["name"], change.get("course"))
+
+    def get_unsaved_changes(self):
+        """
+        :return: the modifications of the menu not saved yet, in order
+        """
+        return list(self._changes)
+
+    def mark_unsaved(self):
+        """
+        Marks all the entries of the menu as modifications not saved yet (additions),
+        e.g. for a menu loaded from an older snapshot, so that saving it adds its entries
+        to the latest stored menu (see MenuStore.save)
+        :return: None
+        """
+        self._changes = [{"op": "add", "name": entry["name"], "course": entry["course"]} for entry in self._entries]
+
+    def mark_saved(self, count=None):
+        """
+        Marks modifications of the menu as saved, forgetting them
+        :param count: number of modifications saved, the first ones not saved yet (None for all of them)
+        :return: None
+        """
+        del self._changes[:count]
+
+    def _insert(self, entry):
+        """
+        Inserts the given entry in the menu and in its indexes
+        :param entry: entry
+        :return: None
+        """
+        entry.setdefault("course", None)
+        self._positions[entry["name"]] = len(self._entries)
+        self._entries.append(entry)
+        self._by_name[entry["name"]] = entry
+        self._index_course(entry)
+        self._version += 1
+
+    def _index_course(self, entry):
+        """
+        Indexes the given entry by its course, keeping the entries of each course
+        in the order they were added to the menu
+        :param entry: entry
+        :return: None
+        """
+        course = entry["course"]
+        position = self._positions[entry["name"]]
+        positions = self._course_positions.setdefault(course, [])
+        i = bisect_right(positions, position)
+        positions.insert(i, position)
+        self._by_course.setdefault(course, []).insert(i, entry)
+        self._listings.pop(course, None)
+
+    def _unindex_course(self, entry):
+        """
+        Removes the given entry from the index of its course
+        :param entry: entry
+        :return: None
+        """
+        course = entry["course"]
+        positions = self._course_positions[course]
+        i = bisect_left(positions, self._positions[entry["name"]])
+        del positions[i]
+        del self._by_course[course][i]
+        if len(positions) == 0:
+            del self._course_positions[course]
+            del self._by_course[course]
+        self._listings.pop(course, None)
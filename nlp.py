@@ -1,4 +1,10 @@
-import spacy
+import contextvars
+import re
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import traced
 
 """
 File with all the NLP functions
@@ -7,68 +13,603 @@ File with all the NLP functions
 
 model_en = "en_core_web_sm"  # spacy model name for the english language
 
+question_triggers = ["what", "how"]  # words that make a sentence a question
+
+# dependency relations of the modifiers that are part of the name of an item (e.g. "french fries")
+item_modifiers = ("compound", "amod")
+
+# numbers said in words, for the quantities of the items (e.g. "two beers")
+number_words = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12
+}
+
+# pipeline profiles {profile name: names of the components excluded from the pipeline}.
+# The bot only reads the text, lemmas, part of speech tags and dependency tree of commands,
+# so the dialogue profile does not even load the named entity recognizer
+pipeline_profiles = {
+    "full": (),
+    "dialogue": ("ner",)
+}
+default_profile = "dialogue"
+
+# process-wide registry of loaded spacy pipelines {(model, disabled components, profile): pipeline},
+# so that every model is loaded at most once per process
+_pipelines = dict()
+_pipelines_lock = threading.Lock()
+_pipelines_stats = {
+    "hits": 0,      # requests served by an already loaded pipeline
+    "misses": 0     # requests that required loading the pipeline
+}
+
+
+def load_pipeline(model=model_en, disable=(), profile=default_profile):
+    """
+    Obtains the spacy pipeline for the given model, loading it only the first time
+    it is requested in the process
+    :param model: name (or path) of the spacy model
+    :param disable: names of the pipeline components to disable
+    :param profile: name of the pipeline profile (see pipeline_profiles)
+    :return: the spacy pipeline
+    """
+    key = (model, tuple(sorted(disable)), profile)
+
+    with _pipelines_lock:
+        nlp = _pipelines.get(key)
+        if nlp is None:
+            _pipelines_stats["misses"] += 1
+            # spacy takes long to import, so it is imported only once a pipeline is needed
+            import spacy
+            exclude = pipeline_profiles[profile]
+            nlp = spacy.load(model, disable=[c for c in disable if c not in exclude], exclude=list(exclude))
+            _pipelines[key] = nlp
+        else:
+            _pipelines_stats["hits"] += 1
+
+    return nlp
+
+def normalize_utterance(sentence):
+    """
+    Normalizes the given sentence, so that repetitions of the same command
+    share their parse: no surrounding or repeated whitespace. The case is kept,
+    as it changes the parse (transcriptions are already lower case, see listener)
+    :param sentence: sentence
+    :return: normalized sentence
+    """
+    return re.sub(r"\s+", " ", sentence).strip()
+
+def cache_key(text, model=model_en, disable=(), profile=default_profile):
+    """
+    :param text: normalized sentence
+    :param model: name of the spacy model
+    :param disable: names of the pipeline components disabled
+    :param profile: name of the pipeline profile
+    :return: key of the parse of the given sentence in the parse cache
+    """
+    return model, tuple(sorted(disable)), profile, text
 
-def syntax_analysis(sentence):
+def pipeline_stats():
+    """
+    :return: a dictionary with the hit/miss counters of the pipeline registry
+    and the number of pipelines loaded
     """
-    Performs syntax syntax analysis of the given sentence
+    with _pipelines_lock:
+        stats = dict(_pipelines_stats)
+        stats["loaded"] = len(_pipelines)
+    return stats
+
+def last_sentence(doc):
+    """
+    Obtains the last sentence of the given document, without splitting
+    the whole document into sentences
+    :param doc: spacy document
+    :return: span of the last sentence
+    """
+    for i in range(len(doc) - 1, 0, -1):
+        if doc[i].is_sent_start:
+            return doc[i:]
+    return doc[:]
+
+@traced("nlp.parse")
+def syntax_analysis(sentence, model=model_en, disable=(), profile=default_profile, cache=True):
+    """
+    Performs syntax syntax analysis of the given sentence. Parses are cached by normalized
+    sentence, so that a repeated command skips the spacy pipeline
     :param sentence: sentence
-    :return: spacy dependency tree for the sentence
+    :param model: name of the spacy model to use
+    :param disable: names of the pipeline components to disable
+    :param profile: name of the pipeline profile (see pipeline_profiles)
+    :param cache: whether to look the parse up in the cache and store it there
+    (e.g. not for speculative parses, see IncrementalAnalysis)
+    :return: ParsedUtterance of the spacy dependency tree for the last sentence
+    of the (normalized) sentence
     """
 
-    nlp = spacy.load(model_en)
-    doc = nlp(sentence)
-    parsed = list(doc.sents)[-1]
+    text = normalize_utterance(sentence)
+    key = cache_key(text, model, disable, profile)
+    parsed = parse_cache.get(key) if cache else None
+    if parsed is None:
+        nlp = load_pipeline(model, disable, profile)
+        doc = nlp(text)
+        parsed = ParsedUtterance(last_sentence(doc))
+        if cache:
+            parse_cache.put(key, parsed)
+
     return parsed
 
+def syntax_analysis_pipe(sentences, model=model_en, disable=(), profile=default_profile,
+                         batch_size=64, n_process=1):
+    """
+    Performs syntax analysis of a stream of sentences, parsing them in batches
+    through the spacy pipeline (only the sentences whose parse is not cached)
+    :param sentences: iterable of sentences
+    :param model: name of the spacy model to use
+    :param disable: names of the pipeline components to disable
+    :param profile: name of the pipeline profile (see pipeline_profiles)
+    :param batch_size: number of sentences parsed together
+    :param n_process: number of processes used to parse the sentences
+    :return: generator of ParsedUtterance, in the same order as the sentences
+    """
+
+    # keys of the sentences read from the stream and not yielded yet, with their cached parse
+    pending = deque()
+
+    def uncached():
+        for sentence in sentences:
+            text = normalize_utterance(sentence)
+            key = cache_key(text, model, disable, profile)
+            parsed = parse_cache.get(key)
+            pending.append((key, parsed))
+            if parsed is None:
+                yield text
+
+    nlp = load_pipeline(model, disable, profile)
+    for doc in nlp.pipe(uncached(), batch_size=batch_size, n_process=n_process):
+        # the cached sentences preceding the one just parsed
+        while pending[0][1] is not None:
+            yield pending.popleft()[1]
+
+        key, _ = pending.popleft()
+        parsed = ParsedUtterance(last_sentence(doc))
+        parse_cache.put(key, parsed)
+        yield parsed
+
+    while pending:
+        yield pending.popleft()[1]
+
+
+class ParseCache:
+    """
+    A class that represents a bounded cache of parsed commands, evicting the least
+    recently used ones. Parsed commands do not change once built, so the cache
+    can be shared by all the dialogues (and threads) of the process
+
+    Attributes
+    ----------
+    _capacity: int
+        maximum number of parsed commands stored
+    _entries: OrderedDict
+        {(model, disabled components, profile, normalized sentence): ParsedUtterance},
+        from the least to the most recently used
+    _lock: threading.Lock
+        lock guarding the entries and the counters
+    _hits: int
+        number of lookups that found the parse
+    _misses: int
+        number of lookups that did not find the parse
+    _evictions: int
+        number of parses evicted
+    """
+    def __init__(self, capacity=1024):
+        """
+        Constructor
+        :param capacity: maximum number of parsed commands stored (0 to disable the cache)
+        """
+        self._capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        """
+        Searches the parse with the given key, marking it as recently used
+        :param key: key of the parse
+        :return: parsed command (ParsedUtterance), None if absent
+        """
+        with self._lock:
+            parsed = self._entries.get(key)
+            if parsed is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return parsed
+
+    def put(self, key, parsed):
+        """
+        Stores the parse with the given key
+        :param key: key of the parse
+        :param parsed: parsed command (ParsedUtterance)
+        :return: None
+        """
+        with self._lock:
+            if self._capacity <= 0:
+                return
+
+            self._entries[key] = parsed
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def set_capacity(self, capacity):
+        """
+        Sets the maximum number of parsed commands stored, evicting the exceeding ones
+        :param capacity: maximum number of parsed commands stored (0 to disable the cache)
+        :return: None
+        """
+        with self._lock:
+            self._capacity = capacity
+            while len(self._entries) > max(capacity, 0):
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        :return: a dictionary with the hit/miss/eviction counters, the hit rate
+        and the number of parsed commands stored
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups > 0 else 0.0,
+                "entries": len(self._entries),
+                "capacity": self._capacity
+            }
+
+
+# process-wide cache of parsed commands, shared by all the bots and dialogues
+parse_cache = ParseCache()
+
+
+class IncrementalAnalysis:
+    """
+    A class that analyses a command while it is still being transcribed.
+    Each new partial transcription is parsed speculatively on a worker thread,
+    so that when the final transcription matches the latest partial one,
+    its parse is already available. Speculative parses are kept out of the
+    shared cache, only the final one is stored there
+
+    Attributes
+    ----------
+    _model: str
+        name of the spacy model to use
+    _disable: tuple
+        names of the pipeline components to disable
+    _profile: str
+        name of the pipeline profile
+    _worker: ThreadPoolExecutor
+        worker parsing the partial transcriptions
+    _latest: tuple
+        (latest partial transcription, future of its parse), None if nothing fed yet
+    """
+    # the worker is shared, so that analysing a command does not spawn threads
+    _shared_worker = None
+    _shared_worker_lock = threading.Lock()
+
+    def __init__(self, model=model_en, disable=(), profile=default_profile):
+        """
+        Constructor
+        :param model: name of the spacy model to use
+        :param disable: names of the pipeline components to disable
+        :param profile: name of the pipeline profile (see pipeline_profiles)
+        """
+        self._model = model
+        self._disable = tuple(disable)
+        self._profile = profile
+        self._latest = None
+
+        with IncrementalAnalysis._shared_worker_lock:
+            if IncrementalAnalysis._shared_worker is None:
+                IncrementalAnalysis._shared_worker = ThreadPoolExecutor(max_workers=1)
+            self._worker = IncrementalAnalysis._shared_worker
+
+    def feed(self, partial):
+        """
+        Feeds a partial transcription of the command, parsing it in the background
+        :param partial: partial transcription
+        :return: None
+        """
+        if self._latest is not None:
+            text, future = self._latest
+            if text == partial:
+                return
+            # only the latest partial transcription may turn out to be final
+            future.cancel()
+
+        # (in a copy of the current context, so that parsing belongs to the turn being traced)
+        future = self._worker.submit(contextvars.copy_context().run, syntax_analysis, partial, self._model,
+                                     self._disable, self._profile, cache=False)
+        self._latest = (partial, future)
+
+    def finish(self, sentence):
+        """
+        Obtains the parse of the final transcription of the command
+        :param sentence: final transcription
+        :return: parsed command (ParsedUtterance)
+        """
+        if self._latest is not None:
+            text, future = self._latest
+            self._latest = None
+            if text == sentence and not future.cancelled():
+                parsed = future.result()
+                parse_cache.put(cache_key(normalize_utterance(sentence), self._model, self._disable,
+                                          self._profile), parsed)
+                return parsed
+            future.cancel()
+
+        return syntax_analysis(sentence, self._model, self._disable, self._profile)
+
+
+class ParsedToken:
+    """
+    A class that represents a token of a parsed command, holding only what the bot
+    uses of the spacy token, so that parsed commands do not keep the spacy document alive
+
+    Attributes
+    ----------
+    text: str
+        text of the token
+    lemma_: str
+        lemma of the token
+    pos_: str
+        part of speech tag of the token
+    dep_: str
+        dependency relation of the token
+    i: int
+        index of the token in the sentence
+    children: tuple
+        tokens depending on the token, in sentence order
+    n_lefts: int
+        number of children preceding the token
+    n_rights: int
+        number of children following the token
+    """
+    __slots__ = ("text", "lemma_", "pos_", "dep_", "i", "children", "n_lefts", "n_rights")
+
+    def __init__(self, token, i):
+        """
+        Constructor (children are set afterwards, once all the tokens are built)
+        :param token: spacy token
+        :param i: index of the token in the sentence
+        """
+        self.text = token.text
+        self.lemma_ = token.lemma_
+        self.pos_ = token.pos_
+        self.dep_ = token.dep_
+        self.i = i
+        self.children = ()
+        self.n_lefts = token.n_lefts
+        self.n_rights = token.n_rights
+
+    def __repr__(self):
+        return self.text
+
+
+class ParsedUtterance:
+    """
+    A class that represents a parsed command. Its dependency tree is copied into
+    compact tokens (ParsedToken) and visited once, upon construction, indexing
+    the tokens so that the lookups the bot performs on the command do not need
+    to visit the tree again. It does not change afterwards, so it can be cached
+    and shared among dialogues
+
+    Attributes
+    ----------
+    _text: str
+        text of the parsed sentence
+    _tokens: tuple
+        tokens of the parsed sentence, in sentence order
+    _root: ParsedToken
+        root token of the dependency tree
+    _deps: dict
+        {dependency relation: tokens with that relation, in breadth-first order}
+    _lemmas: dict
+        {lemma: tokens with that lemma, in breadth-first order}
+    _texts: dict
+        {text: tokens with that text, in breadth-first order}
+    _pairs: tuple
+        (dependency relation, lemma) of each token, in breadth-first order
+    _found: dict
+        {dependency relation: (first token with that relation, its compound term)}
+    """
+    def __init__(self, span):
+        """
+        Constructor
+        :param span: spacy dependency tree of the parsed sentence
+        """
+        self._text = span.text
+        start = span.start
+        tokens = tuple(ParsedToken(token, token.i - start) for token in span)
+        for token, record in zip(span, tokens):
+            record.children = tuple(tokens[child.i - start] for child in token.children)
+        self._tokens = tokens
+        self._root = tokens[span.root.i - start]
+
+        self._deps = dict()
+        self._lemmas = dict()
+        self._texts = dict()
+        pairs = []
+
+        # single breadth-first visit of the dependency tree
+        nodes = deque([self._root])
+        while nodes:
+            node = nodes.popleft()
+            self._deps.setdefault(node.dep_, []).append(node)
+            self._lemmas.setdefault(node.lemma_, []).append(node)
+            self._texts.setdefault(node.text, []).append(node)
+            pairs.append((node.dep_, node.lemma_))
+            nodes.extend(node.children)
+
+        self._pairs = tuple(pairs)
+        self._found = {dep: (nodes[0], find_compound(nodes[0])) for dep, nodes in self._deps.items()}
+
+    @property
+    def root(self):
+        """
+        :return: root token of the dependency tree
+        """
+        return self._root
+
+    def get_text(self):
+        """
+        :return: text of the parsed sentence
+        """
+        return self._text
+
+    def __iter__(self):
+        return iter(self._tokens)
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def get_dep_lemma_pairs(self):
+        """
+        :return: (dependency relation, lemma) of each token, in breadth-first order
+        """
+        return self._pairs
+
+    def find_dep(self, dep):
+        """
+        Searches a token with given dependency relation
+        :param dep: dependency relation to look for
+        :return: a tuple
+                    (token, descendant of token (None if leaf))
+                if dep is present, None otherwise
+        """
+        return self._found.get(dep)
+
+    def find_items(self, dep):
+        """
+        Searches all the tokens with given dependency relation, and their conjuncts
+        (e.g. "a pizza, french fries and a beer")
+        :param dep: dependency relation to look for
+        :return: list of tuples (token, text of the token with its modifiers), in sentence order
+        """
+        items = []
+        nodes = deque(self._deps.get(dep, ()))
+        while nodes:
+            node = nodes.popleft()
+            items.append((node, item_text(node)))
+            nodes.extend(child for child in node.children if child.dep_ == "conj")
+
+        items.sort(key=lambda item: item[0].i)
+        return items
+
+    def contains_text(self, word):
+        """
+        :param word: word
+        :return: whether the parsed sentence contains the given word
+        """
+        return word in self._texts
+
+    def contains_lemma(self, lemma):
+        """
+        :param lemma: lemma
+        :return: whether the parsed sentence contains a token with the given lemma
+        """
+        return lemma in self._lemmas
+
+    def is_question(self):
+        """
+        :return: whether the parsed sentence is a question
+        """
+        return any(t in self._texts for t in question_triggers)
+
+
 def contains_text(parsed, word):
     """
     Checks whether given parsed sentence contains given word
-    :param parsed: parsed sentence
+    :param parsed: parsed sentence (ParsedUtterance)
     :param word: word
     :return: bool
     """
 
-    # explore dependency tree of the parsed sentence breadth-first, returing
-    # if the word is found
-    nodes = [parsed.root]
-    while nodes:
-        node = nodes.pop(0)
-        if node.text == word:
-            return True
-
-        for child in node.children:
-            nodes.append(child)
-
-    return False
+    return parsed.contains_text(word)
 
 def find_dep(parsed, dep):
     """
     Searches a token with given dependency relation in the given dependency tree
-    :param parsed: dependency tree of parsed sentence
+    :param parsed: parsed sentence (ParsedUtterance)
     :param dep: dependency relation to look for
     :return: a tuple
                 (token, descendant of token (None if leaf))
             if dep is present in parsed, None otherwise
+            (see find_items for all the results)
     """
 
-    # TODO: return all results instead of first one
+    return parsed.find_dep(dep)
 
-    nodes = [parsed.root]
+def find_items(parsed, dep):
+    """
+    Searches all the tokens with given dependency relation in the given dependency tree,
+    and their conjuncts (e.g. "a pizza, french fries and a beer")
+    :param parsed: parsed sentence (ParsedUtterance)
+    :param dep: dependency relation to look for
+    :return: list of tuples (token, text of the token with its modifiers), in sentence order
+    """
+
+    return parsed.find_items(dep)
+
+def item_text(node):
+    """
+    Completes the text of the given node with its modifiers (e.g. "french fries", "onion rings")
+    :param node: the node to complete (spacy token or ParsedToken)
+    :return: text of the node and its modifiers, in sentence order
+    """
+
+    words = [node]
+    nodes = [node]
     while nodes:
-        node = nodes.pop(0)
-        if node.dep_ == dep:
-            return (node, find_compound(node))
+        for child in nodes.pop().children:
+            if child.dep_ in item_modifiers:
+                words.append(child)
+                nodes.append(child)
 
-        for child in node.children:
-            nodes.append(child)
+    return " ".join(word.text for word in sorted(words, key=lambda word: word.i))
 
-    return None
+def item_quantity(node):
+    """
+    Obtains the quantity of the given node from its numeric modifier (e.g. "two beers")
+    :param node: the node (spacy token or ParsedToken)
+    :return: quantity, 1 if not stated
+    """
+
+    for child in node.children:
+        if child.dep_ == "nummod":
+            word = child.text.lower()
+            if word.isdigit():
+                return int(word)
+            if word in number_words:
+                return number_words[word]
+
+    return 1
 
 def find_compound(node):
     """
     Completes the lemma in the given node by finding its compound term
     (descendant in the dependency tree)
-    :param node: the node to complete
+    :param node: the node to complete (spacy token or ParsedToken)
     :return: the compound term if present, None otherwise
     """
 
@@ -79,15 +620,14 @@ def find_compound(node):
         "advmod"        # adverbial modifier (e.g. "genetically modified")
     ]
 
-    nodes = [child for child in node.children]
+    nodes = deque(node.children)
     while nodes:
-        node = nodes.pop(0)
+        node = nodes.popleft()
 
         if node.dep_ in allowed_dependency_relations:
             return node
 
-        for child in node.children:
-            nodes.append(child)
+        nodes.extend(node.children)
 
     return None
 
@@ -146,14 +686,9 @@ def obtain_lemma(tokens):
 def is_question(parsed):
     """
     Checks if parsed sentence is a question
-    :param parsed: parsed sentence
+    :param parsed: parsed sentence (ParsedUtterance)
     :return: bool
     """
 
     # simply checks if parsed sentence contains question triggers
-    triggers = ["what", "how"]
-    for t in triggers:
-        if contains_text(parsed, t):
-            return True
-
-    return False
+    return parsed.is_question()
@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import json
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from bot import Bot
+from session import SessionManager
+from tracing import tracer
+from utils import build_server_argparser
+
+
+BOT_COLOR = 'cyan'
+
+
+class DialogueServer:
+    """
+    A class that serves many concurrent dialogues over a local socket endpoint.
+    Clients send one JSON object per line:
+        {"session": session id, "text": command}
+    and receive one JSON object per line:
+        {"session": session id, "replies": [reply, ...], "over": bool}
+    or {"error": message} if the request is malformed.
+
+    Attributes
+    ----------
+    _bot: Bot
+        bot conducting the dialogues
+    _sessions: SessionManager
+        dialogues served, keyed by session id
+    _parser: ThreadPoolExecutor
+        worker parsing the commands, so that the event loop is not blocked by the nlp pipeline
+    _eviction_interval: float
+        seconds between two evictions of idle sessions
+    """
+    def __init__(self, bot, idle_timeout=600, max_sessions=None, eviction_interval=30):
+        """
+        Constructor
+        :param bot: bot conducting the dialogues
+        :param idle_timeout: seconds of inactivity after which a session is evicted
+        :param max_sessions: maximum number of concurrent sessions (None if unbounded)
+        :param eviction_interval: seconds between two evictions of idle sessions
+        """
+        self._bot = bot
+        self._sessions = SessionManager(bot, idle_timeout=idle_timeout, max_sessions=max_sessions)
+        self._parser = ThreadPoolExecutor(max_workers=1)
+        self._eviction_interval = eviction_interval
+
+    async def serve(self, host, port):
+        """
+        Serves the dialogues until cancelled
+        :param host: address to listen on
+        :param port: port to listen on
+        :return: None
+        """
+        server = await asyncio.start_server(self._handle_client, host, port)
+        eviction = asyncio.ensure_future(self._evict_idle_sessions())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            eviction.cancel()
+            self._parser.shutdown(wait=False)
+
+    async def handle(self, request):
+        """
+        Handles a single request
+        :param request: dictionary {"session": session id, "text": command}
+        :return: response dictionary
+        """
+        session_id = request.get("session")
+        command = request.get("text")
+        # (session ids are dictionary keys, so only strings and integers are accepted)
+        if not isinstance(session_id, (str, int)) or isinstance(session_id, bool) or \
+                not isinstance(command, str) or len(command.strip()) == 0:
+            return {"error": "expected {\"session\": id, \"text\": command}"}
+
+        with tracer.turn():
+            # parsing is the expensive part, and does not touch the dialogue state
+            loop = asyncio.get_running_loop()
+            # (in a copy of the context of the request, so that parsing belongs to its turn)
+            parsed = await loop.run_in_executor(self._parser, contextvars.copy_context().run,
+                                                self._bot.parse, command)
+
+            # dialogue steps are short and run on the event loop, so they never interleave
+            replies, over = self._sessions.process(session_id, parsed)
+
+        return {"session": session_id, "replies": replies, "over": over}
+
+    async def _handle_client(self, reader, writer):
+        """
+        Handles a client connection, answering each request line
+        :param reader: stream reader of the connection
+        :param writer: stream writer of the connection
+        :return: None
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if len(line.strip()) == 0:
+                    continue
+
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = {"error": "invalid json"}
+                else:
+                    if isinstance(request, dict):
+                        try:
+                            response = await self.handle(request)
+                        except Exception as err:
+                            # a failing request must not end the connection (nor the other sessions)
+                            response = {"error": f"request failed: {err.__class__.__name__}"}
+                    else:
+                        response = {"error": "invalid request"}
+
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _evict_idle_sessions(self):
+        """
+        Periodically evicts the idle sessions
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self._eviction_interval)
+            self._sessions.evict_idle()
+
+
+if __name__ == '__main__':
+
+    # ignore warnings
+    warnings.simplefilter("ignore")
+
+    # parse command-line arguments
+    argparser = build_server_argparser()
+    args = argparser.parse_args()
+
+    # time the turns, if required
+    if args.trace_file is not None or args.metrics_port is not None:
+        tracer.enable(export_path=args.trace_file)
+        if args.metrics_port is not None:
+            tracer.serve_metrics(host=args.host, port=args.metrics_port)
+
+    # a single bot (menu and nlp pipeline) serves all the sessions
+    bot = Bot("Bot", color=BOT_COLOR, verbose=False, silent=True, keyboard=True,
+              menu_path=args.menu, model=args.model, profile=args.profile)
+    server = DialogueServer(bot, idle_timeout=args.idle_timeout, max_sessions=args.max_sessions)
+
+    print(f"Serving on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tracer.disable()
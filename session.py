@@ -0,0 +1,135 @@
+import time
+from collections import OrderedDict
+
+"""
+File with the handling of multiple concurrent dialogues (sessions) served by a single bot
+"""
+
+
+class DialogueState:
+    """
+    A class that holds the state of a single dialogue, i.e. everything the bot
+    needs to carry on the conversation with a user (the menu and the nlp pipeline
+    are shared among all dialogues)
+
+    Attributes
+    ----------
+    current_frame: Frame
+        current frame of the dialogue
+    frame_stack: list
+        frames of the dialogue still not finished to process
+    is_over: bool
+        whether the dialogue is over
+    last_active: float
+        monotonic time of the last command of the dialogue
+    """
+    __slots__ = ("current_frame", "frame_stack", "is_over", "last_active")
+
+    def __init__(self):
+        self.current_frame = None
+        self.frame_stack = []
+        self.is_over = False
+        self.last_active = time.monotonic()
+
+
+class SessionManager:
+    """
+    A class that keeps many concurrent dialogues, keyed by session id,
+    all served by the same bot
+
+    Attributes
+    ----------
+    _bot: Bot
+        bot conducting the dialogues (holding the shared menu and nlp pipeline)
+    _sessions: OrderedDict
+        {session id: DialogueState}, from the least to the most recently active
+    _idle_timeout: float
+        seconds of inactivity after which a session is evicted
+    _max_sessions: int
+        maximum number of sessions kept (None if unbounded)
+    """
+    def __init__(self, bot, idle_timeout=600, max_sessions=None):
+        """
+        Constructor
+        :param bot: bot conducting the dialogues
+        :param idle_timeout: seconds of inactivity after which a session is evicted
+        :param max_sessions: maximum number of sessions kept, the least recently
+        active sessions are evicted first (None if unbounded)
+        """
+        self._bot = bot
+        self._sessions = OrderedDict()
+        self._idle_timeout = idle_timeout
+        self._max_sessions = max_sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def open(self, session_id):
+        """
+        Opens a new session, replacing the old one with the same id if present
+        :param session_id: session id
+        :return: the replies opening the dialogue
+        """
+        state = DialogueState()
+        replies = self._bot.start_dialogue(state)
+        self._sessions[session_id] = state
+        self._sessions.move_to_end(session_id)
+
+        if self._max_sessions is not None:
+            while len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last=False)
+
+        return replies
+
+    def process(self, session_id, parsed):
+        """
+        Processes the given parsed command within the given session,
+        opening it if it does not exist yet
+        :param session_id: session id
+        :param parsed: parsed command (ParsedUtterance)
+        :return: a tuple (replies to the command, whether the dialogue is over)
+        """
+        replies = []
+        if session_id not in self._sessions:
+            replies.extend(self.open(session_id))
+
+        state = self._sessions[session_id]
+        state.last_active = time.monotonic()
+        self._sessions.move_to_end(session_id)
+
+        replies.extend(self._bot.collect_replies(parsed, state))
+
+        # a finished dialogue has nothing left to keep
+        if state.is_over:
+            del self._sessions[session_id]
+
+        return replies, state.is_over
+
+    def close(self, session_id):
+        """
+        Closes the given session
+        :param session_id: session id
+        :return: None
+        """
+        self._sessions.pop(session_id, None)
+
+    def evict_idle(self):
+        """
+        Evicts the sessions idle for longer than the idle timeout
+        :return: the number of evicted sessions
+        """
+        deadline = time.monotonic() - self._idle_timeout
+        evicted = 0
+
+        # sessions are ordered by activity, so stop at the first active one
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if state.last_active >= deadline:
+                break
+            del self._sessions[session_id]
+            evicted += 1
+
+        return evicted
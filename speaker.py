@@ -1,42 +1,356 @@
-import pyttsx3
 import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from exceptions import SpeechDispatcherError
+from ssip import SSIPClient, rate_from_wpm
+from tracing import traced
+from tts_cache import AudioCache
 
 
 WIN_EN = "HKEY_LOCAL_MACHINE\SOFTWARE\Microsoft\Speech\Voices\Tokens\TTS_MS_EN-US_ZIRA_11.0"
 
+# command line audio players, in order of preference
+PLAYERS = [
+    ["afplay"],         # macOS
+    ["paplay"],         # PulseAudio
+    ["aplay", "-q"]     # ALSA
+]
+
+
+def find_player():
+    """
+    Finds a way to play audio clips on this system
+    :return: "winsound" on Windows, the command of an available player otherwise
+    (None if there is none)
+    """
+    if os.name == "nt":
+        return "winsound"
+
+    for player in PLAYERS:
+        if shutil.which(player[0]) is not None:
+            return player
+
+    return None
+
+
+# item waking the worker up, to render the sentences waiting to be rendered into the cache
+_wake = object()
+
 
 class Speaker:
     """
-    A class that simply speaks sentences through the computer speakers
+    A class that simply speaks sentences through the computer speakers.
+    Sentences are spoken by a background worker, in order, so that the caller
+    does not need to wait for them to be over
+
+    Attributes
+    ----------
+    _queue: queue.Queue
+        bounded queue of the sentences waiting to be spoken, as tuples (sentence, future, generation)
+    _warming: deque
+        sentences waiting to be only rendered into the cache, with lower priority: the worker
+        renders them when nothing is waiting to be spoken, wait() does not wait for them
+        and cancel() does not drop them
+    _generation: int
+        incremented upon each cancellation, sentences queued before it are dropped
+    _speaking: int
+        generation of the sentence being spoken by pyttsx3 (None if not speaking)
+    _engine: pyttsx3.Engine
+        pyttsx3 engine, created and driven only by the worker, since engines are bound
+        to the thread that created them (None with spd)
+    _worker: threading.Thread
+        background worker speaking the queued sentences
+    _ssip: SSIPClient
+        connection to speech-dispatcher, when using spd
+        (None if unavailable, then falling back to spd-say)
+    _cache: AudioCache
+        cache of the synthesized sentences, played back instead of being synthesized again
+        (None if disabled)
+    _cacheable: set
+        sentences worth caching, the ones the cache was warmed with (see warm_cache):
+        the others are spoken directly, without being written to disk first
+    _interrupted: bool
+        whether the synthesis in progress has been stopped by a cancellation
+    _player:
+        how cached clips are played (see find_player)
+    _playback: subprocess.Popen
+        player process of the clip being played (None if not playing)
+    _spoken: deque
+        latest sentences spoken, as lists [sentence, monotonic time it ended (None if still speaking)]
     """
-    def __init__(self, rate=0, pitch=0, volume=0, spd=False):
+    def __init__(self, rate=0, pitch=0, volume=0, spd=False, queue_size=16,
+                 cache_dir=None, cache_size=256):
         """
         Constructor
         :param rate: rate of the voice
         :param pitch: pitch of the voice
         :param volume: volume of the voice
-        :param spd: if set, use ubuntu spd-say instead of pyttsx3
+        :param spd: if set, use ubuntu speech-dispatcher instead of pyttsx3
+        :param queue_size: maximum number of sentences waiting to be spoken
+        :param cache_dir: directory of the cache of synthesized sentences
+        (None to disable the cache, not supported with spd)
+        :param cache_size: maximum number of sentences in the cache
         """
 
         self._spd = spd
         self._rate = rate
         self._pitch = pitch
         self._volume = volume
+        self._ssip = None
+        self._engine = None
+        self._speaking = None
+        self._cache = None
+        self._player = None
+        self._playback = None
+        self._cacheable = set()
+        self._interrupted = False
 
-        if not self._spd:
-            self._engine = pyttsx3.init()
-            self._engine.setProperty('rate', rate)
-            self._engine.setProperty('pitch', float(pitch))
-            self._engine.setProperty('volume', float(volume))
+        if self._spd:
+            self._ssip = self._connect_ssip()
+        else:
+            # cached clips are useless if they cannot be played
+            self._player = find_player()
+            if cache_dir is not None and self._player is not None:
+                self._cache = AudioCache(cache_dir, max_entries=cache_size)
 
-            if os.name == "nt":
-                self._engine.setProperty("voice", WIN_EN)
-            else:
-                self._engine.setProperty("voice", "english")
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._warming = deque()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._spoken = deque(maxlen=16)
+
+        # the worker creates the pyttsx3 engine, failing here if it cannot
+        started = Future()
+        self._worker = threading.Thread(target=self._work, args=(started,), daemon=True)
+        self._worker.start()
+        started.result()
 
     def speak(self, sentence):
         """
-        Speaks the given sentence through the computer speakers
+        Speaks the given sentence through the computer speakers,
+        returning when it is over
+        :param sentence: sentence
+        :return: None
+        """
+
+        self.speak_async(sentence).result()
+
+    def speak_async(self, sentence):
+        """
+        Queues the given sentence to be spoken through the computer speakers.
+        Blocks only if the queue is full
+        :param sentence: sentence
+        :return: a concurrent.futures.Future, whose result is True when the sentence
+        has been spoken to the end and False if it was interrupted
+        (to be awaited within asyncio, wrap it with asyncio.wrap_future)
+        """
+        future = Future()
+        with self._lock:
+            generation = self._generation
+        self._queue.put((sentence, future, generation))
+        return future
+
+    def warm_cache(self, sentences):
+        """
+        Queues the given sentences to be synthesized into the cache (if enabled)
+        without being spoken, so that speaking them later skips synthesis.
+        They are synthesized only while nothing is waiting to be spoken.
+        Only these sentences are cached, the others are spoken directly
+        :param sentences: sentences (e.g. the replies the bot says over and over)
+        :return: None
+        """
+        if self._cache is None:
+            return
+
+        with self._lock:
+            self._cacheable.update(sentences)
+            self._warming.extend(sentences)
+
+        # wake the worker up, if idle (if the queue is full, it is busy and renders them afterwards)
+        try:
+            self._queue.put_nowait(_wake)
+        except queue.Full:
+            pass
+
+    def recently_spoken(self, window=1.0):
+        """
+        :param window: seconds after a sentence ended during which it may still be heard
+        (e.g. echoing in the room, or in the audio being recognized)
+        :return: list of the sentences being spoken, or ended less than window seconds ago
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [sentence for sentence, end in self._spoken if end is None or now - end < window]
+
+    def cache_stats(self):
+        """
+        :return: a dictionary with the statistics of the cache (None if disabled)
+        """
+        return self._cache.stats() if self._cache is not None else None
+
+    def cancel(self):
+        """
+        Stops the sentence being spoken and drops the queued ones
+        (e.g. when the user starts talking over the bot)
+        :return: None
+        """
+        with self._lock:
+            self._generation += 1
+
+        # drop queued sentences right away, the worker ignores any it already got
+        # (the sentences only to be rendered into the cache are kept)
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item is not _wake:
+                item[1].cancel()
+            elif item is None:
+                # closing: keep it for the worker
+                self._queue.task_done()
+                self._queue.put(None)
+                break
+            self._queue.task_done()
+
+        if self._spd:
+            self._cancel_spd()
+        elif self._cache is not None:
+            self._stop_playback()
+        # otherwise pyttsx3 is stopped by the worker itself, at the next word (see _on_word)
+
+    def wait(self):
+        """
+        Waits until all the queued sentences have been spoken
+        (not until the ones to be rendered into the cache have been rendered)
+        :return: None
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Waits for the queued sentences to be spoken, then stops the worker
+        :return: None
+        """
+        self._queue.put(None)
+        self._worker.join()
+
+        if self._ssip is not None:
+            self._ssip.close()
+            self._ssip = None
+
+    def _work(self, started):
+        """
+        Speaks the queued sentences, one at a time, until closed
+        :param started: future set once the worker is ready to speak
+        (with the exception raised if the pyttsx3 engine cannot be created)
+        :return: None
+        """
+        if not self._spd:
+            try:
+                self._engine = self._init_engine()
+            except Exception as err:
+                started.set_exception(err)
+                return
+        started.set_result(None)
+
+        while True:
+            try:
+                # speaking comes first, rendering into the cache only when idle
+                item = self._queue.get(block=len(self._warming) == 0)
+            except queue.Empty:
+                self._warm_next()
+                continue
+
+            if item is None:
+                self._queue.task_done()
+                return
+            if item is _wake:
+                self._queue.task_done()
+                continue
+
+            sentence, future, generation = item
+            try:
+                if generation != self._generation or not future.set_running_or_notify_cancel():
+                    # cancelled while waiting
+                    future.cancel()
+                    continue
+
+                try:
+                    spoken = [sentence, None]
+                    with self._lock:
+                        self._spoken.append(spoken)
+                    self._speaking = generation
+                    try:
+                        self._speak(sentence)
+                    finally:
+                        self._speaking = None
+                        spoken[1] = time.monotonic()
+                except Exception as err:
+                    future.set_exception(err)
+                else:
+                    # interrupted if a cancellation happened while speaking
+                    future.set_result(generation == self._generation)
+            finally:
+                self._queue.task_done()
+
+    def _warm_next(self):
+        """
+        Renders the next sentence waiting to be rendered into the cache
+        :return: None
+        """
+        with self._lock:
+            if len(self._warming) == 0:
+                return
+            sentence = self._warming.popleft()
+
+        try:
+            self._cached_clip(sentence)
+        except Exception:
+            # only a missed speed-up, the sentence is synthesized when spoken
+            pass
+
+    def _init_engine(self):
+        """
+        Creates the pyttsx3 engine, setting up the voice (on the worker thread)
+        :return: the engine
+        """
+        # pyttsx3 is imported only once it is used, so that speech-dispatcher (and silent)
+        # speakers do not need it
+        import pyttsx3
+        engine = pyttsx3.init()
+        engine.setProperty('rate', self._rate)
+        engine.setProperty('pitch', float(self._pitch))
+        engine.setProperty('volume', float(self._volume))
+
+        if os.name == "nt":
+            engine.setProperty("voice", WIN_EN)
+        else:
+            engine.setProperty("voice", "english")
+
+        engine.connect("started-word", self._on_word)
+        return engine
+
+    def _on_word(self, name, location, length):
+        """
+        Called by pyttsx3 on the worker thread at every word spoken,
+        stops the engine if the sentence being spoken has been cancelled
+        :return: None
+        """
+        if self._speaking is not None and self._speaking != self._generation:
+            self._interrupted = True
+            self._engine.stop()
+
+    @traced("tts.speak")
+    def _speak(self, sentence):
+        """
+        Speaks the given sentence with the selected backend, returning when it is over
         :param sentence: sentence
         :return: None
         """
@@ -46,30 +360,158 @@ class Speaker:
         else:
             self._speak_pyttsx3(sentence)
 
+    def _connect_ssip(self):
+        """
+        Connects to speech-dispatcher, setting up the voice
+        :return: the connection, None if speech-dispatcher is not available
+        """
+        try:
+            ssip = SSIPClient()
+        except (OSError, SpeechDispatcherError):
+            return None
+
+        try:
+            ssip.set_rate(rate_from_wpm(self._rate))
+            ssip.set_pitch(self._pitch)
+            ssip.set_volume(self._volume)
+        except (OSError, SpeechDispatcherError):
+            ssip.close()
+            return None
+
+        return ssip
+
     def _speak_spd(self, sentence):
         """
-        Speaks the given sentence through the computer speakers using spd (on Linux)
+        Speaks the given sentence through the computer speakers using spd (on Linux),
+        streaming it to the resident speech-dispatcher if connected,
+        through spd-say otherwise
         :param sentence: sentence
         :return: None
         """
         assert os.name == "posix"
-        os.system(
-            "spd-say \"{}\" "
-            "--rate {} "
-            "--pitch {} "
-            "--volume {}".format(
-                sentence,
-                self._rate,
-                self._pitch,
-                self._volume
-            )
-        )
+        if self._ssip is not None:
+            try:
+                message_id = self._ssip.speak(sentence)
+                if self._ssip.wait(message_id, timeout=self._speech_timeout(sentence)):
+                    return
+                # the end of the message was never notified: stop it, and fall back
+                # to spd-say from now on (the message is not spoken again)
+                ssip, self._ssip = self._ssip, None
+                try:
+                    ssip.cancel()
+                finally:
+                    ssip.close()
+                return
+            except (OSError, SpeechDispatcherError):
+                # connection lost, fall back to spd-say from now on
+                self._ssip = None
+
+        subprocess.run([
+            "spd-say",
+            "--wait",
+            "--rate", str(rate_from_wpm(self._rate)),
+            "--pitch", str(self._pitch),
+            "--volume", str(self._volume),
+            "--",
+            sentence
+        ])
+
+    def _speech_timeout(self, sentence):
+        """
+        :param sentence: sentence
+        :return: seconds the given sentence takes at most to be spoken, generously
+        """
+        words = max(1, len(sentence.split()))
+        return 5 + 3 * 60 * words / (self._rate or 175)
+
+    def _cancel_spd(self):
+        """
+        Stops the sentences being spoken using spd
+        :return: None
+        """
+        if self._ssip is not None:
+            try:
+                self._ssip.cancel()
+                return
+            except (OSError, SpeechDispatcherError):
+                self._ssip = None
+
+        subprocess.run(["spd-say", "--cancel"])
 
     def _speak_pyttsx3(self, sentence):
         """
-        Speaks the given sentence through the computer speakers using pyttsx3
+        Speaks the given sentence through the computer speakers using pyttsx3,
+        playing back its cached clip if the sentence is worth caching
         :param sentence: sentence
         :return: None
         """
+        if self._cache is not None and sentence in self._cacheable:
+            path = self._cached_clip(sentence)
+            # (unless cancelled while being synthesized)
+            if path is not None and self._speaking == self._generation:
+                self._play(path)
+            return
+
         self._engine.say(sentence)
-        self._engine.runAndWait()
\ No newline at end of file
+        self._engine.runAndWait()
+
+    def _cached_clip(self, sentence):
+        """
+        Obtains the clip of the given sentence from the cache,
+        synthesizing it only if not cached yet
+        :param sentence: sentence
+        :return: path of the clip, None if its synthesis was interrupted
+        """
+        key = AudioCache.key(sentence,
+                             rate=self._rate,
+                             pitch=self._pitch,
+                             volume=self._volume,
+                             voice=self._engine.getProperty("voice"))
+        path = self._cache.get(key)
+        if path is None:
+            path = self._cache.put(key, lambda p: self._render(sentence, p))
+        return path
+
+    def _render(self, sentence, path):
+        """
+        Synthesizes the given sentence into an audio file using pyttsx3
+        :param sentence: sentence
+        :param path: path of the audio file
+        :return: whether the clip is complete (False if a cancellation stopped the synthesis)
+        """
+        self._interrupted = False
+        self._engine.save_to_file(sentence, path)
+        self._engine.runAndWait()
+        return not self._interrupted
+
+    def _play(self, path):
+        """
+        Plays the given audio clip through the computer speakers, returning when it is over
+        :param path: path of the clip
+        :return: None
+        """
+        if self._player == "winsound":
+            import winsound
+            winsound.PlaySound(path, winsound.SND_FILENAME)
+            return
+
+        self._playback = subprocess.Popen(self._player + [path])
+        if self._speaking is not None and self._speaking != self._generation:
+            # cancelled just before the player started, so cancel() could not stop it
+            self._playback.terminate()
+        self._playback.wait()
+        self._playback = None
+
+    def _stop_playback(self):
+        """
+        Stops the clip being played
+        :return: None
+        """
+        if self._player == "winsound":
+            import winsound
+            winsound.PlaySound(None, 0)
+            return
+
+        playback = self._playback
+        if playback is not None:
+            playback.terminate()
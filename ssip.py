@@ -0,0 +1,248 @@
+import os
+import queue
+import socket
+import threading
+
+from exceptions import SpeechDispatcherError
+
+"""
+File with a minimal client of the Speech Synthesis Interface Protocol (SSIP),
+used to talk to a resident speech-dispatcher over a single connection
+"""
+
+
+# speech rate of the voices of speech-dispatcher at SSIP rate 0, in words per minute
+default_wpm = 175
+
+
+def rate_from_wpm(wpm):
+    """
+    Maps a speech rate in words per minute (as pyttsx3 takes it) onto the SSIP range:
+    0 is the default rate of the voice, -100 half of it and 100 three times it
+    :param wpm: words per minute (0 or None for the default rate)
+    :return: SSIP rate, in [-100, 100]
+    """
+    if not wpm:
+        return 0
+
+    ratio = wpm / default_wpm
+    rate = (ratio - 1) * 200 if ratio < 1 else (ratio - 1) * 50
+    return clamp(rate)
+
+
+def clamp(value):
+    """
+    :param value: value of a voice parameter
+    :return: the value as an integer in the SSIP range [-100, 100]
+    """
+    return max(-100, min(100, int(round(value))))
+
+
+def default_address():
+    """
+    Determines the address of the speech-dispatcher socket, honouring
+    the SPEECHD_ADDRESS environment variable as spd-say does
+    :return: a tuple ("unix_socket", path) or ("inet_socket", (host, port))
+    """
+    address = os.environ.get("SPEECHD_ADDRESS")
+    if address:
+        method, _, rest = address.partition(":")
+        if method == "inet_socket":
+            host, _, port = rest.rpartition(":")
+            return method, (host or "127.0.0.1", int(port or 6560))
+        if method == "unix_socket" and rest:
+            return method, rest
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        path = os.path.join(runtime_dir, "speech-dispatcher", "speechd.sock")
+    else:
+        path = os.path.expanduser(os.path.join("~", ".cache", "speech-dispatcher", "speechd.sock"))
+
+    return "unix_socket", path
+
+
+class SSIPClient:
+    """
+    A class that keeps a connection open to speech-dispatcher, so that every
+    sentence is streamed to the same resident synthesizer
+
+    Attributes
+    ----------
+    _socket: socket.socket
+        connection to speech-dispatcher
+    _responses: queue.Queue
+        responses to the commands sent, as tuples (code, lines)
+    _finished: dict
+        {message id: threading.Event set when the message is over (spoken or cancelled)}
+    _closed: bool
+        whether the connection has been lost
+    _command_lock: threading.Lock
+        lock serializing the commands (each command waits for its response)
+    _reader: threading.Thread
+        thread reading responses and events from the connection
+    """
+    def __init__(self, address=None, client_name="shri:bot", timeout=5):
+        """
+        Constructor, connects to speech-dispatcher
+        :param address: address of speech-dispatcher (see default_address),
+        the default one if None
+        :param client_name: name the client is registered with (application:component)
+        :param timeout: seconds to wait for a response before giving up
+        :raises: OSError if speech-dispatcher is not reachable,
+                 SpeechDispatcherError if it refuses the connection
+        """
+        method, target = address if address is not None else default_address()
+        family = socket.AF_UNIX if method == "unix_socket" else socket.AF_INET
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(target)
+        self._socket.settimeout(None)
+
+        self._timeout = timeout
+        self._responses = queue.Queue()
+        self._finished = dict()
+        self._finished_lock = threading.Lock()
+        self._closed = False
+        self._command_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+        user = os.environ.get("USER", "user")
+        self._command(f"SET self CLIENT_NAME {user}:{client_name}")
+        self._command("SET self NOTIFICATION end on")
+        self._command("SET self NOTIFICATION cancel on")
+
+    def set_rate(self, rate):
+        self._command(f"SET self RATE {clamp(rate)}")
+
+    def set_pitch(self, pitch):
+        self._command(f"SET self PITCH {clamp(pitch)}")
+
+    def set_volume(self, volume):
+        self._command(f"SET self VOLUME {clamp(volume)}")
+
+    def speak(self, text):
+        """
+        Sends the given text to be spoken
+        :param text: text
+        :return: id of the queued message
+        """
+        # lines starting with a dot are escaped, a single dot ends the data
+        lines = ["." + line if line.startswith(".") else line for line in text.splitlines()]
+        data = "\r\n".join(lines + ["."])
+
+        with self._command_lock:
+            self._send("SPEAK")
+            self._expect()
+            self._send(data)
+            _, lines = self._expect()
+
+        return lines[0]
+
+    def wait(self, message_id, timeout=60):
+        """
+        Waits until the given message has been spoken or cancelled
+        :param message_id: id of the message
+        :param timeout: seconds to wait at most, in case speech-dispatcher never
+        notifies the end of the message (None to wait indefinitely)
+        :return: whether the message is over (False if timed out)
+        """
+        over = self._finished_event(message_id).wait(timeout)
+        with self._finished_lock:
+            self._finished.pop(message_id, None)
+        return over
+
+    def cancel(self):
+        """
+        Stops the message being spoken and drops the queued ones
+        :return: None
+        """
+        self._command("CANCEL self")
+
+    def close(self):
+        """
+        Closes the connection
+        :return: None
+        """
+        try:
+            self._command("QUIT")
+        except (OSError, SpeechDispatcherError):
+            pass
+        finally:
+            self._socket.close()
+
+    def _command(self, command):
+        """
+        Sends the given command and waits for its response
+        :param command: command
+        :return: a tuple (code, lines) of the response
+        """
+        with self._command_lock:
+            self._send(command)
+            return self._expect()
+
+    def _send(self, line):
+        self._socket.sendall(f"{line}\r\n".encode("utf-8"))
+
+    def _expect(self):
+        """
+        Waits for the response to the last command sent
+        :raises: SpeechDispatcherError if the command failed or the connection was lost
+        :return: a tuple (code, lines) of the response
+        """
+        try:
+            code, lines = self._responses.get(timeout=self._timeout)
+        except queue.Empty:
+            raise SpeechDispatcherError("no response from speech-dispatcher")
+
+        if code is None:
+            raise SpeechDispatcherError("connection to speech-dispatcher lost")
+        if code >= 300:
+            raise SpeechDispatcherError(f"{code} {' '.join(lines)}")
+
+        return code, lines
+
+    def _finished_event(self, message_id):
+        with self._finished_lock:
+            if message_id not in self._finished:
+                self._finished[message_id] = threading.Event()
+                # nothing will be spoken on a lost connection
+                if self._closed:
+                    self._finished[message_id].set()
+            return self._finished[message_id]
+
+    def _read(self):
+        """
+        Reads the connection, dispatching responses to the commands
+        and notifications of messages over
+        :return: None
+        """
+        lines = []
+        with self._socket.makefile("rb") as stream:
+            try:
+                for raw in stream:
+                    line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+
+                    # "CODE-text" continues a reply, "CODE text" ends it
+                    lines.append(line[4:])
+                    if line[3:4] == "-":
+                        continue
+
+                    code = int(line[:3])
+                    if 700 <= code < 800:
+                        # notification: message id, client id, event
+                        if code in (702, 703):
+                            self._finished_event(lines[0]).set()
+                    else:
+                        self._responses.put((code, lines))
+                    lines = []
+            except (OSError, ValueError):
+                pass
+
+        # connection lost: wake up whoever is waiting
+        self._responses.put((None, []))
+        with self._finished_lock:
+            self._closed = True
+            for event in self._finished.values():
+                event.set()
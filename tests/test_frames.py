@@ -0,0 +1,139 @@
+import itertools
+import unittest
+
+from frames import AddInfoFrame, AskInfoFrame, EndFrame, Frame, OrderFrame, SlotLayout, TriggerTable, \
+    frame_triggers, intern_layout
+
+"""
+Tests of the frames, and of the table of their triggers
+"""
+
+
+# frames in order of priority, as checked one by one before the triggers were compiled
+baseline_frames = (EndFrame, OrderFrame, AddInfoFrame, AskInfoFrame)
+
+
+def baseline_count(pairs):
+    """
+    Counts the triggers of each frame asking each frame about each token
+    :param pairs: (dependency relation, lemma) of each token
+    :return: a dictionary {frame_name: triggers_count}
+    """
+    return {frame_class.__name__: sum(1 for dep, lemma in pairs if frame_class.is_trigger(lemma, dep))
+            for frame_class in baseline_frames}
+
+
+class TriggerTableTest(unittest.TestCase):
+
+    def test_register(self):
+        table = TriggerTable()
+        self.assertIs(table.register(OrderFrame), OrderFrame)
+        table.register(AddInfoFrame, weight=2)
+
+        self.assertIs(table.get_frame("OrderFrame"), OrderFrame)
+        self.assertIs(table.get_frame("AddInfoFrame"), AddInfoFrame)
+        self.assertIsNone(table.get_frame("EndFrame"))
+
+        # "like" triggers both frames, with the weight each was registered with
+        self.assertEqual(table.count([("ROOT", "like")]), {"OrderFrame": 1, "AddInfoFrame": 2})
+        self.assertEqual(table.count([("ROOT", "add"), ("xcomp", "add")]), {"OrderFrame": 0, "AddInfoFrame": 4})
+
+    def test_count(self):
+        self.assertEqual(list(frame_triggers.count([])), [frame_class.__name__ for frame_class in baseline_frames])
+        self.assertEqual(frame_triggers.count([("nsubj", "i"), ("ROOT", "want"), ("dobj", "pizza")]),
+                         {"EndFrame": 0, "OrderFrame": 1, "AddInfoFrame": 1, "AskInfoFrame": 0})
+        # the dependency relation matters, not only the lemma
+        self.assertEqual(frame_triggers.count([("dobj", "add")]),
+                         {"EndFrame": 0, "OrderFrame": 0, "AddInfoFrame": 0, "AskInfoFrame": 0})
+        # repeated triggers count as many times
+        self.assertEqual(frame_triggers.count([("ROOT", "shut"), ("prt", "down"), ("prt", "down")])["EndFrame"], 3)
+
+    def test_same_as_baseline(self):
+        # every trigger of every frame, and a few tokens triggering nothing
+        pairs = sorted({(dep, lemma) for frame_class in baseline_frames
+                        for dep, lemmas in frame_class.triggers.items() for lemma in lemmas})
+        pairs += [("ROOT", "be"), ("dobj", "pizza"), ("xcomp", "like")]
+
+        for size in range(4):
+            for combination in itertools.combinations(pairs, size):
+                expected = baseline_count(combination)
+                counts = frame_triggers.count(combination)
+                self.assertEqual(counts, expected)
+                # (the frame chosen, including ties, is the one chosen before)
+                self.assertEqual(max(counts, key=counts.get), max(expected, key=expected.get))
+
+
+class SlotLayoutTest(unittest.TestCase):
+
+    def test_masks_are_computed_lazily(self):
+        layout = SlotLayout(("a", "b", "c"))
+        self.assertEqual(len(layout), 3)
+        self.assertEqual(layout.index("c"), 2)
+        self.assertIsNone(layout.index("d"))
+        self.assertEqual(layout._filled, {})
+        self.assertEqual(layout._unfilled, {})
+
+        self.assertEqual(layout.filled(0b101), ("a", "c"))
+        self.assertEqual(layout.unfilled(0b101), ("b",))
+        self.assertEqual(list(layout._filled), [0b101])
+        self.assertEqual(list(layout._unfilled), [0b101])
+
+        # computed once per mask
+        self.assertIs(layout.filled(0b101), layout.filled(0b101))
+        self.assertEqual(layout.filled(0), ())
+        self.assertEqual(layout.unfilled(0b111), ())
+        self.assertEqual(sorted(layout._filled), [0, 0b101])
+
+    def test_layouts_are_interned(self):
+        self.assertIs(intern_layout(["x", "y"]), intern_layout(("x", "y")))
+        self.assertIsNot(intern_layout(("x", "y")), intern_layout(("y", "x")))
+        self.assertIs(OrderFrame.layout, intern_layout(OrderFrame.slot_names))
+        # frames with the same slots share the layout
+        self.assertIs(EndFrame.layout, Frame.layout)
+
+
+class FrameTest(unittest.TestCase):
+
+    def test_slots(self):
+        for frame_class in baseline_frames:
+            frame = frame_class()
+            self.assertFalse(hasattr(frame, "__dict__"))
+            self.assertEqual(frame.layout.get_names(), frame_class.slot_names)
+            with self.assertRaises(AttributeError):
+                frame.slot = None
+
+        self.assertEqual(AddInfoFrame.slot_names, ("subj", "obj", "info"))
+        self.assertIn("_asked_recap", OrderFrame.__slots__)
+
+    def test_fill_slot(self):
+        frame = AddInfoFrame()
+        self.assertEqual(frame.filled_slots(), ())
+        self.assertEqual(frame.unfilled_slots(), ("subj", "obj", "info"))
+
+        frame.fill_slot("info", "drink")
+        frame.fill_slot("subj", "menu")
+        self.assertEqual(frame.filled_slots(), ("subj", "info"))
+        self.assertEqual(frame.unfilled_slots(), ("obj",))
+        self.assertEqual(frame.get_slot("info"), "drink")
+        self.assertIsNone(frame.get_slot("obj"))
+
+        # emptying a slot
+        frame.fill_slot("subj", None)
+        self.assertEqual(frame.filled_slots(), ("info",))
+
+        with self.assertRaises(AssertionError):
+            frame.fill_slot("course", "drink")
+        with self.assertRaises(AssertionError):
+            frame.get_slot("course")
+
+    def test_order(self):
+        frame = OrderFrame()
+        frame.add_entry("drink", "beer")
+        frame.add_entry("drink", "beer", 2)
+        frame.add_entry("starter", "nachos")
+        self.assertEqual(frame.filled_slots(), ("starter", "drink"))
+        self.assertEqual(frame.get_slot("drink")["beer"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
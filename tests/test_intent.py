@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from intent import IntentClassifier, extract_features, no_intent
+except ImportError:
+    # numpy is only needed by the optional intent classifier
+    IntentClassifier = None
+    no_intent = "None"
+
+"""
+Tests of the statistical intent classifier
+"""
+
+
+orders = ["i would like a pizza", "i want a beer", "can i have the nachos", "i will take a coke",
+          "i would like to order", "i want two beers", "i will have the fish and chips", "i want a pizza please"]
+questions = ["what is on the menu", "what are the drinks", "tell me the menu", "what desserts do you have",
+             "what are the starters", "tell me the main courses", "what is there to drink", "what do you have"]
+ends = ["the bill please", "goodbye", "shut down", "can i have the bill", "bring me the bill",
+        "goodbye and thanks", "shut down please", "the bill"]
+others = ["hello there", "nice weather today", "hmm", "ok"]
+
+examples = [(text, "OrderFrame") for text in orders] + [(text, "AskInfoFrame") for text in questions] + \
+           [(text, "EndFrame") for text in ends] + [(text, no_intent) for text in others]
+
+
+def train(labelled, **kwargs):
+    """
+    :param labelled: list of tuples (text, intent)
+    :return: a classifier trained on the given utterances, long enough to be confident on so few
+    """
+    return IntentClassifier.train(labelled, n_features=2 ** 10, epochs=200, **kwargs)
+
+
+@unittest.skipIf(IntentClassifier is None, "numpy is not installed")
+class IntentClassifierTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.classifier = train(examples, validation_fraction=0)
+
+    def test_features(self):
+        self.assertEqual(extract_features("What is it?"), ["w=what", "w=is", "w=it", "b=what is", "b=is it", "f=what"])
+        self.assertEqual(extract_features("!"), [])
+
+    def test_fit_predict(self):
+        self.assertEqual(self.classifier.get_labels(), sorted(["OrderFrame", "AskInfoFrame", "EndFrame", no_intent]))
+        for text, intent in examples:
+            self.assertEqual(self.classifier.predict(text)[0], intent)
+
+        self.assertEqual(self.classifier.predict("i want a burger")[0], "OrderFrame")
+        self.assertEqual(self.classifier.predict("what are the desserts")[0], "AskInfoFrame")
+
+    def test_deterministic(self):
+        again = train(examples, validation_fraction=0)
+        texts = [text for text, _ in examples]
+        self.assertEqual(again.predict_batch(texts), self.classifier.predict_batch(texts))
+        self.assertEqual(self.classifier.predict_batch([]), [])
+
+    def test_threshold(self):
+        intent, confidence = self.classifier.predict("i would like a pizza")
+        classifier = train(examples, validation_fraction=0)
+        classifier.set_threshold(confidence + 1e-6)
+        self.assertEqual(classifier.predict("i would like a pizza"), (None, confidence))
+
+    def test_calibrate(self):
+        classifier = train(examples, validation_fraction=0)
+        classifier._calibrate(examples, target_accuracy=0.9)
+        self.assertGreater(classifier._temperature, 0)
+        self.assertGreaterEqual(classifier.get_threshold(), 0)
+        self.assertLessEqual(classifier.get_threshold(), 1)
+
+        # the trusted predictions reach the target accuracy
+        trusted = [(intent, predicted) for (_, intent), (predicted, _)
+                   in zip(examples, classifier.predict_batch([text for text, _ in examples]))
+                   if predicted is not None]
+        self.assertGreater(len(trusted), 0)
+        self.assertGreaterEqual(sum(intent == predicted for intent, predicted in trusted) / len(trusted), 0.9)
+
+    def test_calibrate_unknown_labels(self):
+        classifier = train(examples, validation_fraction=0)
+        classifier._calibrate([("i would like a pizza", "AddInfoFrame"), ("hello", "GreetFrame")], target_accuracy=0.9)
+        self.assertEqual(classifier._temperature, 1.0)
+        self.assertEqual(classifier.get_threshold(), 0.5)
+
+    def test_train_with_calibration(self):
+        classifier = train(examples * 2)
+        self.assertNotEqual((classifier._temperature, classifier.get_threshold()), (1.0, 0.5))
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "intent_model.json")
+            self.classifier.save(path)
+            loaded = IntentClassifier.load(path)
+            texts = [text for text, _ in examples]
+            for (intent, confidence), (expected, expected_confidence) in \
+                    zip(loaded.predict_batch(texts), self.classifier.predict_batch(texts)):
+                self.assertEqual(intent, expected)
+                self.assertAlmostEqual(confidence, expected_confidence, places=5)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+
+from matcher import MenuMatcher, ngrams, normalize, singularize
+from menus import Menu
+
+"""
+Tests of the approximate matching of what the user says against the menu entries
+"""
+
+
+class NormalizationTest(unittest.TestCase):
+
+    def test_singularize(self):
+        self.assertEqual(singularize("fries"), "fry")
+        self.assertEqual(singularize("potatoes"), "potato")
+        self.assertEqual(singularize("sandwiches"), "sandwich")
+        self.assertEqual(singularize("rings"), "ring")
+        # words that are not plurals, or too short to tell
+        for word in ("glass", "hummus", "tennis", "gas", "fish", "pie"):
+            self.assertEqual(singularize(word), word)
+
+    def test_normalize(self):
+        self.assertEqual(normalize("Some French Fries, please!"), ("french", "fry"))
+        self.assertEqual(normalize("a coke"), ("coke",))
+        self.assertEqual(normalize("the"), ())
+
+    def test_ngrams(self):
+        self.assertEqual(ngrams(("tea",)), {" te", "tea", "ea "})
+        self.assertEqual(ngrams(("a",)), {" a "})
+
+
+class MenuMatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.menu = Menu([
+            {"name": "french fries", "course": "side"},
+            {"name": "onion rings", "course": "side"},
+            {"name": "fish and chips", "course": "main course"},
+            {"name": "beer", "course": "drink", "aliases": ["lager", "pint"]},
+            {"name": "coke", "course": "drink"}
+        ])
+        self.matcher = MenuMatcher(self.menu)
+
+    def test_exact(self):
+        self.assertEqual(self.matcher.exact("the french fry"), "french fries")
+        self.assertEqual(self.matcher.exact("a pint"), "beer")
+        self.assertIsNone(self.matcher.exact("french"))
+
+    def test_match(self):
+        self.assertEqual(self.matcher.match("onion ring"), [("onion rings", 1.0)])
+        self.assertEqual(self.matcher.match("please"), [])
+
+        ranked = self.matcher.match("fish and ships")
+        self.assertEqual(ranked[0][0], "fish and chips")
+        self.assertEqual(ranked, sorted(ranked, key=lambda item: item[1], reverse=True))
+
+    def test_best_threshold(self):
+        # a small recognition error is tolerated
+        self.assertEqual(self.matcher.best("onion ringz"), "onion rings")
+        self.assertEqual(self.matcher.best("fish and ships"), "fish and chips")
+        # a word shared with an entry is not enough
+        score = dict(self.matcher.match("french toast"))["french fries"]
+        self.assertLess(score, 0.6)
+        self.assertIsNone(self.matcher.best("french toast"))
+        self.assertIsNone(self.matcher.best("pizza"))
+
+        # unless the threshold is lowered
+        self.assertEqual(MenuMatcher(self.menu, min_score=0.3).best("french toast"), "french fries")
+
+    def test_max_candidates(self):
+        menu = Menu([{"name": f"tea {i}", "course": "drink"} for i in range(20)])
+        for cap in (1, 5, 20):
+            matcher = MenuMatcher(menu, max_candidates=cap)
+            self.assertEqual(len(matcher.match("tee", limit=100)), cap)
+
+        # the rarest n-grams are looked up first, so the right entry is among the few scored
+        menu.add("green tea", "drink")
+        matcher = MenuMatcher(menu, max_candidates=1)
+        self.assertEqual([name for name, _ in matcher.match("green tee")], ["green tea"])
+        self.assertEqual(matcher.best("green tee"), "green tea")
+
+    def test_scan(self):
+        self.assertEqual(self.matcher.scan("i would like fish and chips please".split()), "fish and chips")
+        self.assertEqual(self.matcher.scan("two french fries and a coke".split()), "french fries")
+        self.assertEqual(self.matcher.scan("a pint".split()), "beer")
+        self.assertIsNone(self.matcher.scan("fish please".split()))
+        self.assertIsNone(self.matcher.scan([]))
+
+    def test_scan_prefers_the_longest_name(self):
+        self.menu.add("fish", "main course")
+        self.matcher.update(self.menu)
+        self.assertEqual(self.matcher.scan("fish and chips".split()), "fish and chips")
+        self.assertEqual(self.matcher.scan("just fish".split()), "fish")
+
+    def test_update(self):
+        self.menu.add("sparkling water", "drink")
+        self.assertFalse(self.matcher.is_current(self.menu))
+        self.assertIsNone(self.matcher.exact("sparkling water"))
+
+        self.assertTrue(self.matcher.update(self.menu))
+        self.assertTrue(self.matcher.is_current(self.menu))
+        self.assertEqual(self.matcher.exact("sparkling waters"), "sparkling water")
+        self.assertEqual(self.matcher.scan("a sparkling water please".split()), "sparkling water")
+        self.assertEqual(self.matcher.best("sparkling watter"), "sparkling water")
+
+        # the entries indexed before are still matched
+        self.assertEqual(self.matcher.exact("coke"), "coke")
+
+        # the course of an entry does not matter to the matcher
+        self.menu.set_course("coke", "soft drink")
+        self.assertTrue(self.matcher.update(self.menu))
+        self.assertTrue(self.matcher.is_current(self.menu))
+
+    def test_update_from_another_menu(self):
+        other = Menu(self.menu)
+        self.assertFalse(self.matcher.is_current(other))
+        self.assertFalse(self.matcher.update(other))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from menu_snapshot import MappedMenu, load_snapshot, write_snapshot
+from menus import Menu
+
+"""
+Tests of the binary snapshot format of the menu
+"""
+
+
+class MenuSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test_menu.bin")
+        self.menu = Menu([
+            {"name": "pizza", "course": "main course"},
+            {"name": "beer", "course": "drink", "aliases": ["lager", "pint"]},
+            {"name": "nachos", "course": "starter"},
+            {"name": "caffè", "course": None},
+            {"name": "coke", "course": "drink"},
+            {"name": "fish and chips", "course": "main course"}
+        ])
+        write_snapshot(self.menu, self.path, seq=7)
+        self.mapped = MappedMenu(self.path)
+
+    def tearDown(self):
+        self.mapped.close()
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.mapped), len(self.menu))
+        self.assertEqual(list(self.mapped), [dict(entry) for entry in self.menu])
+        self.assertEqual(self.mapped.to_dict(), self.menu.to_dict())
+        self.assertEqual(self.mapped.get_seq(), 7)
+
+    def test_lookups(self):
+        for entry in self.menu:
+            self.assertIn(entry["name"], self.mapped)
+            self.assertEqual(self.mapped.get(entry["name"]), dict(entry))
+        self.assertNotIn("pasta", self.mapped)
+        self.assertIsNone(self.mapped.get("pasta"))
+        self.assertIsNone(self.mapped.get(""))
+        self.assertEqual(self.mapped.get("beer")["aliases"], ["lager", "pint"])
+
+    def test_courses(self):
+        for course in ("main course", "drink", "starter", None, "dessert"):
+            self.assertEqual(self.mapped.names_for(course), self.menu.names_for(course))
+            self.assertEqual(self.mapped.entries_for(course),
+                             tuple(dict(entry) for entry in self.menu.entries_for(course)))
+
+    def test_to_menu(self):
+        menu = self.mapped.to_menu()
+        self.assertFalse(menu.is_read_only())
+        self.assertEqual(menu.get_seq(), 7)
+        menu.add("pasta", "main course")
+        self.assertEqual(menu.names_for("main course"), ("pizza", "fish and chips", "pasta"))
+        self.assertNotIn("pasta", self.mapped)
+
+    def test_load_snapshot(self):
+        menu, seq = load_snapshot(self.path)
+        try:
+            self.assertIsInstance(menu, MappedMenu)
+            self.assertEqual(seq, 7)
+        finally:
+            menu.close()
+
+    def test_empty_menu(self):
+        path = os.path.join(self.directory, "empty_menu.bin")
+        write_snapshot(Menu(), path)
+        mapped = MappedMenu(path)
+        try:
+            self.assertEqual(len(mapped), 0)
+            self.assertIsNone(mapped.get("pizza"))
+            self.assertEqual(mapped.names_for(None), ())
+        finally:
+            mapped.close()
+
+    def test_unknown_fields(self):
+        with self.assertRaises(ValueError):
+            write_snapshot([{"name": "pizza", "course": None, "price": 8}],
+                           os.path.join(self.directory, "price_menu.bin"))
+
+    def test_truncated(self):
+        with open(self.path, "rb") as file:
+            data = file.read()
+        for size in (0, 10, len(data) - 1):
+            path = os.path.join(self.directory, f"truncated{size}_menu.bin")
+            with open(path, "wb") as file:
+                file.write(data[:size])
+            with self.assertRaises(ValueError):
+                MappedMenu(path)
+
+    def test_not_a_snapshot(self):
+        path = os.path.join(self.directory, "json_menu.bin")
+        with open(path, "w") as file:
+            file.write('{"entries": []}' + " " * 64)
+        with self.assertRaises(ValueError):
+            MappedMenu(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
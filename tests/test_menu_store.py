@@ -0,0 +1,183 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from menu_snapshot import write_snapshot
+from menu_store import MenuStore, log_name, pointer_name
+from menus import Menu
+
+"""
+Tests of the persistence of the menu, in particular of the recovery from crashes
+"""
+
+
+class MenuStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, "20200101-000000_menu.json"), "w") as file:
+            json.dump({"entries": [{"name": "pizza", "course": "main course"},
+                                   {"name": "beer", "course": "drink"}]}, file)
+        self.store = MenuStore(self.directory, compact_every=1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _read(self, name):
+        with open(os.path.join(self.directory, name)) as file:
+            return file.read()
+
+    def test_save_and_load(self):
+        menu = self.store.load()
+        menu.add("nachos", "starter")
+        menu.add("tea")
+        menu.set_course("tea", "drink")
+        menu = self.store.save(menu)
+
+        self.assertEqual(menu.get_unsaved_changes(), [])
+        loaded = self.store.load()
+        self.assertEqual(len(loaded), 4)
+        self.assertEqual(loaded.get("tea")["course"], "drink")
+        self.assertEqual(loaded.get_seq(), 3)
+
+    def test_saved_changes_are_forgotten(self):
+        menu = self.store.load()
+        menu.add("nachos", "starter")
+        menu.add("tea")
+        menu.mark_saved(1)
+        self.assertEqual([change["name"] for change in menu.get_unsaved_changes()], ["tea"])
+        menu.mark_saved()
+        self.assertEqual(menu.get_unsaved_changes(), [])
+
+    def test_partial_last_line(self):
+        menu = self.store.load()
+        menu.add("nachos", "starter")
+        menu = self.store.save(menu)
+
+        # crash while appending
+        with open(os.path.join(self.directory, log_name), "a") as file:
+            file.write('{"op": "add", "na')
+
+        loaded = self.store.load()
+        self.assertEqual(len(loaded), 3)
+
+        # the partial line is ended, not continued
+        loaded.add("soup", "starter")
+        self.store.save(loaded)
+        self.assertEqual(len(self.store.load()), 4)
+        self.assertEqual(self.store.load().get("soup")["course"], "starter")
+        self.assertEqual(self.store.load().get_seq(), 2)
+
+    def test_crash_between_snapshot_and_pointer(self):
+        menu = self.store.load()
+        menu.add("nachos", "starter")
+        menu = self.store.save(menu)
+        pointer = self._read(pointer_name)
+
+        # compact, then put the old pointer and log back, as if it crashed right after the snapshot
+        log = self._read(log_name)
+        snapshot = self.store.compact()
+        with open(os.path.join(self.directory, pointer_name), "w") as file:
+            file.write(pointer)
+        with open(os.path.join(self.directory, log_name), "w") as file:
+            file.write(log)
+
+        loaded = self.store.load()
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(loaded.get_seq(), 1)
+
+        # the orphan snapshot does not get in the way of the next compaction
+        loaded.add("tea", "drink")
+        self.store.save(loaded)
+        self.assertNotEqual(self.store.compact(), pointer)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, snapshot)))
+        self.assertEqual(len(self.store.load()), 4)
+
+    def test_crash_between_pointer_and_log(self):
+        menu = self.store.load()
+        menu.add("nachos", "starter")
+        menu = self.store.save(menu)
+
+        # compact, then put the log back, as if it crashed before emptying it
+        log = self._read(log_name)
+        self.store.compact()
+        with open(os.path.join(self.directory, log_name), "w") as file:
+            file.write(log)
+
+        # the modifications already in the snapshot are skipped
+        loaded = self.store.load()
+        self.assertEqual(len(loaded), 3)
+        loaded.add("tea", "drink")
+        self.store.save(loaded)
+        self.assertEqual(len(self.store.load()), 4)
+
+    def test_stale_menu_is_rebased(self):
+        first = self.store.load()
+        second = self.store.load()
+
+        first.add("nachos", "starter")
+        first = self.store.save(first)
+
+        # the second menu does not know about nachos: its conflicting addition is dropped
+        second.add("nachos", "dessert")
+        second.add("tea", "drink")
+        second = self.store.save(second)
+
+        self.assertEqual(second.get("nachos")["course"], "starter")
+        self.assertIn("tea", second)
+        loaded = self.store.load()
+        self.assertEqual(len(loaded), 4)
+        self.assertEqual(loaded.get("nachos")["course"], "starter")
+
+    def test_binary_snapshot(self):
+        write_snapshot(self.store.load(), os.path.join(self.directory, "20200101-000000_menu.bin"))
+        with open(os.path.join(self.directory, pointer_name), "w") as file:
+            json.dump({"snapshot": "20200101-000000_menu.bin", "seq": 0}, file)
+
+        mapped = self.store.load()
+        self.assertTrue(mapped.is_read_only())
+        menu = mapped.to_menu()
+        mapped.close()
+        menu.add("tea", "drink")
+        self.store.save(menu)
+
+        # the modifications are replayed onto a copy of the mapped snapshot
+        loaded = self.store.load()
+        self.assertFalse(loaded.is_read_only())
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(loaded.get_seq(), 1)
+
+    def test_given_snapshot_is_rebased(self):
+        with open(os.path.join(self.directory, "20190101-000000_menu.json"), "w") as file:
+            json.dump({"entries": [{"name": "pizza", "course": "dessert"},
+                                   {"name": "nachos", "course": "starter"}]}, file)
+        menu = self.store.load()
+        menu.add("tea", "drink")
+        self.store.save(menu)
+
+        # the entries of the older snapshot are kept, but for the ones in conflict with the latest menu
+        older = self.store.load("20190101-000000_menu.json")
+        self.assertIsNone(older.get_seq())
+        self.assertEqual(len(older.get_unsaved_changes()), 2)
+        older = self.store.save(older)
+
+        self.assertEqual(older.get_unsaved_changes(), [])
+        loaded = self.store.load()
+        self.assertEqual(len(loaded), 4)
+        self.assertEqual(loaded.get("nachos")["course"], "starter")
+        self.assertEqual(loaded.get("pizza")["course"], "main course")
+        self.assertIn("tea", loaded)
+
+    def test_empty_menu_is_rebased(self):
+        menu = Menu()
+        menu.add("tea", "drink")
+        menu = self.store.save(menu)
+
+        self.assertIn("pizza", menu)
+        self.assertEqual(len(self.store.load()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+
+from exceptions import EntryAlreadyOnMenu, EntryNotOnMenu
+from menus import Menu
+
+"""
+Tests of the menu data structure, in particular of the index of the entries by course
+"""
+
+
+class MenuTest(unittest.TestCase):
+
+    def setUp(self):
+        self.menu = Menu([
+            {"name": "pizza", "course": "main course"},
+            {"name": "beer", "course": "drink"},
+            {"name": "nachos", "course": None},
+            {"name": "coke", "course": "drink"},
+            {"name": "pizza", "course": "dessert"}
+        ])
+
+    def test_first_entry_with_a_name_is_kept(self):
+        self.assertEqual(len(self.menu), 4)
+        self.assertEqual(self.menu.get("pizza")["course"], "main course")
+        self.assertEqual(self.menu.get_unsaved_changes(), [])
+
+    def test_add(self):
+        self.menu.add("water", "drink")
+        self.assertIn("water", self.menu)
+        self.assertEqual(self.menu.names_for("drink"), ("beer", "coke", "water"))
+        self.assertEqual([entry["name"] for entry in self.menu.entries_from(3)], ["coke", "water"])
+        with self.assertRaises(EntryAlreadyOnMenu):
+            self.menu.add("beer")
+
+    def test_set_course_keeps_menu_order(self):
+        # nachos comes before coke on the menu, so it is listed before it once a drink
+        self.menu.set_course("nachos", "drink")
+        self.assertEqual(self.menu.names_for("drink"), ("beer", "nachos", "coke"))
+        self.assertEqual(self.menu.names_for(None), ())
+        self.assertEqual([entry["name"] for entry in self.menu.entries_for("drink")], ["beer", "nachos", "coke"])
+
+        # and back, leaving the other courses as they were
+        self.menu.set_course("nachos", "starter")
+        self.assertEqual(self.menu.names_for("drink"), ("beer", "coke"))
+        self.assertEqual(self.menu.names_for("starter"), ("nachos",))
+        self.assertEqual(self.menu.names_for("main course"), ("pizza",))
+
+    def test_set_course_of_first_and_last(self):
+        self.menu.add("water")
+        self.menu.set_course("water", "main course")
+        self.menu.set_course("beer", "main course")
+        self.assertEqual(self.menu.names_for("main course"), ("pizza", "beer", "water"))
+        self.assertEqual(self.menu.names_for("drink"), ("coke",))
+
+    def test_listings_are_invalidated(self):
+        self.assertEqual(self.menu.names_for("drink"), ("beer", "coke"))
+        self.menu.add("water", "drink")
+        self.assertEqual(self.menu.names_for("drink"), ("beer", "coke", "water"))
+        self.menu.set_course("beer", "main course")
+        self.assertEqual(self.menu.names_for("drink"), ("coke", "water"))
+        self.assertEqual(self.menu.names_for("main course"), ("pizza", "beer"))
+
+    def test_set_course_errors_and_no_op(self):
+        with self.assertRaises(EntryNotOnMenu):
+            self.menu.set_course("pasta", "main course")
+
+        version = self.menu.get_version()
+        self.menu.set_course("beer", "drink")
+        self.assertEqual(self.menu.get_version(), version)
+        self.assertEqual(self.menu.get_unsaved_changes(), [])
+
+    def test_changes(self):
+        self.menu.add("water")
+        self.menu.set_course("water", "drink")
+        self.menu.add("cake", "dessert")
+        self.assertEqual(self.menu.get_unsaved_changes(), [
+            {"op": "add", "name": "water", "course": None},
+            {"op": "set_course", "name": "water", "course": "drink"},
+            {"op": "add", "name": "cake", "course": "dessert"}
+        ])
+
+        self.menu.mark_saved(2)
+        self.assertEqual(self.menu.get_unsaved_changes(), [{"op": "add", "name": "cake", "course": "dessert"}])
+        self.menu.mark_saved(1)
+        self.assertEqual(self.menu.get_unsaved_changes(), [])
+
+        self.menu.add("tea")
+        self.menu.mark_saved()
+        self.assertEqual(self.menu.get_unsaved_changes(), [])
+
+    def test_mark_unsaved(self):
+        self.menu.add("water")
+        self.menu.mark_saved()
+        self.menu.mark_unsaved()
+        self.assertEqual([(change["op"], change["name"]) for change in self.menu.get_unsaved_changes()],
+                         [("add", "pizza"), ("add", "beer"), ("add", "nachos"), ("add", "coke"), ("add", "water")])
+        self.assertEqual(self.menu.get_unsaved_changes()[1]["course"], "drink")
+
+        # replaying them builds the same menu
+        copy = Menu()
+        for change in self.menu.get_unsaved_changes():
+            copy.apply(change)
+        self.assertEqual(copy.to_dict(), self.menu.to_dict())
+
+    def test_apply(self):
+        copy = Menu(self.menu)
+        for change in [{"op": "add", "name": "water", "course": None},
+                       {"op": "set_course", "name": "water", "course": "drink"}]:
+            copy.apply(change)
+        self.assertEqual(copy.names_for("drink"), ("beer", "coke", "water"))
+        self.assertNotIn("water", self.menu)
+
+
+if __name__ == '__main__':
+    unittest.main()
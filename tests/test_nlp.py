@@ -0,0 +1,193 @@
+import unittest
+
+import nlp
+from nlp import IncrementalAnalysis, ParseCache, cache_key, default_profile, parse_cache, syntax_analysis
+
+"""
+Tests of the cache of parsed commands, with a stub pipeline in place of spacy
+"""
+
+
+stub_model = "stub_model"
+
+
+class StubToken:
+    """
+    Token of a stub parse: the first word is the root, the others depend on it
+    """
+    def __init__(self, doc, text, i):
+        self.doc = doc
+        self.text = text
+        self.lemma_ = text
+        self.pos_ = "X"
+        self.dep_ = "ROOT" if i == 0 else "dep"
+        self.i = i
+        self.is_sent_start = i == 0
+        self.n_lefts = 0
+        self.n_rights = len(doc.words) - 1 if i == 0 else 0
+
+    @property
+    def children(self):
+        return [self.doc[i] for i in range(1, len(self.doc))] if self.i == 0 else []
+
+
+class StubSpan:
+
+    def __init__(self, doc, start, end):
+        self.doc = doc
+        self.start = start
+        self.end = end
+        self.text = " ".join(doc.words[start:end])
+
+    def __iter__(self):
+        return (self.doc[i] for i in range(self.start, self.end))
+
+    @property
+    def root(self):
+        return self.doc[self.start]
+
+
+class StubDoc:
+
+    def __init__(self, text):
+        self.words = text.split()
+        self.tokens = [StubToken(self, word, i) for i, word in enumerate(self.words)]
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, end, _ = item.indices(len(self))
+            return StubSpan(self, start, end)
+        return self.tokens[item]
+
+
+class StubPipeline:
+    """
+    Pipeline counting the sentences it parses
+    """
+    def __init__(self):
+        self.parsed = []
+
+    def __call__(self, text):
+        self.parsed.append(text)
+        return StubDoc(text)
+
+
+class ParseCacheTest(unittest.TestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ParseCache(capacity=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+
+        # b is now the least recently used
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+        # storing a parse again marks it as recently used
+        cache.put("a", 1)
+        cache.put("d", 4)
+        self.assertIsNone(cache.get("c"))
+        self.assertEqual(list(cache._entries), ["a", "d"])
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (3, 2, 2))
+        self.assertEqual((stats["entries"], stats["capacity"]), (2, 2))
+        self.assertEqual(stats["hit_rate"], 3 / 5)
+
+    def test_set_capacity(self):
+        cache = ParseCache(capacity=3)
+        for key in "abc":
+            cache.put(key, key)
+        cache.set_capacity(1)
+        self.assertEqual(list(cache._entries), ["c"])
+        self.assertEqual(cache.stats()["evictions"], 2)
+
+        cache.clear()
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_capacity_zero(self):
+        cache = ParseCache(capacity=0)
+        cache.put("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertEqual(cache.stats()["hit_rate"], 0.0)
+
+        cache = ParseCache(capacity=2)
+        cache.put("a", 1)
+        cache.set_capacity(0)
+        cache.put("b", 2)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+class SyntaxAnalysisCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pipeline = StubPipeline()
+        nlp._pipelines[(stub_model, (), default_profile)] = self.pipeline
+        parse_cache.clear()
+
+    def tearDown(self):
+        del nlp._pipelines[(stub_model, (), default_profile)]
+        parse_cache.clear()
+
+    def _cached(self, sentence):
+        return cache_key(sentence, stub_model) in parse_cache._entries
+
+    def test_repeated_command(self):
+        parsed = syntax_analysis("i want  a pizza ", stub_model)
+        self.assertEqual(parsed.get_text(), "i want a pizza")
+        self.assertEqual(parsed.root.text, "i")
+        self.assertTrue(self._cached("i want a pizza"))
+
+        self.assertIs(syntax_analysis("i want a pizza", stub_model), parsed)
+        self.assertEqual(self.pipeline.parsed, ["i want a pizza"])
+
+        # the case changes the parse
+        syntax_analysis("I want a pizza", stub_model)
+        self.assertEqual(len(self.pipeline.parsed), 2)
+
+    def test_uncached_parse(self):
+        syntax_analysis("i want a beer", stub_model, cache=False)
+        self.assertFalse(self._cached("i want a beer"))
+
+        # nor is the cache looked up
+        syntax_analysis("i want a beer", stub_model)
+        syntax_analysis("i want a beer", stub_model, cache=False)
+        self.assertEqual(len(self.pipeline.parsed), 3)
+
+    def test_speculative_parses_are_not_cached(self):
+        analysis = IncrementalAnalysis(stub_model)
+        analysis.feed("i want")
+        analysis._latest[1].result()
+        analysis.feed("i want a")
+        analysis._latest[1].result()
+        self.assertEqual(self.pipeline.parsed, ["i want", "i want a"])
+        self.assertEqual(parse_cache.stats()["entries"], 0)
+
+        # the final transcription differs from the latest partial one
+        parsed = analysis.finish("i want a coke")
+        self.assertEqual(parsed.get_text(), "i want a coke")
+        self.assertFalse(self._cached("i want"))
+        self.assertFalse(self._cached("i want a"))
+        self.assertTrue(self._cached("i want a coke"))
+
+    def test_final_parse_is_cached(self):
+        analysis = IncrementalAnalysis(stub_model)
+        analysis.feed("i want a coke")
+        speculative = analysis._latest[1].result()
+        self.assertFalse(self._cached("i want a coke"))
+
+        # the speculative parse is reused, and only now stored
+        self.assertIs(analysis.finish("i want a coke"), speculative)
+        self.assertTrue(self._cached("i want a coke"))
+        self.assertEqual(self.pipeline.parsed, ["i want a coke"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import contextvars
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import Tracer, _null_span, _null_turn, summarize
+
+"""
+Tests of the instrumentation of the hot path
+"""
+
+
+class TracerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = Tracer(capacity=3)
+        self.tracer.enable()
+
+    def tearDown(self):
+        self.tracer.disable()
+
+    def test_disabled(self):
+        tracer = Tracer()
+        self.assertIs(tracer.span("nlp.parse"), _null_span)
+        self.assertIs(tracer.turn(), _null_span)
+        self.assertIs(tracer.start_turn(), _null_turn)
+        with tracer.span("nlp.parse"):
+            pass
+        self.assertEqual(tracer.get_spans(), [])
+
+    def test_ring_buffer(self):
+        for i in range(5):
+            self.tracer.record(f"span{i}", None, 0.0, i)
+        self.assertEqual([span[0] for span in self.tracer.get_spans()], ["span2", "span3", "span4"])
+
+        # a new capacity keeps the latest spans
+        self.tracer.enable(capacity=2)
+        self.assertEqual([span[0] for span in self.tracer.get_spans()], ["span3", "span4"])
+        self.tracer.record("span5", None, 0.0, 5)
+        self.assertEqual([span[0] for span in self.tracer.get_spans()], ["span4", "span5"])
+
+        # the totals count every span, not only the ones kept
+        self.assertIn('shri_span_seconds_count{span="span0"} 1', self.tracer.prometheus())
+
+    def test_turn_span(self):
+        with self.tracer.turn():
+            with self.tracer.span("nlp.parse"):
+                pass
+        with self.tracer.span("tts.speak"):
+            pass
+
+        spans = self.tracer.get_spans()
+        self.assertEqual([span[:2] for span in spans],
+                         [("nlp.parse", 1), ("turn", 1), ("tts.speak", None)])
+
+    def test_turn_across_threads(self):
+        turn = self.tracer.start_turn()
+
+        def parse():
+            with self.tracer.span("nlp.parse"):
+                return threading.current_thread().name
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="parser") as executor:
+            # submitted from the turn, in a copy of its context (as the server and the engine do)
+            future = turn.run(lambda: executor.submit(contextvars.copy_context().run, parse))
+            name = future.result()
+            # otherwise, the span belongs to no turn
+            executor.submit(parse).result()
+        turn.end()
+
+        self.assertTrue(name.startswith("parser"))
+        self.assertEqual([span[:2] for span in self.tracer.get_spans()],
+                         [("nlp.parse", 1), ("nlp.parse", None), ("turn", 1)])
+
+    def test_concurrent_turns(self):
+        first = self.tracer.start_turn()
+        second = self.tracer.start_turn()
+        barrier = threading.Barrier(2)
+
+        def work(name):
+            barrier.wait()
+            with self.tracer.span(name):
+                pass
+
+        threads = [threading.Thread(target=turn.run, args=(work, name))
+                   for turn, name in ((first, "first"), (second, "second"))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(span[:2] for span in self.tracer.get_spans()),
+                         [("first", 1), ("second", 2)])
+
+    def test_export(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "trace.jsonl")
+            tracer = Tracer()
+            tracer.enable(export_path=path)
+            tracer.record("nlp.parse", 1, 0.0, 0.002)
+            tracer.disable()
+
+            with open(path) as file:
+                record = json.loads(file.readline())
+            self.assertEqual((record["name"], record["turn"], record["duration_ms"]), ("nlp.parse", 1, 2.0))
+        finally:
+            shutil.rmtree(directory)
+
+
+class SummarizeTest(unittest.TestCase):
+
+    def test_percentiles(self):
+        spans = [("turn", i / 1000) for i in range(100, 0, -1)] + [("nlp.parse", 0.004)]
+        summaries = summarize(spans)
+
+        turn = summaries["turn"]
+        self.assertEqual(turn["count"], 100)
+        self.assertAlmostEqual(turn["mean_ms"], 50.5)
+        self.assertAlmostEqual(turn["p50_ms"], 51)
+        self.assertAlmostEqual(turn["p95_ms"], 96)
+        self.assertAlmostEqual(turn["p99_ms"], 100)
+        self.assertAlmostEqual(turn["max_ms"], 100)
+
+        # a single span is every percentile
+        parse = summaries["nlp.parse"]
+        self.assertEqual(parse["count"], 1)
+        for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"):
+            self.assertAlmostEqual(parse[key], 4)
+
+        self.assertEqual(summarize([]), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
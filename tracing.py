@@ -0,0 +1,406 @@
+import contextvars
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+"""
+File with the instrumentation of the hot path of the bot: spans timing listening,
+parsing, dialogue logic and speaking, kept in a ring buffer and optionally exported
+to a JSON lines file or served as Prometheus text. Tracing is disabled by default,
+and then costs a single attribute check per instrumented call
+"""
+
+
+# quantiles reported in the summaries
+quantiles = (0.5, 0.95, 0.99)
+
+# turn the spans started in the current context belong to
+_current_turn = contextvars.ContextVar("turn", default=None)
+
+
+class Span:
+    """
+    A class that represents a timed section of the hot path, used as a context manager
+
+    Attributes
+    ----------
+    _tracer: Tracer
+        tracer recording the span
+    _name: str
+        name of the span (e.g. "nlp.parse")
+    _turn: int
+        turn the span belongs to (None if unknown)
+    _start: float
+        monotonic time the span started at
+    """
+    __slots__ = ("_tracer", "_name", "_turn", "_start")
+
+    def __init__(self, tracer, name):
+        self._tracer = tracer
+        self._name = name
+        self._turn = None
+        self._start = None
+
+    def __enter__(self):
+        self._turn = _current_turn.get()
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._tracer.record(self._name, self._turn, self._start, time.monotonic() - self._start)
+        return False
+
+
+class TurnSpan(Span):
+    """
+    A span enclosing a whole turn of the dialogue: the spans started within it
+    (in the same thread or task) belong to the turn
+
+    Attributes
+    ----------
+    _token: contextvars.Token
+        token restoring the previous turn when the span is over
+    """
+    __slots__ = ("_token",)
+
+    def __enter__(self):
+        self._turn = self._tracer.next_turn()
+        self._token = _current_turn.set(self._turn)
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        _current_turn.reset(self._token)
+        return False
+
+
+class Turn:
+    """
+    A turn of the dialogue whose work spans several threads (e.g. captured on one,
+    parsed on another and processed on a third): the spans started by the functions
+    run in the turn belong to it, whatever the thread. It is timed from when it is
+    started until it is ended
+
+    Attributes
+    ----------
+    _tracer: Tracer
+        tracer recording the turn
+    _turn: int
+        number of the turn
+    _start: float
+        monotonic time the turn started at
+    _context: contextvars.Context
+        context the functions of the turn are run in
+    """
+    __slots__ = ("_tracer", "_turn", "_start", "_context")
+
+    def __init__(self, tracer):
+        self._tracer = tracer
+        self._turn = tracer.next_turn()
+        self._start = time.monotonic()
+        self._context = contextvars.copy_context()
+        self._context.run(_current_turn.set, self._turn)
+
+    def run(self, function, *args, **kwargs):
+        """
+        Runs the given function in the turn (a context can be entered by one thread at a time,
+        so each run gets its own copy of it)
+        :param function: function
+        :return: the result of the function
+        """
+        return self._context.copy().run(function, *args, **kwargs)
+
+    def end(self):
+        """
+        Records the turn, as over
+        :return: None
+        """
+        self._tracer.record("turn", self._turn, self._start, time.monotonic() - self._start)
+
+
+class _NullTurn:
+    """
+    The turn used when tracing is disabled, doing nothing
+    """
+    __slots__ = ()
+
+    def run(self, function, *args, **kwargs):
+        return function(*args, **kwargs)
+
+    def end(self):
+        pass
+
+
+_null_turn = _NullTurn()
+
+
+class _NullSpan:
+    """
+    The span used when tracing is disabled, doing nothing
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class Tracer:
+    """
+    A class that records the spans of the hot path in a ring buffer
+
+    Attributes
+    ----------
+    _enabled: bool
+        whether spans are recorded
+    _spans: deque
+        latest spans recorded, as tuples (name, turn, start, duration in seconds)
+    _totals: dict
+        {span name: [number of spans, total duration]} since tracing was enabled
+    _turns: int
+        number of turns started
+    _export: file
+        JSON lines file each span is written to as it is recorded (None if not exported)
+    _lock: threading.Lock
+        lock guarding the buffer, the totals and the export file
+    _server:
+        HTTP server of the Prometheus text endpoint (None if not serving)
+    """
+    def __init__(self, capacity=4096):
+        """
+        Constructor
+        :param capacity: maximum number of spans kept
+        """
+        self._enabled = False
+        self._spans = deque(maxlen=capacity)
+        self._totals = dict()
+        self._turns = 0
+        self._export = None
+        self._lock = threading.Lock()
+        self._server = None
+
+    def is_enabled(self):
+        return self._enabled
+
+    def enable(self, export_path=None, capacity=None):
+        """
+        Starts recording spans
+        :param export_path: path of the JSON lines file the spans are appended to
+        (None to keep them only in the ring buffer)
+        :param capacity: maximum number of spans kept (None to keep the current one)
+        :return: None
+        """
+        with self._lock:
+            if capacity is not None:
+                self._spans = deque(self._spans, maxlen=capacity)
+            if export_path is not None:
+                self._export = open(export_path, "a")
+            self._enabled = True
+
+    def disable(self):
+        """
+        Stops recording spans, closing the export file and the metrics endpoint
+        :return: None
+        """
+        with self._lock:
+            self._enabled = False
+            if self._export is not None:
+                self._export.close()
+                self._export = None
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def span(self, name):
+        """
+        :param name: name of the span
+        :return: a context manager timing the enclosed code as the given span
+        """
+        if not self._enabled:
+            return _null_span
+        return Span(self, name)
+
+    def turn(self):
+        """
+        :return: a context manager timing the enclosed code as a turn of the dialogue
+        """
+        if not self._enabled:
+            return _null_span
+        return TurnSpan(self, "turn")
+
+    def start_turn(self):
+        """
+        :return: a turn of the dialogue spanning several threads, ended explicitly (see Turn)
+        """
+        if not self._enabled:
+            return _null_turn
+        return Turn(self)
+
+    def next_turn(self):
+        with self._lock:
+            self._turns += 1
+            return self._turns
+
+    def record(self, name, turn, start, duration):
+        """
+        Records a span
+        :param name: name of the span
+        :param turn: turn the span belongs to (None if unknown)
+        :param start: monotonic time the span started at
+        :param duration: duration of the span, in seconds
+        :return: None
+        """
+        with self._lock:
+            self._spans.append((name, turn, start, duration))
+            totals = self._totals.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += duration
+            if self._export is not None:
+                self._export.write(json.dumps({"name": name, "turn": turn, "start": start,
+                                               "duration_ms": 1000 * duration}) + "\n")
+                self._export.flush()
+
+    def get_spans(self):
+        """
+        :return: list of the latest spans recorded, as tuples (name, turn, start, duration)
+        """
+        with self._lock:
+            return list(self._spans)
+
+    def summary(self):
+        """
+        :return: a dictionary {span name: summary (see summarize)} of the latest spans
+        """
+        return summarize((name, duration) for name, _, _, duration in self.get_spans())
+
+    def prometheus(self):
+        """
+        :return: the summaries of the spans in the Prometheus text exposition format
+        (quantiles over the latest spans, count and sum since tracing was enabled)
+        """
+        summaries = self.summary()
+        with self._lock:
+            totals = {name: tuple(values) for name, values in self._totals.items()}
+
+        lines = ["# HELP shri_span_seconds Duration of the instrumented sections of the bot",
+                 "# TYPE shri_span_seconds summary"]
+        for name in sorted(totals):
+            for q in quantiles:
+                value = summaries[name][f"p{int(q * 100)}_ms"] / 1000 if name in summaries else float("nan")
+                lines.append(f'shri_span_seconds{{span="{name}",quantile="{q}"}} {value}')
+            lines.append(f'shri_span_seconds_sum{{span="{name}"}} {totals[name][1]}')
+            lines.append(f'shri_span_seconds_count{{span="{name}"}} {totals[name][0]}')
+        return "\n".join(lines) + "\n"
+
+    def serve_metrics(self, host="127.0.0.1", port=9100):
+        """
+        Serves the Prometheus text of the spans over HTTP, on a background thread
+        :param host: address to listen on
+        :param port: port to listen on
+        :return: None
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = tracer.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+
+# process-wide tracer, shared by all the instrumented code
+tracer = Tracer()
+
+
+def traced(name):
+    """
+    Decorator instrumenting a function (or method) as a span
+    :param name: name of the span
+    :return: the decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer._enabled:
+                return function(*args, **kwargs)
+            with Span(tracer, name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def summarize(spans):
+    """
+    Summarizes the durations of the given spans by name
+    :param spans: iterable of tuples (name, duration in seconds)
+    :return: a dictionary {span name: {"count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"}}
+    """
+    durations = dict()
+    for name, duration in spans:
+        durations.setdefault(name, []).append(duration)
+
+    summaries = dict()
+    for name, values in durations.items():
+        values.sort()
+        summary = {"count": len(values), "mean_ms": 1000 * sum(values) / len(values)}
+        for q in quantiles:
+            summary[f"p{int(q * 100)}_ms"] = 1000 * values[min(len(values) - 1, int(q * len(values)))]
+        summary["max_ms"] = 1000 * values[-1]
+        summaries[name] = summary
+
+    return summaries
+
+
+def print_summary(summaries):
+    """
+    Prints the given summaries of the spans, the turns first
+    :param summaries: summaries of the spans (see summarize)
+    :return: None
+    """
+    from texttable import Texttable
+
+    t = Texttable(max_width=0)
+    t.set_cols_dtype(["t", "i", "f", "f", "f", "f", "f"])
+    t.add_rows([["span", "count", "mean (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)", "max (ms)"]] +
+               [[name, s["count"], s["mean_ms"], s["p50_ms"], s["p95_ms"], s["p99_ms"], s["max_ms"]]
+                for name, s in sorted(summaries.items(), key=lambda item: item[0] != "turn")])
+    print(t.draw())
+
+
+if __name__ == '__main__':
+    from utils import build_trace_argparser
+
+    args = build_trace_argparser().parse_args()
+
+    spans = []
+    for path in args.traces:
+        with open(path) as file:
+            for line in file:
+                if len(line.strip()) > 0:
+                    record = json.loads(line)
+                    spans.append((record["name"], record["duration_ms"] / 1000))
+
+    print_summary(summarize(spans))
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+"""
+File with the on-disk cache of synthesized sentences
+"""
+
+
+class AudioCache:
+    """
+    A class that represents a content-addressed on-disk cache of synthesized sentences,
+    evicting the least recently used clips when full
+
+    Attributes
+    ----------
+    _directory: str
+        directory where the clips are stored
+    _max_entries: int
+        maximum number of clips stored
+    _index: OrderedDict
+        {key: clip path}, from the least to the most recently used
+    _hits: int
+        number of lookups that found the clip
+    _misses: int
+        number of lookups that did not find the clip
+    """
+    def __init__(self, directory, max_entries=256, extension="wav"):
+        """
+        Constructor
+        :param directory: directory where the clips are stored (created if needed)
+        :param max_entries: maximum number of clips stored
+        :param extension: extension of the clip files
+        """
+        self._directory = directory
+        self._max_entries = max_entries
+        self._extension = extension
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+        # recover the clips of previous runs, the least recently used first
+        clips = [f for f in os.listdir(directory)
+                 if f.endswith(f".{extension}") and ".tmp." not in f]
+        paths = [os.path.join(directory, f) for f in clips]
+        paths.sort(key=os.path.getmtime)
+        self._index = OrderedDict((os.path.basename(p).split(".")[0], p) for p in paths)
+        self._evict()
+
+    @staticmethod
+    def key(sentence, **voice):
+        """
+        Computes the key of the clip of the given sentence spoken with the given voice
+        :param sentence: sentence
+        :param voice: voice properties (e.g. rate, pitch, volume)
+        :return: key (hex digest)
+        """
+        content = json.dumps([sentence, sorted(voice.items())])
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Searches the clip with the given key, marking it as recently used
+        :param key: key of the clip
+        :return: path of the clip, None if absent
+        """
+        with self._lock:
+            path = self._index.get(key)
+            if path is None or not os.path.exists(path):
+                self._index.pop(key, None)
+                self._misses += 1
+                return None
+
+            self._index.move_to_end(key)
+            self._hits += 1
+
+        # keep the recency across runs
+        os.utime(path)
+        return path
+
+    def put(self, key, render):
+        """
+        Stores the clip with the given key
+        :param key: key of the clip
+        :param render: function rendering the clip at the path it receives,
+        returning whether the clip is complete
+        :return: path of the clip, None if the clip is incomplete (not stored)
+        """
+        path = os.path.join(self._directory, f"{key}.{self._extension}")
+        tmp_path = os.path.join(self._directory, f"{key}.tmp.{self._extension}")
+
+        # render aside, so that a partial clip is never played nor stored
+        if not render(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._index[key] = path
+            self._index.move_to_end(key)
+            self._evict()
+
+        return path
+
+    def stats(self):
+        """
+        :return: a dictionary with the hit/miss counters and the number of clips stored
+        """
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "entries": len(self._index)}
+
+    def _evict(self):
+        """
+        Removes the least recently used clips exceeding the maximum number
+        :return: None
+        """
+        while len(self._index) > self._max_entries:
+            _, path = self._index.popitem(last=False)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -1,6 +1,4 @@
 import argparse
-from nltk import Tree
-from texttable import Texttable
 
 
 def build_argparser():
@@ -19,6 +17,219 @@ def build_argparser():
     parser.add_argument('--silent', action="store_true",
                         help='Bot replies only via command line (no text to speech)')
 
+    parser.add_argument('--model', default="en_core_web_sm",
+                        help='Name of the spaCy model used to parse commands')
+
+    parser.add_argument('--disable', nargs="*", default=[],
+                        help='Names of the spaCy pipeline components to disable')
+
+    parser.add_argument('--profile', choices=["full", "dialogue"], default="dialogue",
+                        help='spaCy pipeline profile: dialogue excludes the components '
+                             'the bot does not use (named entity recognition)')
+
+    parser.add_argument('--asr', choices=["google", "sphinx", "vosk", "transcript"], default=None,
+                        help='Speech recognition engine (default: google, or transcript '
+                             'when replaying recordings)')
+
+    parser.add_argument('--asr-model', default=None,
+                        help='Path of the model of the speech recognition engine (vosk)')
+
+    parser.add_argument('--replay', nargs="+", default=None,
+                        help='Audio files (or directories of audio files) to replay '
+                             'instead of listening from the microphone')
+
+    parser.add_argument('--streaming', action="store_true",
+                        help='Analyse commands while they are being transcribed '
+                             '(with a streaming speech recognition engine, e.g. vosk)')
+
+    parser.add_argument('--recalibration-interval', type=float, default=300,
+                        help='Seconds after which the microphone is calibrated again on the '
+                             'ambient noise, before the next command (default: 300, 0 to never '
+                             'recalibrate)')
+
+    parser.add_argument('--drift-ratio', type=float, default=0.5,
+                        help='Relative change of the energy threshold of the microphone, adjusted '
+                             'while listening, after which it is calibrated again (default: 0.5, '
+                             '0 to ignore drift)')
+
+    parser.add_argument('--intent-model', default=None,
+                        help='Path of the trained intent classifier (see intent.py) '
+                             'used before the frame triggers')
+
+    parser.add_argument('--log-utterances', default=None,
+                        help='Path of the file where commands are logged with the intention '
+                             'the bot determined, to be corrected by hand and train the intent classifier')
+
+    parser.add_argument('--trace', action="store_true",
+                        help='Time listening, parsing, dialogue logic and speaking of every turn, '
+                             'printing a summary at the end')
+
+    parser.add_argument('--trace-file', default=None,
+                        help='Path of the JSON lines file the timings are appended to (implies --trace)')
+
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Port serving the timings as Prometheus text (implies --trace)')
+
+    return parser
+
+def build_server_argparser():
+    """
+    Builds a parser for command-line arguments of the dialogue server
+    :return: an argparser
+    """
+    parser = argparse.ArgumentParser(description='Waiter Bot server')
+    parser.add_argument('--host', default="127.0.0.1",
+                        help='Address the server listens on')
+
+    parser.add_argument('--port', type=int, default=8765,
+                        help='Port the server listens on')
+
+    parser.add_argument('--menu', default=None,
+                        help='File name of the stored menu to load (in ./menu, *_menu.json or memory-mapped *_menu.bin)')
+
+    parser.add_argument('--idle-timeout', type=float, default=600,
+                        help='Seconds of inactivity after which a session is evicted')
+
+    parser.add_argument('--max-sessions', type=int, default=None,
+                        help='Maximum number of concurrent sessions')
+
+    parser.add_argument('--model', default="en_core_web_sm",
+                        help='Name of the spaCy model used to parse commands')
+
+    parser.add_argument('--profile', choices=["full", "dialogue"], default="dialogue",
+                        help='spaCy pipeline profile: dialogue excludes the components '
+                             'the bot does not use (named entity recognition)')
+
+    parser.add_argument('--trace-file', default=None,
+                        help='Path of the JSON lines file the timings of the turns are appended to')
+
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Port serving the timings of the turns as Prometheus text')
+
+    return parser
+
+def build_trace_argparser():
+    """
+    Builds a parser for command-line arguments of the summary of trace files
+    :return: an argparser
+    """
+    parser = argparse.ArgumentParser(description='Waiter Bot trace summary')
+    parser.add_argument('traces', nargs="+",
+                        help='JSON lines files of the timings (as written with --trace-file)')
+
+    return parser
+
+def build_intent_argparser():
+    """
+    Builds a parser for command-line arguments of the training of the intent classifier
+    :return: an argparser
+    """
+    parser = argparse.ArgumentParser(description='Waiter Bot intent classifier training')
+    parser.add_argument('logs', nargs="+",
+                        help='JSON lines files of the labelled commands '
+                             '({"text": command, "intent": frame name or "None"})')
+
+    parser.add_argument('--output', default="intent_model.json",
+                        help='Path where the trained classifier is stored')
+
+    parser.add_argument('--epochs', type=int, default=30,
+                        help='Number of passes over the commands')
+
+    parser.add_argument('--target-accuracy', type=float, default=0.9,
+                        help='Accuracy the trusted predictions should have on held-out commands, '
+                             'determining the confidence threshold')
+
+    return parser
+
+def build_intent_evaluation_argparser():
+    """
+    Builds a parser for command-line arguments of the evaluation of the intent classifier
+    :return: an argparser
+    """
+    parser = argparse.ArgumentParser(description='Waiter Bot intent classifier evaluation')
+    parser.add_argument('data', nargs="+",
+                        help='JSON lines files of the labelled commands to evaluate on')
+
+    parser.add_argument('--model', default=None,
+                        help='Path of the trained classifier (if None, one is trained '
+                             'on part of the commands and evaluated on the rest)')
+
+    parser.add_argument('--train-fraction', type=float, default=0.8,
+                        help='Fraction of the commands used for training, if no model is given')
+
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='Number of commands classified together when measuring batched latency')
+
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of times latency is measured (the best run is reported)')
+
+    return parser
+
+def build_pipeline_benchmark_argparser():
+    """
+    Builds a parser for command-line arguments of the benchmark of the spacy pipeline
+    :return: an argparser
+    """
+    parser = argparse.ArgumentParser(description='Waiter Bot spaCy pipeline benchmark')
+    parser.add_argument('--model', default="en_core_web_sm",
+                        help='Name of the spaCy model used to parse commands')
+
+    parser.add_argument('--commands', default=None,
+                        help='File of the commands to parse, one per line '
+                             '(default: a sample of typical commands)')
+
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='Number of times each command is parsed')
+
+    parser.add_argument('--output', default=None,
+                        help='Path of the JSON file where the results are stored')
+
+    return parser
+
+def build_dialogue_benchmark_argparser():
+    """
+    Builds a parser for command-line arguments of the benchmark of the dialogues
+    :return: an argparser
+    """
+    parser = argparse.ArgumentParser(description='Waiter Bot dialogue benchmark')
+    parser.add_argument('--model', default="en_core_web_sm",
+                        help='Name of the spaCy model used to parse commands')
+
+    parser.add_argument('--profile', choices=["full", "dialogue"], default="dialogue",
+                        help='spaCy pipeline profile')
+
+    parser.add_argument('--menu', default=None,
+                        help='File name of the stored menu to load (in ./menu, default: the latest)')
+
+    parser.add_argument('--conversations', nargs="+", default=None,
+                        help='Names of the scripted conversations to hold (default: all)')
+
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='Number of times each conversation is held')
+
+    parser.add_argument('--parse-cache-size', type=int, default=1024,
+                        help='Capacity of the cache of parsed commands (0 to disable it)')
+
+    parser.add_argument('--baseline', default=None,
+                        help='JSON file of the results of a previous run to compare with')
+
+    parser.add_argument('--output', default=None,
+                        help='Path of the JSON file where the results are stored')
+
+    return parser
+
+def build_menu_snapshot_argparser():
+    """
+    Builds a parser for command-line arguments of the conversion of menu snapshots
+    :return: an argparser
+    """
+    parser = argparse.ArgumentParser(description='Waiter Bot menu snapshot conversion')
+    parser.add_argument('source',
+                        help='Menu snapshot to convert: JSON (*_menu.json) to binary, or binary (*_menu.bin) to JSON')
+
+    parser.add_argument('destination', nargs='?', default=None,
+                        help='Path of the converted snapshot (default: the source with the other extension)')
+
     return parser
 
 def print_tokens_info(parsed):
@@ -28,6 +239,8 @@ def print_tokens_info(parsed):
     :param parsed: parsed sentence
     :return: None
     """
+    from texttable import Texttable
+
     t = Texttable()
     t.add_rows([["word", "lemma", "pos", "dep"]] +
                [[token.text, token.lemma_, token.pos_, token.dep_]
@@ -37,11 +250,14 @@ def print_tokens_info(parsed):
 
 """
 Functions to pretty print the dependency tree of a given parsed sentence
+(nltk is imported only when needed, i.e. in verbose mode)
 """
 def tok_format(tok):
     return f"{tok.text} ({tok.dep_})"
 
 def to_nltk_tree(node):
+    from nltk import Tree
+
     if node.n_lefts + node.n_rights > 0:
         return Tree(tok_format(node), [to_nltk_tree(child) for child in node.children])
     else: